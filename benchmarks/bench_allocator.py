@@ -0,0 +1,72 @@
+# Copyright (c) 2019 charlysan
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+r"""Benchmark of the UID allocators (allocations per second)
+
+Compares the in-memory UidAllocator with JournaledUidAllocator using different block sizes.
+A block size of 1 is equivalent to persisting (and fsync'ing) the counter on every write.
+
+Usage (with the library installed, or from the repo root with PYTHONPATH=.):
+    python benchmarks/bench_allocator.py [-n ALLOCATIONS] [--dir DIR]
+"""
+
+from __future__ import print_function
+import argparse
+import os
+import shutil
+import tempfile
+import timeit
+
+from rfidhid.allocator import UidAllocator, JournaledUidAllocator
+
+
+def bench(allocator, count):
+    elapsed = timeit.timeit(allocator.allocate, number=count)
+    return count / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="UID allocator benchmark")
+    parser.add_argument('-n', type=int, dest='count', default=20000,
+                        help="Allocations per run [default: %(default)d]")
+    parser.add_argument('--dir', type=str, dest='dir', default=None,
+                        help="Directory where journals are created (use the target disk) [default: system temp dir]")
+    args = parser.parse_args()
+
+    tmp_dir = tempfile.mkdtemp(dir=args.dir)
+    try:
+        print('%-28s %14s' % ('allocator', 'allocations/s'))
+        print('%-28s %14.0f' % ('memory', bench(UidAllocator(0), args.count)))
+
+        for block_size in (1, 10, 100, 1000):
+            path = os.path.join(tmp_dir, 'bench-%d.journal' % block_size)
+            allocator = JournaledUidAllocator(path, 0, block_size=block_size)
+            # fsync per allocation is slow: keep the run short
+            count = args.count if block_size > 1 else min(args.count, 500)
+            rate = bench(allocator, count)
+            allocator.close()
+            print('%-28s %14.0f' % ('journal (block_size=%d)' % block_size, rate))
+    finally:
+        shutil.rmtree(tmp_dir)
+
+
+if __name__ == "__main__":
+    main()
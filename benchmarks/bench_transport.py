@@ -0,0 +1,99 @@
+# Copyright (c) 2019 charlysan
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+r"""Benchmark of the USB transports polling N emulated readers (reads per second)
+
+Compares the blocking pyusb transport (usb_hid.HID, emulated by EmulatedHID) polling the readers
+one after the other or with one thread per reader, with the asynchronous libusb1 transport
+(usb_async.AsyncHID, emulated by EmulatedUsbContext) submitting the reads of all the readers at
+once and completing them on a single event loop thread. Every transfer takes --latency seconds.
+
+Usage (with the library installed, or from the repo root with PYTHONPATH=.):
+    python benchmarks/bench_transport.py [--readers 1 4 16 64] [--rounds ROUNDS] [--latency SECONDS]
+"""
+
+from __future__ import print_function
+import argparse
+import threading
+
+from rfidhid.compat import monotonic
+from rfidhid.core import RfidHid
+from rfidhid.emulator import EmulatedHID, EmulatedTag, EmulatedUsbContext
+from rfidhid.usb_async import AsyncHID, UsbEventLoop, read_tags
+
+
+def emulated_hids(readers, latency):
+    return [EmulatedHID(tag=EmulatedTag(index & 0xff, index), latency=latency) for index in range(readers)]
+
+
+def bench_sequential(readers, rounds, latency):
+    rfids = [RfidHid(hid=hid) for hid in emulated_hids(readers, latency)]
+    start = monotonic()
+    for _ in range(rounds):
+        for rfid in rfids:
+            rfid.read_tag()
+    return readers * rounds / (monotonic() - start)
+
+
+def bench_threads(readers, rounds, latency):
+    rfids = [RfidHid(hid=hid) for hid in emulated_hids(readers, latency)]
+
+    def poll(rfid):
+        for _ in range(rounds):
+            rfid.read_tag()
+
+    threads = [threading.Thread(target=poll, args=(rfid,)) for rfid in rfids]
+    start = monotonic()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return readers * rounds / (monotonic() - start)
+
+
+def bench_async(readers, rounds, latency):
+    context = EmulatedUsbContext()
+    with UsbEventLoop(context) as loop:
+        rfids = [RfidHid(hid=AsyncHID(context.open(hid), loop)) for hid in emulated_hids(readers, latency)]
+        start = monotonic()
+        for _ in range(rounds):
+            read_tags(rfids)
+        return readers * rounds / (monotonic() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="USB transport benchmark")
+    parser.add_argument('--readers', type=int, nargs='+', default=[1, 4, 16, 64],
+                        help="Number of readers of every run [default: 1 4 16 64]")
+    parser.add_argument('--rounds', type=int, default=50,
+                        help="Reads per reader [default: %(default)d]")
+    parser.add_argument('--latency', type=float, default=0.002,
+                        help="Seconds spent on every control transfer [default: %(default)s]")
+    args = parser.parse_args()
+
+    print('%-8s %16s %16s %16s' % ('readers', 'pyusb sequential', 'pyusb threads', 'libusb1 async'))
+    for readers in args.readers:
+        print('%-8d %16.0f %16.0f %16.0f' % (readers, bench_sequential(readers, args.rounds, args.latency),
+                                             bench_threads(readers, args.rounds, args.latency),
+                                             bench_async(readers, args.rounds, args.latency)))
+
+
+if __name__ == "__main__":
+    main()
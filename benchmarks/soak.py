@@ -0,0 +1,312 @@
+# Copyright (c) 2019 charlysan
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+r"""Soak and load test harness running the real library code against N emulated readers
+
+Every virtual reader (rfidhid.emulator.EmulatedHID) runs on its own thread and injects faults:
+USB errors, truncated responses, slow transfers (that may exceed --timeout), and tags appearing
+and disappearing from the field. Depending on --mode each thread runs:
+
+    read   -- RfidHid.read_tag() polls
+    write  -- RfidHid.write_tag_and_verify() on every new tag (unique UIDs)
+    cli    -- the `rfid_cli -r --loop` state machine (RfidCli.next())
+
+A report with p50/p95/p99 latency, throughput, errors, error recovery time and RSS is printed
+every --report-interval seconds, and at the end (or on SIGINT). No hardware is needed.
+
+Usage (with the library installed, or from the repo root with PYTHONPATH=.):
+    python benchmarks/soak.py --readers 8 --duration 259200 --usb-error-rate 0.001
+"""
+
+from __future__ import print_function
+import argparse
+import json
+import os
+import random
+import sys
+import threading
+from collections import Counter
+
+from rfidhid.core import RfidHid
+from rfidhid.compat import monotonic
+from rfidhid.allocator import UidAllocator
+from rfidhid.emulator import EmulatedHID, EmulatedTag, FaultInjector
+from rfidhid.memstats import rss_bytes
+from rfidhid.stats import LatencyHistogram
+
+
+class VirtualReader(object):
+    r"""Emulated reader with tag churn, plus the statistics of the thread driving it"""
+
+    def __init__(self, index, args, seed):
+        self.name = 'reader-%d' % index
+        self.random = random.Random(seed)
+        self.faults = FaultInjector(args.usb_error_rate, args.truncated_rate, args.slow_rate,
+                                    args.slow_latency, seed=seed)
+        self.hid = EmulatedHID(latency=args.latency, faults=self.faults)
+        self.rfid = RfidHid(hid=self.hid, timeout=args.timeout)
+        self.churn = args.churn
+        self.next_toggle = monotonic()
+
+        self.latency = {}
+        self.errors = Counter()
+        self.recovery = LatencyHistogram()
+        self.failing_since = None
+
+    def update_field(self):
+        r"""Tags arrive and depart after exponentially distributed dwell/absence times"""
+        now = monotonic()
+        if now < self.next_toggle:
+            return
+        if self.hid.tag is None:
+            self.hid.place(EmulatedTag(0, self.random.randrange(0x100000000)))
+        else:
+            self.hid.remove()
+        self.next_toggle = now + self.random.expovariate(1.0 / self.churn)
+
+    def record(self, operation, started):
+        now = monotonic()
+        self.latency.setdefault(operation, LatencyHistogram()).add(now - started)
+        if self.failing_since is not None:
+            self.recovery.add(now - self.failing_since)
+            self.failing_since = None
+
+    def record_error(self, error, started):
+        self.errors[type(error).__name__] += 1
+        if self.failing_since is None:
+            self.failing_since = started
+
+
+class SoakHarness(object):
+    # RSS samples kept for the JSON report: past this number every other one is dropped and the
+    # sampling stride doubles, so a 72 h soak does not grow the harness itself
+    MAX_RSS_SAMPLES = 1024
+
+    def __init__(self, args, out=sys.stdout):
+        self.args = args
+        self.out = out
+        self.stop = threading.Event()
+        self.readers = [VirtualReader(i, args, args.seed + i) for i in range(args.readers)]
+        self.allocator = UidAllocator(0)
+        self.rss_start = self.rss_current = self.rss_max = None
+        self.rss_samples = []
+        self._rss_seen = 0
+        self._rss_stride = 1
+        self.started = None
+
+    def run(self):
+        self.started = monotonic()
+        threads = [threading.Thread(target=self.drive, args=(reader,)) for reader in self.readers]
+        for thread in threads:
+            thread.daemon = True
+            thread.start()
+
+        try:
+            next_report = self.started + self.args.report_interval
+            while not self.stop.wait(min(self.args.sample_interval, max(self._remaining(), 0))):
+                self.sample_rss()
+                if self._remaining() <= 0:
+                    break
+                if monotonic() >= next_report:
+                    self.print_report(self.report())
+                    next_report += self.args.report_interval
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.stop.set()
+            for thread in threads:
+                thread.join()
+
+        return self.report()
+
+    def sample_rss(self):
+        rss = rss_bytes()
+        if self.rss_start is None:
+            self.rss_start = rss
+        self.rss_current = rss
+        self.rss_max = max(self.rss_max, rss) if self.rss_max is not None else rss
+
+        self._rss_seen += 1
+        if self._rss_seen % self._rss_stride == 0:
+            self.rss_samples.append((monotonic() - self.started, rss))
+            if len(self.rss_samples) >= self.MAX_RSS_SAMPLES:
+                del self.rss_samples[1::2]
+                self._rss_stride *= 2
+
+    def drive(self, reader):
+        if self.args.mode == 'cli':
+            return self.drive_cli(reader)
+
+        written = None
+        while not self.stop.is_set():
+            reader.update_field()
+            started = monotonic()
+            try:
+                payload_response = reader.rfid.read_tag()
+                reader.record('read', started)
+
+                tag = (payload_response.get_tag_cid(), payload_response.get_tag_uid())
+                if self.args.mode == 'write' and payload_response.has_id_data() and tag != written:
+                    written = (12, self.allocator.allocate())
+                    started = monotonic()
+                    if reader.rfid.write_tag_and_verify(written[0], written[1], verify_delay=self.args.verify_delay):
+                        reader.record('write_verify', started)
+                    else:
+                        reader.errors['VerifyError'] += 1
+            except Exception as e:
+                reader.record_error(e, started)
+
+            self.stop.wait(self.args.interval)
+
+    def drive_cli(self, reader):
+        # imported here: the harness does not need the cli package in library modes
+        from cli.rfid_cli import RfidCli
+
+        argv = ['-r', '--loop', '--single', '--read-delay', str(self.args.interval)]
+        rfid_cli = RfidCli(argv, rfid=reader.rfid)
+        while not self.stop.is_set():
+            reader.update_field()
+            started = monotonic()
+            try:
+                rfid_cli.next()
+                reader.record('cli_next', started)
+            except Exception as e:
+                reader.record_error(e, started)
+
+    def report(self):
+        elapsed = monotonic() - self.started
+        latency = {}
+        errors = Counter()
+        injected = Counter()
+        recovery = LatencyHistogram()
+
+        for reader in self.readers:
+            for operation, histogram in list(reader.latency.items()):
+                latency.setdefault(operation, LatencyHistogram()).merge(histogram)
+            errors.update(reader.errors)
+            injected.update(reader.faults.injected)
+            recovery.merge(reader.recovery)
+
+        operations = {}
+        for operation, histogram in latency.items():
+            operations[operation] = dict(histogram.summary(), throughput=histogram.count / elapsed)
+
+        return {
+            'elapsed': elapsed,
+            'readers': len(self.readers),
+            'operations': operations,
+            'errors': dict(errors),
+            'injected_faults': dict(injected),
+            'recovery': recovery.summary(),
+            'rss': {
+                'start': self.rss_start,
+                'current': self.rss_current,
+                'max': self.rss_max,
+                'samples': list(self.rss_samples) if self.args.json else [],
+            },
+        }
+
+    def print_report(self, report):
+        if self.args.json:
+            return
+
+        out = self.out
+        out.write('--- %.0fs, %d readers\n' % (report['elapsed'], report['readers']))
+        for operation, summary in sorted(report['operations'].items()):
+            out.write('%-13s %9d ops %9.1f ops/s  p50 %s  p95 %s  p99 %s  max %s\n' % (
+                operation, summary['count'], summary['throughput'], _ms(summary['p50']), _ms(summary['p95']),
+                _ms(summary['p99']), _ms(summary['max'])))
+        out.write('errors        %s (injected %s)\n' % (
+            _counts(report['errors']), _counts(report['injected_faults'])))
+        out.write('recovery      %d  p50 %s  p99 %s  max %s\n' % (
+            report['recovery']['count'], _ms(report['recovery']['p50']), _ms(report['recovery']['p99']),
+            _ms(report['recovery']['max'])))
+        rss = report['rss']
+        if rss['current'] is not None:
+            out.write('rss           %.1f MB (start %.1f MB, max %.1f MB)\n' % (
+                rss['current'] / 1e6, rss['start'] / 1e6, rss['max'] / 1e6))
+        out.flush()
+
+    def _remaining(self):
+        return self.started + self.args.duration - monotonic()
+
+
+def _ms(seconds):
+    return '-' if seconds is None else '%.2fms' % (seconds * 1000)
+
+
+def _counts(counter):
+    return ', '.join('%s=%d' % item for item in sorted(counter.items())) or 'none'
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description="Soak/load test of pyrfidhid against emulated readers")
+    parser.add_argument('--readers', type=int, default=4, help="Number of virtual readers [default: %(default)d]")
+    parser.add_argument('--duration', type=float, default=60, help="Seconds to run [default: %(default)s]")
+    parser.add_argument('--mode', choices=['read', 'write', 'cli'], default='read',
+                        help="Code path exercised by every reader [default: %(default)s]")
+    parser.add_argument('--interval', type=float, default=0.0,
+                        help="Seconds between polls of each reader [default: %(default)s]")
+    parser.add_argument('--latency', type=float, default=0.002,
+                        help="Emulated USB transfer latency in seconds [default: %(default)s]")
+    parser.add_argument('--timeout', type=float, default=0.1,
+                        help="USB transfer timeout in seconds [default: %(default)s]")
+    parser.add_argument('--verify-delay', type=float, default=0.0,
+                        help="Seconds between write and verify [default: %(default)s]")
+    parser.add_argument('--usb-error-rate', type=float, default=0.001,
+                        help="Probability of a USBError per transfer [default: %(default)s]")
+    parser.add_argument('--truncated-rate', type=float, default=0.001,
+                        help="Probability of a truncated response per GET_REPORT [default: %(default)s]")
+    parser.add_argument('--slow-rate', type=float, default=0.001,
+                        help="Probability of a slow transfer [default: %(default)s]")
+    parser.add_argument('--slow-latency', type=float, default=0.2,
+                        help="Extra seconds of a slow transfer [default: %(default)s]")
+    parser.add_argument('--churn', type=float, default=1.0,
+                        help="Mean seconds a tag stays in (or out of) the field [default: %(default)s]")
+    parser.add_argument('--report-interval', type=float, default=60,
+                        help="Seconds between reports [default: %(default)s]")
+    parser.add_argument('--sample-interval', type=float, default=1,
+                        help="Seconds between RSS samples [default: %(default)s]")
+    parser.add_argument('--seed', type=int, default=0, help="Random seed [default: %(default)s]")
+    parser.add_argument('--json', action='store_true', help="Print the final report as JSON")
+
+    return parser.parse_args()
+
+
+def main():
+    args = parse_arguments()
+    out = sys.stdout
+
+    if args.mode == 'cli':
+        # RfidCli prints every new tag: keep stdout for the reports
+        sys.stdout = open(os.devnull, 'w')
+
+    harness = SoakHarness(args, out)
+    report = harness.run()
+
+    if args.json:
+        out.write(json.dumps(report, indent=2, sort_keys=True) + '\n')
+    else:
+        harness.print_report(report)
+
+
+if __name__ == "__main__":
+    main()
@@ -20,14 +20,29 @@
 
 from __future__ import print_function
 import argparse
+import json
+import platform
 import sys
 import struct
 import signal
 
-from time import sleep
 from rfidhid.core import RfidHid
 from rfidhid.core import PayloadResponse
+from rfidhid.allocator import UidAllocator, JournaledUidAllocator
+from rfidhid.encoder import EncodingLine
+from rfidhid.clone import BulkCloner, CloneStation
+from rfidhid.sink import SqliteSink, SinkGroup
+from rfidhid.forwarder import HttpForwarder
+from rfidhid.dedupe import parse_dedupe
+from rfidhid.stats import Profiler
+from rfidhid.memstats import MemoryTracker
+from rfidhid.jobs import JobRunner, JobConfig, VerifyError
+from rfidhid.bench import HardwareBench
+from rfidhid.tagtype import TagTypeDetector
+from rfidhid.compat import monotonic, input
+from rfidhid.deadline import Deadline, CancellationToken, RfidTimeoutError, OperationCancelledError, wait
 from ast import literal_eval as make_tuple
+from collections import OrderedDict
 from transitions import Machine
 
 
@@ -36,14 +51,68 @@ class RfidCli(object):
     states = ['start', 'init', 'read', 'print',
               'write', 'clone', 'verify', 'exit']
     rfid = None
+    writer = None
+    allocator = None
+    sink = None
+    dedupe = None
+    profiler = None
+    memstats = None
+    deadline = None
     machine = None
     payload_response_temp = None
-
-    def __init__(self):
-        self.args = self.parse_arguments()
+    skipped_tag = None
+    written_tag = None
+    write_result = None
+    writes = 0
+    skipped_writes = 0
+
+    WRITTEN_CACHE_SIZE = 1024
+    VERSION = 'v1.1.4 (Nov 14th, 2020)'
+    TAG_TYPE_NAMES = {RfidHid.TAG_EM4305: 'EM4305', RfidHid.TAG_T5577: 'T5577'}
+
+    def __init__(self, argv=None, rfid=None, writer=None):
+        r"""Arguments:
+        argv -- Command line arguments (defaults to sys.argv)
+        rfid -- Already opened RfidHid object to be used instead of connecting to the device
+        writer -- Already opened RfidHid object used as the writer in pipeline clone mode
+        """
+        self.args = self.parse_arguments(argv)
         self.tag_type = RfidHid.TAG_T5577 if self.args.t5577 else RfidHid.TAG_EM4305
+        self.cancel = CancellationToken()
+
+        sinks = []
+        if self.args.db:
+            sinks.append(SqliteSink(self.args.db))
+        if self.args.forward:
+            sinks.append(HttpForwarder(self.args.forward, spool_dir=self.args.spool))
+        if sinks:
+            self.sink = sinks[0] if len(sinks) == 1 else SinkGroup(*sinks)
+
+        if rfid is not None:
+            self.rfid = rfid
+            if self.sink is not None:
+                self.rfid.sink = self.sink
+        elif self.args.stations:
+            self.rfids = self.connect_all(
+                self.args.usb_vid, self.args.usb_pid, self.args.stations)
+        else:
+            self.rfid = self.connect(self.args.usb_vid, self.args.usb_pid)
+
+        if self.args.pipeline:
+            self.writer = writer if writer is not None else self.connect_writer(self.args.usb_vid, self.args.usb_pid)
+
+        if self.args.deadline:
+            self.deadline = Deadline(self.args.deadline)
 
-        self.rfid = self.connect(self.args.usb_vid, self.args.usb_pid)
+        self.jobs = JobRunner(self.rfid, self.cancel, rewrite_window=self.args.rewrite_window,
+                              written_cache_size=self.WRITTEN_CACHE_SIZE)
+        self.written_cache = self.jobs.written_cache
+
+        if self.args.uid_journal:
+            self.allocator = JournaledUidAllocator(
+                self.args.uid_journal, self.w_uid, step=max(self.args.auto_increment, 1))
+            if not self.args.stations:
+                self.w_uid = self.allocator.allocate()
 
         self.machine = Machine(
             model=self, states=self.states, initial='start', send_event=True)
@@ -54,6 +123,10 @@ class RfidCli(object):
         self.machine.add_transition(
             trigger='next', source='init', dest='exit', after='exit')
 
+        # Benchmark
+        self.machine.add_transition(
+            trigger='next', source='start', dest='exit', after=['run_bench', 'exit'], conditions=['is_bench'])
+
         # Read Tag
         self.machine.add_transition(
             trigger='next', source='start', dest='read', after='read', conditions=['is_read'])
@@ -64,13 +137,21 @@ class RfidCli(object):
         self.machine.add_transition(
             trigger='next', source='print', dest='read', before='sleep', after=['read'], conditions=['is_read', 'is_loop'])
 
+        # Write Tag (multi-station)
+        self.machine.add_transition(
+            trigger='next', source='start', dest='exit', after=['run_stations', 'exit'], conditions=['is_write', 'is_stations'])
+
         # Write Tag
         self.machine.add_transition(
             trigger='next', source='start', dest='write', after='write', conditions=['is_write'], unless=['is_read_before_write'])
         self.machine.add_transition(
             trigger='next', source='start', dest='read', after='read', conditions=['is_write', 'is_read_before_write'])
         self.machine.add_transition(
-            trigger='next', source='read', dest='write', before='sleep', after='write', conditions=['is_write', 'is_read_before_write', 'has_id_data'])
+            trigger='next', source='read', dest='exit', after=['skip', 'exit'], conditions=['is_write', 'is_read_before_write', 'has_id_data', 'is_already_written'], unless=['is_loop'])
+        self.machine.add_transition(
+            trigger='next', source='read', dest='read', before='sleep', after=['skip', 'read'], conditions=['is_write', 'is_read_before_write', 'has_id_data', 'is_already_written', 'is_loop'])
+        self.machine.add_transition(
+            trigger='next', source='read', dest='write', before='sleep', after='write', conditions=['is_write', 'is_read_before_write', 'has_id_data'], unless=['is_already_written'])
         self.machine.add_transition(
             trigger='next', source='read', dest='read', before='sleep', after='read', conditions=['is_write', 'is_read_before_write'], unless=['has_id_data'])
         self.machine.add_transition(
@@ -84,19 +165,34 @@ class RfidCli(object):
         self.machine.add_transition(
             trigger='next', source='verify', dest='read', after=['sleep', 'read'], conditions=['is_write', 'is_loop', 'is_verify'])
 
+        # Clone Tag (pipelined station)
+        self.machine.add_transition(
+            trigger='next', source='start', dest='exit', after=['run_clone_station', 'exit'], conditions=['is_clone', 'is_pipeline'])
+
         # Clone Tag
         self.machine.add_transition(
             trigger='next', source='start', dest='read', before=['print_clone_src_notice'], after='read', conditions=['is_clone'])
         self.machine.add_transition(
             trigger='next', source='read', dest='read', before='sleep', after='read', conditions=['is_clone'], unless='has_id_data')
+        self.machine.add_transition(
+            trigger='next', source='read', dest='exit', after=['bulk_clone', 'exit'], conditions=['is_clone', 'is_bulk', 'has_id_data'])
         self.machine.add_transition(
             trigger='next', source='read', dest='start', before=['beep', 'prompt'], after=['read', 'switch_to_write_condition', 'print_clone_dest_notice'], conditions=['is_clone', 'is_prompt'])
         self.machine.add_transition(
             trigger='next', source='read', dest='start', before=['beep', 'prompt'], after=['sleep','read', 'switch_to_write_condition', 'print_clone_dest_notice'], conditions=['is_clone'], unless=['is_prompt'])
 
+        if self.args.profile:
+            self.instrument()
+
+        if self.args.memstats:
+            self.track_memory()
+
     def is_init(self, event):
         return self.args.init
 
+    def is_bench(self, event):
+        return self.args.bench
+
     def is_read(self, event):
         return self.args.read
 
@@ -115,6 +211,15 @@ class RfidCli(object):
     def is_auto_increment(self, event):
         return True if self.args.auto_increment > 0 else False
 
+    def is_bulk(self, event):
+        return self.args.bulk
+
+    def is_pipeline(self, event):
+        return self.args.pipeline
+
+    def is_stations(self, event):
+        return self.args.stations > 0
+
     def is_read_before_write(self, event):
         return self.args.read_before_write
 
@@ -130,6 +235,11 @@ class RfidCli(object):
     def has_id_data(self, event):
         return self.payload_response.has_id_data()
 
+    def is_already_written(self, event):
+        r"""Check if the tag read before writing already carries the target CID and UID, or has been recently written"""
+        tag = (self.payload_response.get_tag_cid(), self.payload_response.get_tag_uid())
+        return tag == (self.w_cid, self.w_uid) or tag in self.written_cache
+
     def sleep(self, event):
         delay = self.args.read_interval
         if (event.transition.source == 'write' and event.transition.dest == 'write'):
@@ -138,7 +248,7 @@ class RfidCli(object):
             delay = self.args.write_interval
         if (event.transition.source == 'read' and event.transition.dest == 'start' and self.is_clone):
             delay = self.args.write_interval
-        sleep(delay)
+        wait(delay, self.deadline, self.cancel)
 
     def switch_to_write_condition(self, event):
         r"""Used to switch from `clone to `write` condition"""
@@ -148,31 +258,124 @@ class RfidCli(object):
 
     def read(self, event):
         r"""Read a Tag"""
-        self.payload_response = self.rfid.read_tag()
+        self.payload_response = self.rfid.read_tag(
+            deadline=self.deadline, cancel=self.cancel)
 
     def write(self, event):
         r"""Write a Tag"""
-        if (self.w_cid is None or self.w_uid is None):
-            print('Please set Tag CID and UID')
-            exit(-1)
+        tag = None
+        if self.args.read_before_write and self.payload_response.has_id_data():
+            tag = (self.payload_response.get_tag_cid(), self.payload_response.get_tag_uid())
 
-        self.rfid.write_tag_from_cid_and_uid(
-            self.w_cid, self.w_uid, tag_type=self.tag_type)
+        # reading, skipping and verifying are separate states
+        config = self.job_config().copy(read_before_write=False, skip_written=False, verify=False)
+        try:
+            result = self.jobs.write(config, tag=tag)
+        except VerifyError as e:
+            # --auto-type could not write the tag with any type
+            result = e.result
+            if not self.args.verify:
+                print('Write Error!')
+
+        if result.tag_type is not None:
+            # keep the last type that worked (or the configured one) when the detection failed
+            self.tag_type = result.tag_type
+        self.write_result = result
+        self.writes += 1
+        self.skipped_tag = None
+        self.written_tag = (self.w_cid, self.w_uid)
+
+    def job_config(self):
+        r"""JobConfig matching the command line arguments"""
+        return JobConfig(cid=self.w_cid, uid=self.w_uid, tag_type=self.tag_type, auto_type=self.args.auto_type,
+                         verify=self.args.verify, read_before_write=self.args.read_before_write,
+                         read_interval=self.args.read_interval, timeout=self.args.timeout, deadline=self.deadline)
+
+    def type_detector(self):
+        r"""TagTypeDetector shared by the writes of the session, or None unless in `--auto-type` mode"""
+        if self.args.auto_type and self.jobs.type_detector is None:
+            self.jobs.type_detector = TagTypeDetector(default=self.tag_type)
+        return self.jobs.type_detector
+
+    def print_type_stats(self):
+        stats = self.jobs.type_detector.stats()
+        writes = stats['first_try'] + stats['retried'] + stats['failed']
+        print('Tag type: %d known by tag, %d by lot, %d guessed; %d/%d right at first try (%.0f%%), '
+              '%d retried with the other type, %d failed' % (
+                  stats['tag'], stats['lot'], stats['default'], stats['first_try'], writes,
+                  100 * (stats['hit_rate'] or 0), stats['retried'], stats['failed']))
+
+    def skip(self, event):
+        r"""Skip writing a Tag that already carries the target (or a recently written) CID and UID"""
+        tag = (self.payload_response.get_tag_cid(), self.payload_response.get_tag_uid())
+
+        # the same tag is skipped on every read while it stays close to the reader: count it once
+        if tag != self.skipped_tag:
+            self.skipped_tag = tag
+            self.skipped_writes += 1
+            # do not report the tag that has just been written and has not been taken away yet
+            if tag != self.written_tag:
+                print('Tag already written! %s %s' % tag)
 
     def verify(self, event):
         r"""Verify written Tag"""
-        payload_response = self.rfid.read_tag()
-        uid = payload_response.get_tag_uid()
-        cid = payload_response.get_tag_cid()
+        if self.write_result is not None and self.write_result.verified is not None:
+            # --auto-type writes have already been read back
+            cid, uid = self.write_result.cid, self.write_result.uid
+            if not self.write_result.verified:
+                cid = uid = None
+        else:
+            payload_response = self.rfid.read_tag(
+                deadline=self.deadline, cancel=self.cancel)
+            uid = payload_response.get_tag_uid()
+            cid = payload_response.get_tag_cid()
 
         if cid != self.w_cid or uid != self.w_uid:
             print('Write Error!')
         else:
             print(str('Write OK! %s %s') % (cid, uid))
 
+    def run_stations(self, event):
+        r"""Write Tags using several devices concurrently. Used in `multi-station mode`"""
+        allocator = self.allocator or UidAllocator(
+            self.w_uid, step=max(self.args.auto_increment, 1))
+        line = EncodingLine(self.rfids, allocator, self.w_cid, tag_type=self.tag_type,
+                            read_interval=self.args.read_interval, beep=self.args.beep,
+                            on_result=self.print_station_result)
+
+        print('Put target tags close to the readers (%d stations)...' % len(self.rfids))
+        line.start()
+        try:
+            while line.is_alive() and not self.cancel.wait(0.5):
+                if self.deadline is not None:
+                    self.deadline.check()
+        finally:
+            line.stop()
+            line.join()
+            for station in line.stations:
+                if station.error is not None:
+                    print('[%s] %s' % (station.name, station.error))
+            self.print_stations_stats(line.stats())
+
+    def print_station_result(self, station, uid, ok, elapsed):
+        if ok:
+            print('[%s] Write OK! %s %s' % (station.name, self.w_cid, uid))
+        else:
+            print('[%s] Write Error! %s %s' % (station.name, self.w_cid, uid))
+
+    def print_stations_stats(self, stats):
+        for station in stats['stations'] + [dict(stats, name='total')]:
+            print('%s: %d written, %d failed (%d USB errors, %d UIDs voided), %.1f badges/hour' % (
+                station['name'], station['written'], station['failed'], station['errors'], station['voided'],
+                station['badges_per_hour']))
+
     def increment(self, event):
         r"""Increment UID. Used in `auto-increment mode`"""
-        self.w_uid = self.w_uid + self.args.auto_increment
+        if self.allocator:
+            self.allocator.commit([self.w_uid])
+            self.w_uid = self.allocator.allocate()
+        else:
+            self.w_uid = self.w_uid + self.args.auto_increment
 
     def prompt(self, event):
         r"""Prompt user to press any key after reading source tag (clone mode)"""
@@ -181,7 +384,73 @@ class RfidCli(object):
 
         print("Read done! %s %s" % (self.w_cid, self.w_uid))
         if self.args.prompt:
-            raw_input("Move source tag away from reader and press ENTER...")
+            input("Move source tag away from reader and press ENTER...")
+
+    def bulk_clone(self, event):
+        r"""Clone the source Tag to every Tag placed close to the reader. Used in `bulk clone mode`"""
+        self.w_cid = cid = self.payload_response.get_tag_cid()
+        self.w_uid = uid = self.payload_response.get_tag_uid()
+        cloner = BulkCloner(self.rfid, cid, uid, tag_type=self.tag_type, copies=self.args.copies or None,
+                            read_interval=self.args.read_interval, beep=self.args.beep,
+                            on_copy=self.print_copy, stop=self.cancel, deadline=self.deadline,
+                            type_detector=self.type_detector())
+
+        print("Read done! %s %s" % (cid, uid))
+        if self.args.beep:
+            self.rfid.beep(deadline=self.deadline, cancel=self.cancel)
+        print("Move source tag away and put target tags close to the reader...")
+        try:
+            cloner.run()
+        finally:
+            stats = cloner.stats()
+            print('Copies: %d done, %d failed (%d USB errors), %.2fs min, %.2fs avg, %.2fs max' % (
+                stats['copied'], stats['failed'], stats['errors'], stats['min'], stats['avg'], stats['max']))
+
+    def run_clone_station(self, event):
+        r"""Read master badges with one device and write the copies with another one. Used in `pipeline clone mode`"""
+        station = CloneStation(self.rfid, self.writer, tag_type=self.tag_type, copies_per_source=self.args.copies or 1,
+                               read_interval=self.args.read_interval, beep=self.args.beep,
+                               on_source=self.print_station_source, on_copy=self.print_station_copy, stop=self.cancel,
+                               type_detector=self.type_detector())
+
+        print('Put master badges close to the source reader and target tags close to the writer...')
+        station.start()
+        try:
+            while station.is_alive() and not self.cancel.wait(0.5):
+                if self.deadline is not None:
+                    self.deadline.check()
+        finally:
+            station.stop()
+            station.join()
+            if station.error is not None:
+                print(station.error)
+            self.print_clone_station_stats(station.stats())
+
+    def print_station_source(self, cid, uid):
+        print('[source] Read done! %s %s' % (cid, uid))
+
+    def print_station_copy(self, cid, uid, result):
+        if result.ok:
+            print('[writer] Write OK! %s %s (%.2fs)' % (cid, uid, result.elapsed))
+        else:
+            print('[writer] Write Error! %s %s (%d attempts)' % (cid, uid, result.attempts))
+
+    def print_clone_station_stats(self, stats):
+        source, writer = stats['source'], stats['writer']
+        print('Copies: %d done, %d failed (%d USB errors) in %.1fs' % (
+            writer['copied'], writer['failed'], stats['errors'], stats['elapsed']))
+        print('source: %d read (%.1f/h), blocked on a full queue %.2fs' % (
+            source['read'], source['per_hour'], source['blocked']))
+        print('writer: %d copied (%.1f/h), %.2fs avg, busy %.2fs, waiting for masters %.2fs, '
+              'for blank tags %.2fs' % (writer['copied'], writer['per_hour'], writer['avg'], writer['busy'],
+                                        writer['starved'], writer['waiting']))
+        print('bottleneck: %s' % stats['bottleneck'])
+
+    def print_copy(self, result):
+        if result.ok:
+            print('Write OK! %s %s (%.2fs)' % (self.w_cid, self.w_uid, result.elapsed))
+        else:
+            print('Write Error! (%d attempts)' % result.attempts)
 
     def print_clone_src_notice(self, event):
         print("Put source tag close to the reader...")
@@ -191,25 +460,313 @@ class RfidCli(object):
 
     def connect(self, vid, pid):
         try:
-            return RfidHid(vid, pid)
+            return RfidHid(vid, pid, timeout=self.args.timeout, sink=self.sink,
+                           port_path=self.args.usb_path, serial=self.args.usb_serial)
         except Exception as e:
             print(e)
             exit()
 
+    def connect_writer(self, vid, pid):
+        r"""Open the writer of the clone station: the device selected with --writer-path/--writer-serial, or else
+        any device other than the source one"""
+        def location(rfid):
+            return getattr(rfid.hid.dev, 'bus', None), getattr(rfid.hid.dev, 'address', None)
+
+        try:
+            if self.args.writer_path or self.args.writer_serial:
+                writer = RfidHid(vid, pid, timeout=self.args.timeout, sink=self.sink,
+                                 port_path=self.args.writer_path, serial=self.args.writer_serial)
+            else:
+                writer = next((device for device in RfidHid.find_all(vid, pid, timeout=self.args.timeout, sink=self.sink)
+                               if location(device) != location(self.rfid)), None)
+        except Exception as e:
+            print(e)
+            exit()
+
+        if writer is None:
+            print('Found no writer device with id %d:%d, 2 devices required.' % (vid, pid))
+            exit()
+
+        self.rfid.name = 'source'
+        writer.name = 'writer'
+        return writer
+
+    def connect_all(self, vid, pid, count):
+        try:
+            devices = RfidHid.find_all(vid, pid, timeout=self.args.timeout, sink=self.sink)
+        except Exception as e:
+            print(e)
+            exit()
+
+        for i, device in enumerate(devices):
+            device.name = 'station-%d' % i
+
+        if len(devices) < count:
+            print('Found %d device(s) with id %d:%d, %d required.' % (len(devices), vid, pid, count))
+            exit()
+
+        return devices[:count]
+
     def beep(self, event):
         if self.args.beep:
             times = 1 if event.transition.source == 'print' or event.transition.dest == 'prompt' else 2
             # wait before sending beep
-            sleep(0.2)
-            self.rfid.beep(times)
+            wait(0.2, self.deadline, self.cancel)
+            self.rfid.beep(times, deadline=self.deadline, cancel=self.cancel)
 
     def exit(self, event):
         exit()
 
+    def signal_handler(self, sig, frame):
+        r"""Cancel the current operation on the first SIGINT, and exit right away on the second one"""
+        if self.cancel.is_cancelled():
+            signal_handler(sig, frame)
+
+        print('\nProcess terminated by user')
+        self.cancel.cancel()
+
+    def close(self):
+        r"""Release resources held by the tool. Called on exit"""
+        if self.allocator:
+            self.allocator.close()
+
+        if self.sink:
+            self.sink.close()
+
+        if self.profiler:
+            self.print_profile()
+
+        if self.memstats:
+            self.print_memstats()
+
+        if self.jobs.type_detector and self.jobs.type_detector.stats()['hit_rate'] is not None:
+            self.print_type_stats()
+
+        if self.args.write and self.args.loop:
+            print('Writes: %d performed, %d skipped' % (self.writes, self.skipped_writes))
+
+    def instrument(self):
+        r"""Time every transition, state callback, USB transfer and wait. Used in `--profile` mode"""
+        self.profiler = Profiler()
+        self.profile_started = monotonic()
+
+        callbacks = set()
+        for transitions in self.machine.events['next'].transitions.values():
+            for transition in transitions:
+                callbacks.update(transition.before + transition.after)
+        for name in callbacks:
+            setattr(self, name, self.profiler.wrap('callback:' + name, getattr(self, name)))
+
+        trigger = self.next
+
+        def next(*args, **kwargs):
+            source = self.state
+            started = monotonic()
+            try:
+                return trigger(*args, **kwargs)
+            finally:
+                self.profiler.add('transition:%s -> %s' % (source, self.state), monotonic() - started)
+
+        self.next = next
+
+        devices = [(rfid, 'usb') for rfid in [self.rfid] + list(getattr(self, 'rfids', []))]
+        # the writer of the pipelined clone station runs concurrently with the source reader
+        devices.append((self.writer, 'usb:writer'))
+        for rfid, name in devices:
+            if rfid is None:
+                continue
+            for method in ('get_report_descriptor', 'set_feature_report', 'get_feature_report'):
+                setattr(rfid.hid, method, self.profiler.wrap(name, getattr(rfid.hid, method)))
+
+        # every wait (sleep callback, beep, verify delay...) is done on the cancellation token
+        self.cancel.wait = self.profiler.wrap('sleep', self.cancel.wait)
+
+    def print_profile(self):
+        r"""Print the time spent by transition and callback, and the share spent sleeping and doing USB I/O"""
+        elapsed = monotonic() - self.profile_started
+        timers = self.profiler.timers
+        transitions = [name for name in timers if name.startswith('transition:')]
+        callbacks = [name for name in timers if name.startswith('callback:')]
+        iterations = sum(timers[name].count for name in transitions)
+
+        def share(total):
+            return 100.0 * total / elapsed if elapsed else 0.0
+
+        def per_iteration(total):
+            return 1000.0 * total / iterations if iterations else 0.0
+
+        print('\nProfile: %.2fs, %d iterations (%.1fms per iteration)' % (
+            elapsed, iterations, per_iteration(elapsed)))
+
+        print('%-28s %8s %10s %10s %10s %7s' % ('transition', 'calls', 'total', 'ms/iter', 'max ms', 'share'))
+        for name in sorted(transitions, key=lambda name: -timers[name].total):
+            timer = timers[name]
+            print('%-28s %8d %9.2fs %10.1f %10.1f %6.1f%%' % (
+                name.split(':', 1)[1], timer.count, timer.total, per_iteration(timer.total), 1000 * timer.max,
+                share(timer.total)))
+
+        print('%-28s %8s %10s %10s %10s %7s' % ('callback', 'calls', 'total', 'ms/iter', 'max ms', 'share'))
+        for name in sorted(callbacks, key=lambda name: -timers[name].total):
+            timer = timers[name]
+            print('%-28s %8d %9.2fs %10.1f %10.1f %6.1f%%' % (
+                name.split(':', 1)[1], timer.count, timer.total, per_iteration(timer.total), 1000 * timer.max,
+                share(timer.total)))
+
+        # callbacks run within the transitions: the rest is spent in the state machine itself
+        machinery = (sum(timers[name].total for name in transitions) -
+                     sum(timers[name].total for name in callbacks))
+        print('%-28s %8s %9.2fs %10.1f %10s %6.1f%%' % (
+            '(state machine)', '', machinery, per_iteration(machinery), '', share(machinery)))
+
+        usb = self.profiler.total('usb')
+        sleeping = self.profiler.total('sleep')
+        print('USB I/O: %.2fs (%.1f%%, %d transfers), sleeping: %.2fs (%.1f%%), other: %.2fs (%.1f%%)' % (
+            usb, share(usb), self.profiler.count('usb'), sleeping, share(sleeping),
+            elapsed - usb - sleeping, share(elapsed - usb - sleeping)))
+        if self.writer is not None:
+            writer_usb = self.profiler.total('usb:writer')
+            print('Writer USB I/O: %.2fs (%.1f%%, %d transfers)' % (
+                writer_usb, share(writer_usb), self.profiler.count('usb:writer')))
+
+    def run_bench(self, event):
+        r"""Measure the attached device. Used in `--bench` mode"""
+        bench = HardwareBench(self.rfid, warmup=self.args.bench_warmup, repetitions=self.args.bench_reps,
+                              write_repetitions=self.args.bench_write_reps, timeout=self.args.timeout,
+                              cancel=self.cancel)
+        self.rfid.init()
+        self.rfid.wait_ready(cancel=self.cancel)
+
+        report = OrderedDict()
+        report['version'] = self.VERSION
+        report['device'] = OrderedDict([('vid', self.args.usb_vid), ('pid', self.args.usb_pid),
+                                        ('path', self.args.usb_path), ('serial', self.args.usb_serial)])
+        report['host'] = OrderedDict([('platform', platform.platform()), ('python', platform.python_version())])
+        report['warmup'] = self.args.bench_warmup
+        report['repetitions'] = self.args.bench_reps
+        report['write_repetitions'] = self.args.bench_write_reps if self.args.bench_write else 0
+
+        if self.args.prompt:
+            self.bench_prompt("Remove any tag from the reader and press ENTER...")
+        report['round_trip'] = self.bench_step('SET+GET round trip', bench.round_trip)
+
+        present = bench.tag_present()
+        report['read_tag' if present else 'read_no_tag'] = self.bench_step(
+            'read polls (%s tag)' % ('with' if present else 'no'), bench.read_polls)
+        report['min_gap'] = self.bench_step('minimum inter-command gap', bench.min_gap)
+
+        if self.args.prompt and not present:
+            self.bench_prompt("Put a tag close to the reader%s and press ENTER..." % (
+                ' (it is rewritten with its own ID)' if self.args.bench_write else ''))
+            present = bench.tag_present()
+            if present:
+                report['read_tag'] = self.bench_step('read polls (with tag)', bench.read_polls)
+
+        if present and self.args.bench_write:
+            tag_types = [self.tag_type]
+            if self.args.auto_type:
+                tag_types = [RfidHid.TAG_EM4305, RfidHid.TAG_T5577]
+            report['write_verify'] = OrderedDict(
+                (self.TAG_TYPE_NAMES[tag_type], self.bench_step(
+                    'write and verify (%s)' % self.TAG_TYPE_NAMES[tag_type],
+                    lambda tag_type=tag_type: bench.write_verify(tag_type)))
+                for tag_type in tag_types)
+
+        if self.args.json:
+            print(json.dumps(report, indent=2))
+        else:
+            self.print_bench(report)
+
+    def bench_prompt(self, message):
+        # keep stdout clean for --json
+        if self.args.json:
+            sys.stderr.write(message)
+            sys.stderr.flush()
+            input()
+        else:
+            input(message)
+
+    def bench_step(self, title, measure):
+        sys.stderr.write('Measuring %s...\n' % title)
+        return measure()
+
+    def print_bench(self, report):
+        def ms(value):
+            return '%8.2f' % (value * 1000) if value is not None else '       -'
+
+        print('%-24s %6s %6s %9s %8s %8s %8s %8s' % ('', 'ops', 'errors', 'ops/s', 'p50 ms', 'p95 ms', 'p99 ms',
+                                                     'max ms'))
+        rows = [(name, report.get(name)) for name in ('round_trip', 'read_no_tag', 'read_tag')]
+        rows += [('write_verify ' + name, result) for name, result in report.get('write_verify', {}).items()]
+        for name, result in rows:
+            if result is not None:
+                print('%-24s %6d %6d %9s %s %s %s %s' % (
+                    name, result['count'], result['errors'],
+                    '%9.1f' % result['rate'] if result['rate'] is not None else '-',
+                    ms(result['p50']), ms(result['p95']), ms(result['p99']), ms(result['max'])))
+
+        min_gap = report['min_gap']
+        print('min gap: %s (%s)' % (
+            '%.1fms' % (min_gap['min_gap'] * 1000) if min_gap['min_gap'] is not None else 'not found',
+            ', '.join('%.1fms: %d errors' % (gap['gap'] * 1000, gap['errors']) for gap in min_gap['gaps'])))
+
+    def track_memory(self):
+        r"""Sample tracemalloc and RSS every step of the state machine. Used in `--memstats` mode"""
+        self.memstats = MemoryTracker(interval=self.args.memstats_interval, on_sample=self.print_memory_sample)
+        trigger = self.next
+
+        def next(*args, **kwargs):
+            try:
+                return trigger(*args, **kwargs)
+            finally:
+                self.memstats.iteration()
+
+        self.next = next
+
+    def print_memory_sample(self, sample):
+        memstats = self.memstats
+        growth = memstats.growth_per_iteration()
+        sys.stderr.write('memstats: %d steps, traced %s (retained %s/step), rss %s\n' % (
+            sample.iterations, self.format_bytes(sample.traced),
+            self.format_bytes(growth, signed=True), self.format_bytes(sample.rss)))
+
+    def print_memstats(self):
+        self.memstats.sample()
+        report = self.memstats.report()
+        self.memstats.stop()
+        trend = report['trend']
+
+        print('\nMemory: %d steps, traced %s, rss %s' % (
+            report['iterations'], self.format_bytes(report['traced']), self.format_bytes(report['rss'])))
+        blocks = report['blocks_per_iteration']
+        print('per step: retained %s in %s live blocks, peak working set %s' % (
+            self.format_bytes(report['growth_per_iteration'], signed=True),
+            '-' if blocks is None else '%+.2f' % blocks,
+            self.format_bytes(report['working_set_per_iteration'])))
+        print('trend: traced %s/h, rss %s/h' % (
+            self.format_bytes(trend['traced_per_hour'], signed=True),
+            self.format_bytes(trend['rss_per_hour'], signed=True)))
+        if report['top_sites']:
+            print('%-44s %10s %12s  %s' % ('top allocation sites', 'retained', 'live blocks', 'line'))
+            for site in report['top_sites']:
+                print('%-44s %10s %+12d  %s' % (site['location'][-44:], self.format_bytes(site['size_diff'], signed=True),
+                                               site['count_diff'], site['line']))
+
+    @staticmethod
+    def format_bytes(value, signed=False):
+        if value is None:
+            return '-'
+        for unit in ('B', 'KB', 'MB'):
+            if abs(value) < 1024:
+                break
+            value /= 1024.0
+        else:
+            unit = 'GB'
+        return ('%+.1f %s' if signed else '%.1f %s') % (value, unit)
+
     def initialize(self, event):
         print('Initializing device...')
         self.rfid.init()
-        sleep(1)
+        self.rfid.wait_ready(cancel=self.cancel)
         print('Done!')
 
     def parse_payload_response(self, payload_response, base):
@@ -245,6 +802,10 @@ class RfidCli(object):
         if self.payload_response.is_equal(self.payload_response_temp) and self.args.single:
             return
 
+        if self.dedupe is not None and self.dedupe.seen(
+                (self.payload_response.get_tag_cid(), self.payload_response.get_tag_uid())):
+            return
+
         uid, cid, w26 = self.parse_payload_response(
             self.payload_response, self.args.base)
         if self.args.w26:
@@ -258,21 +819,19 @@ class RfidCli(object):
         self.payload_response_temp = self.payload_response
         if self.args.beep:
             # wait before sending beep
-            sleep(0.2)
-            self.rfid.beep()
+            wait(0.2, self.deadline, self.cancel)
+            self.rfid.beep(deadline=self.deadline, cancel=self.cancel)
 
     def parse_CID(self, cid):
         cid = self.parse_id(cid)
         if cid > 0xff or cid < 0:
-            print('Invalid Customer ID (%s)' % cid)
-            exit(-1)
+            raise ValueError('Invalid Customer ID (%s)' % cid)
         return cid
 
     def parse_UID(self, uid):
         uid = self.parse_id(uid)
         if uid > 0xffffffff or uid < 0:
-            print('Invalid UID (%s)' % uid)
-            exit(-1)
+            raise ValueError('Invalid UID (%s)' % uid)
         return uid
 
     def parse_id(self, id):
@@ -282,10 +841,9 @@ class RfidCli(object):
             else:
                 return int(id, 10)
         except ValueError:
-            print("Invalid input (%s). Please use integer or hex string (e.g. 0x4d)" % id)
-            exit(-1)
+            raise ValueError("Invalid input (%s). Please use integer or hex string (e.g. 0x4d)" % id)
 
-    def parse_arguments(self):
+    def parse_arguments(self, argv=None):
 
         example_text = r'''Examples:
 
@@ -294,7 +852,18 @@ class RfidCli(object):
         rfid_cli -r -b bin --loop --single
         rfid_cli -w 12 12345 --t5577
         rfid_cli -w 0x0b 0xaabb
-        rfid_cli -w 12 12345 --loop -a 1'''
+        rfid_cli -w 12 12345 --loop -a 1
+        rfid_cli -c --bulk --copies 200
+        rfid_cli -c --pipeline --usb-path 1-1.2 --writer-path 1-1.3
+        rfid_cli -w 12 12345 --stations 4
+        rfid_cli -w 12 12345 --loop -a 1 --uid-journal uids.journal
+        rfid_cli -r --loop --single --db events.db
+        rfid_cli -r --loop --single --forward http://server/events --spool /var/spool/rfid
+        rfid_cli -r --loop --dedupe ttl=5s
+        rfid_cli -w 12 12345 --loop -a 1 --profile
+        rfid_cli -w 12 12345 --loop -a 1 --auto-type
+        rfid_cli -r --loop --single --memstats
+        rfid_cli --bench --bench-reps 500 --json'''
 
         parser = argparse.ArgumentParser(
             description="RFID cli tool for reading and writing tags IDs using 125Khz Chinese USB HID Reader/Writer",
@@ -304,12 +873,20 @@ class RfidCli(object):
 
         parser.add_argument('--version',
                             action="version",
-                            version="v1.1.4 (Nov 14th, 2020)")
+                            version=self.VERSION)
 
         parser.add_argument('-i',
                             action="store_true", dest="init",
                             help="Initialize Device", default=False)
 
+        parser.add_argument('--timeout', metavar='SECONDS',
+                            action="store", dest="timeout", type=float,
+                            help="Set USB transfer timeout in seconds [default: pyusb default]", default=None)
+
+        parser.add_argument('--deadline', metavar='SECONDS',
+                            action="store", dest="deadline", type=float,
+                            help="Fail if the operation has not completed within SECONDS [default: no deadline]", default=None)
+
         parser.add_argument('--usb-vid',
                             action='store', dest='usb_vid', metavar='VID', type=int,
                             help="Set Device Vendor ID in decimal format [default: %(default)#x]", default=65535
@@ -319,6 +896,14 @@ class RfidCli(object):
                             action="store", dest="usb_pid", metavar='PID', type=int,
                             help="Set Device Product ID in decimal format [default: %(default)#x] ", default=53)
 
+        parser.add_argument('--usb-path',
+                            action="store", dest="usb_path", metavar='BUS-PORT',
+                            help="Open the device plugged at this USB port path (e.g. 1-1.2, see lsusb -t)", default=None)
+
+        parser.add_argument('--usb-serial',
+                            action="store", dest="usb_serial", metavar='SERIAL',
+                            help="Open the device with this serial number", default=None)
+
         parser.add_argument('-r',
                             action="store_true", dest="read",
                             help="Read Tag", default=False)
@@ -343,6 +928,11 @@ class RfidCli(object):
                             action="store_true", dest="single",
                             help="If loop mode is enabled do not print same tag more than once", default=False)
 
+        parser.add_argument('--dedupe', metavar='MODE',
+                            action="store", dest="dedupe",
+                            help="Do not print again a tag seen within the last SECONDS (ttl=SECONDS, e.g. ttl=5s) "
+                                 "or during the whole session (session) [default: disabled]", default=None)
+
         parser.add_argument('--read-delay', metavar='DELAY',
                             action="store", dest="read_interval", type=float,
                             help="Set Read loop interval in seconds [default: %(default)#2f]", default=0.2)
@@ -369,6 +959,11 @@ class RfidCli(object):
                             action="store_true", dest="t5577",
                             help="Set tag type to T5577 [default: em4305]", default=False)
 
+        parser.add_argument('--auto-type',
+                            action="store_true", dest="auto_type",
+                            help="Detect the tag type: write with the most likely one and retry with the other one "
+                                 "if the tag cannot be read back", default=False)
+
         parser.add_argument('--noverify',
                             action="store_false", dest="verify",
                             help="Do not verify tag after writing", default=True)
@@ -381,26 +976,148 @@ class RfidCli(object):
                             action="store_false", dest="prompt",
                             help="Do not prompt the user to press a key in clone mode", default=True)
 
+        parser.add_argument('--bulk',
+                            action="store_true", dest="bulk",
+                            help="In clone mode, write the source tag to every tag put close to the reader", default=False)
+
+        parser.add_argument('--copies', metavar='N', type=int,
+                            action="store", dest="copies",
+                            help="Number of copies to make in bulk clone mode [default: unlimited], "
+                                 "or of every master badge in pipeline clone mode [default: 1]", default=0)
+
+        parser.add_argument('--pipeline',
+                            action="store_true", dest="pipeline",
+                            help="In clone mode, read master badges with one device and write the copies with "
+                                 "another one, concurrently", default=False)
+
+        parser.add_argument('--writer-path', metavar='PATH', type=str,
+                            action="store", dest="writer_path",
+                            help="USB port path of the writer device in pipeline clone mode (e.g. 1-1.3) "
+                                 "[default: any device other than the source one]", default=None)
+
+        parser.add_argument('--writer-serial', metavar='SERIAL', type=str,
+                            action="store", dest="writer_serial",
+                            help="Serial number of the writer device in pipeline clone mode", default=None)
+
         parser.add_argument('-a', metavar='VALUE', type=int,
                             action="store", dest="auto_increment",
                             help="Auto increment UID on every write [default: %(default)#d]", default=0)
 
+        parser.add_argument('--stations', metavar='N', type=int,
+                            action="store", dest="stations",
+                            help="Write tags using N devices concurrently, each one with a unique UID [default: disabled]", default=0)
+
+        parser.add_argument('--rewrite-window', metavar='SECONDS', type=float,
+                            action="store", dest="rewrite_window",
+                            help="Do not write again a tag written within the last SECONDS [default: %(default)#d]", default=60)
+
+        parser.add_argument('--uid-journal', metavar='PATH', type=str,
+                            action="store", dest="uid_journal",
+                            help="Keep track of auto-incremented UIDs (-a, --stations) in PATH so they are never reused", default=None)
+
+        parser.add_argument('--db', metavar='PATH', type=str,
+                            action="store", dest="db",
+                            help="Store read and written tags in the SQLite database PATH (see rfid_db)", default=None)
+
+        parser.add_argument('--forward', metavar='URL', type=str,
+                            action="store", dest="forward",
+                            help="Send read and written tags in batches to the HTTP endpoint URL", default=None)
+
+        parser.add_argument('--spool', metavar='DIR', type=str,
+                            action="store", dest="spool",
+                            help="Keep the tags not yet delivered to --forward in DIR [default: drop them]", default=None)
+
+        parser.add_argument('--profile',
+                            action="store_true", dest="profile",
+                            help="Print the time spent by state, callback, USB I/O and sleeping on exit", default=False)
+
+        parser.add_argument('--memstats',
+                            action="store_true", dest="memstats",
+                            help="Sample memory (tracemalloc and RSS) every --memstats-interval seconds and print the "
+                                 "growth per step, top allocation sites and trend on exit", default=False)
+
+        parser.add_argument('--memstats-interval', metavar='SECONDS', type=float,
+                            action="store", dest="memstats_interval",
+                            help="Seconds between --memstats samples [default: %(default)s]", default=60)
+
+        parser.add_argument('--bench',
+                            action="store_true", dest="bench",
+                            help="Measure USB round trip, read polls and the minimum gap between commands of the "
+                                 "device, and with --bench-write the write and verify latency", default=False)
+
+        parser.add_argument('--bench-reps', metavar='N', type=int,
+                            action="store", dest="bench_reps",
+                            help="Measured operations of every --bench step [default: 100]", default=100)
+
+        parser.add_argument('--bench-warmup', metavar='N', type=int,
+                            action="store", dest="bench_warmup",
+                            help="Operations run before every --bench step [default: 10]", default=10)
+
+        parser.add_argument('--bench-write',
+                            action="store_true", dest="bench_write",
+                            help="Also measure the write and verify latency with --bench. The tag close to the "
+                                 "reader is rewritten with its own ID --bench-write-reps times for every tag type",
+                            default=False)
+
+        parser.add_argument('--bench-write-reps', metavar='N', type=int,
+                            action="store", dest="bench_write_reps",
+                            help="Measured writes of every --bench-write tag type [default: %(default)s]", default=5)
+
+        parser.add_argument('--json',
+                            action="store_true", dest="json",
+                            help="Print the --bench report as JSON", default=False)
+
         parser.add_argument('--beep',
                             action="store_true", dest="beep",
                             help="Enable Beep", default=False)
 
+        argv = sys.argv[1:] if argv is None else argv
         args = parser.parse_args(
-            args=None if sys.argv[1:] else ['--help'])
+            args=argv if argv else ['--help'])
 
         if (args.read and args.write) or (args.read and args.clone) or (args.write and args.clone):
             args = parser.parse_args(['--help'])
 
+        if args.stations and not args.write:
+            args = parser.parse_args(['--help'])
+
+        if args.bench and (args.read or args.write or args.clone or args.stations):
+            args = parser.parse_args(['--help'])
+
+        if (args.pipeline and (not args.clone or args.bulk)) or ((args.writer_path or args.writer_serial) and
+                                                                 not args.pipeline):
+            args = parser.parse_args(['--help'])
+
+        if args.bench_write and not args.bench:
+            parser.error('--bench-write requires --bench')
+
+        if args.auto_type and args.stations:
+            parser.error('--auto-type is not supported with --stations')
+
+        if args.uid_journal and not (args.write and (args.auto_increment or args.stations)):
+            parser.error('--uid-journal requires writing with --auto-increment or --stations')
+
+        if args.spool and not args.forward:
+            args = parser.parse_args(['--help'])
+
+        if args.forward and not args.forward.startswith(('http://', 'https://')):
+            parser.error("Invalid URL '%s'. Use http:// or https://" % args.forward)
+
+        if args.dedupe:
+            try:
+                self.dedupe = parse_dedupe(args.dedupe)
+            except ValueError as e:
+                parser.error(str(e))
+
         if args.write:
             if args.w_cid is None or args.w_uid is None:
                 args = parser.parse_args(['--help'])
 
-            self.w_cid = self.parse_CID(args.w_cid)
-            self.w_uid = self.parse_UID(args.w_uid)
+            try:
+                self.w_cid = self.parse_CID(args.w_cid)
+                self.w_uid = self.parse_UID(args.w_uid)
+            except ValueError as e:
+                parser.error(str(e))
 
         return args
 
@@ -411,9 +1128,18 @@ def signal_handler(sig, frame):
 def main():
     signal.signal(signal.SIGINT, signal_handler)
     rfid_cli = RfidCli()
-
-    while True:
-        rfid_cli.next()
+    signal.signal(signal.SIGINT, rfid_cli.signal_handler)
+
+    try:
+        while not rfid_cli.cancel.is_cancelled():
+            rfid_cli.next()
+    except OperationCancelledError:
+        pass
+    except RfidTimeoutError as e:
+        print(e)
+        exit(-1)
+    finally:
+        rfid_cli.close()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,111 @@
+# Copyright (c) 2019 charlysan
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+from __future__ import print_function
+import argparse
+import sys
+import time
+from datetime import datetime
+
+from rfidhid.sink import EventLog
+
+
+def parse_time(value):
+    r"""Local date (YYYY-MM-DD) or date and time (YYYY-MM-DD HH:MM[:SS]) to seconds since the epoch"""
+    for fmt in ('%Y-%m-%d', '%Y-%m-%d %H:%M', '%Y-%m-%d %H:%M:%S'):
+        try:
+            return time.mktime(datetime.strptime(value, fmt).timetuple())
+        except ValueError:
+            pass
+    raise argparse.ArgumentTypeError("invalid date: '%s' (use YYYY-MM-DD [HH:MM[:SS]])" % value)
+
+
+def parse_uid(value):
+    return int(value, 16) if value.startswith('0x') else int(value, 10)
+
+
+def format_time(timestamp, fmt='%Y-%m-%d %H:%M:%S'):
+    return datetime.fromtimestamp(timestamp).strftime(fmt)
+
+
+def parse_arguments(argv=None):
+    example_text = r'''Examples:
+
+        rfid_db events.db
+        rfid_db events.db --uid 12345 --from 2019-06-01 --to 2019-07-01
+        rfid_db events.db --summary --from "2019-06-03 08:00" --to "2019-06-03 10:00"
+        rfid_db events.db --events --uid 0x3039 --limit 20'''
+
+    parser = argparse.ArgumentParser(
+        description="Query tags read and written by rfid_cli --db",
+        epilog=example_text,
+        formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+
+    parser.add_argument('db', type=str, metavar='PATH', help="SQLite database written by rfid_cli --db")
+
+    parser.add_argument('--uid', metavar='UID', type=parse_uid,
+                        action="store", dest="uid", help="Only show this UID", default=None)
+
+    parser.add_argument('--from', metavar='DATE', type=parse_time,
+                        action="store", dest="start", help="Start of the time range (inclusive)", default=None)
+
+    parser.add_argument('--to', metavar='DATE', type=parse_time,
+                        action="store", dest="end", help="End of the time range (exclusive)", default=None)
+
+    mode = parser.add_mutually_exclusive_group()
+
+    mode.add_argument('--summary',
+                      action="store_true", dest="summary",
+                      help="Reads and writes per UID (default: first and last read per UID per day)", default=False)
+
+    mode.add_argument('--events',
+                      action="store_true", dest="events",
+                      help="List events", default=False)
+
+    parser.add_argument('--limit', metavar='N', type=int,
+                        action="store", dest="limit", help="Maximum number of events to list", default=None)
+
+    return parser.parse_args(sys.argv[1:] if argv is None else argv)
+
+
+def main(argv=None):
+    args = parse_arguments(argv)
+
+    with EventLog(args.db) as log:
+        if args.summary:
+            print('%-5s %-10s %8s %8s %-19s %-19s' % ('CID', 'UID', 'READS', 'WRITES', 'FIRST', 'LAST'))
+            for row in log.summary(args.uid, args.start, args.end):
+                print('%-5s %-10s %8d %8d %-19s %-19s' % (
+                    row.cid, row.uid, row.reads, row.writes, format_time(row.first), format_time(row.last)))
+        elif args.events:
+            for event in log.events(args.uid, args.start, args.end, args.limit):
+                print('%s %-5s %s %s%s' % (format_time(event.timestamp), event.kind, event.cid, event.uid,
+                                           ' [%s]' % event.reader if event.reader else ''))
+        else:
+            print('%-10s %-5s %-10s %-8s %-8s %6s' % ('DAY', 'CID', 'UID', 'FIRST', 'LAST', 'READS'))
+            for row in log.first_last_seen(args.uid, args.start, args.end):
+                print('%-10s %-5s %-10s %-8s %-8s %6d' % (
+                    row.day, row.cid, row.uid, format_time(row.first, '%H:%M:%S'),
+                    format_time(row.last, '%H:%M:%S'), row.reads))
+
+
+if __name__ == "__main__":
+    main()
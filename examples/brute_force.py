@@ -40,7 +40,7 @@ def main():
     # Initialize device
     print('Initializing device...')
     rfid.init()
-    sleep(2)
+    rfid.wait_ready()
     
     cmds = []
 
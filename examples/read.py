@@ -46,7 +46,7 @@ def main():
     # Initialize device
     print('Initializing device...')
     rfid.init()
-    sleep(2)
+    rfid.wait_ready()
     print('Done!')
     print ('Please hold a tag to the reader until you hear a beep...\n')
 
@@ -53,7 +53,7 @@ def main():
     # Initialize device
     print('Initializing device...')
     rfid.init()
-    sleep(2)
+    rfid.wait_ready()
     print('Done!')
     print('CID:UID to be written: %s:%s' % (CID, UID))
     print ('Please hold a tag to the reader until you hear two beeps...\n')
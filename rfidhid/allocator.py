@@ -0,0 +1,344 @@
+# Copyright (c) 2019 charlysan
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+r"""UID allocation for auto-increment writes"""
+
+import errno
+import fcntl
+import heapq
+import os
+import threading
+import uuid
+from contextlib import contextmanager
+
+
+class UidExhaustedError(ValueError):
+    r"""Raised when there are no UIDs left to allocate"""
+
+
+class UidAllocator(object):
+    r"""Thread-safe source of unique UIDs shared by several writers
+
+    UIDs are handed out as `start`, `start + step`, `start + 2 * step`, ... up to `limit` (inclusive).
+    UIDs that could not be written can be handed back with `requeue` and will be reissued
+    (lowest first) before any fresh UID. Written UIDs should be reported with `commit`, so the
+    allocator knows when no reserved UID can come back anymore (see `exhausted`), and so should the
+    UIDs that might have been written (`void`).
+    """
+    UID_MAX = 0xffffffff
+
+    def __init__(self, start, step=1, limit=UID_MAX):
+        if step < 1:
+            raise ValueError('Invalid UID step (%s)' % step)
+
+        self.step = step
+        self.limit = limit
+        self._next = start
+        self._requeued = []
+        self._outstanding = 0
+        self._lock = threading.Lock()
+
+    def allocate(self):
+        r"""Get the next UID"""
+        return self.reserve(1)[0]
+
+    def reserve(self, count):
+        r"""Get a block of (up to) `count` UIDs
+
+        Raises UidExhaustedError if there are no UIDs left.
+        """
+        with self._lock:
+            uids = []
+            while self._requeued and len(uids) < count:
+                uids.append(heapq.heappop(self._requeued))
+
+            missing = min(count - len(uids), self._fresh_left())
+            if missing > 0:
+                uids.extend(self._take_fresh(missing))
+
+            if not uids:
+                raise UidExhaustedError('UID range exhausted.')
+
+            self._outstanding += len(uids)
+            return uids
+
+    def requeue(self, uids):
+        r"""Give back UIDs that have been reserved but not written"""
+        with self._lock:
+            for uid in uids:
+                heapq.heappush(self._requeued, uid)
+            self._outstanding -= len(uids)
+
+    def commit(self, uids):
+        r"""Report reserved UIDs as written"""
+        with self._lock:
+            self._outstanding -= len(uids)
+
+    def void(self, uids):
+        r"""Report reserved UIDs that might have been written (e.g. the write failed midway)
+
+        They are never handed out again.
+        """
+        with self._lock:
+            self._outstanding -= len(uids)
+
+    def exhausted(self):
+        r"""Check if no UID is left, including those reserved that might still be requeued"""
+        with self._lock:
+            return self._outstanding == 0 and not self._requeued and self._fresh_left() == 0
+
+    def remaining(self):
+        r"""Number of UIDs that can still be allocated"""
+        with self._lock:
+            return len(self._requeued) + self._fresh_left()
+
+    def _fresh_left(self):
+        if self._next > self.limit:
+            return 0
+        return (self.limit - self._next) // self.step + 1
+
+    def _take_fresh(self, count):
+        first = self._next
+        self._next = first + count * self.step
+        return list(range(first, self._next, self.step))
+
+
+class JournaledUidAllocator(UidAllocator):
+    r"""UidAllocator that never reuses a UID across restarts
+
+    Fresh UIDs are reserved in blocks of `block_size`. Every reservation is appended to a journal
+    file (and fsync'ed) before any UID of the block is handed out, so the journal is written once
+    per block instead of once per UID. The journal is protected with `flock`, so several
+    processes can share it.
+
+    UIDs reserved but never handed out are recorded in the journal as gaps: when the allocator
+    is closed, and, on startup, for blocks left open by processes that are no longer running.
+    The gap of a crashed process spans its whole last block, as there is no way to know how
+    many UIDs of it were written. UIDs handed out but neither committed nor requeued when the
+    allocator is closed, or reported with `void`, are recorded as void: they might or might not have
+    been written.
+
+    The owner of a block is identified by its pid and the start time of its process, so a block
+    left by a crashed process is recovered even if a new process got the same pid.
+
+    Journal records (one per line):
+    R <owner> <first> <end> -- block reserved by owner: UIDs from first (inclusive) to end (exclusive)
+    G <first> <end> <reason> -- UIDs that will never be handed out (reason: closed or crashed)
+    V <first> <end> -- UIDs handed out but never committed
+    C <owner> -- owner has been closed
+    """
+
+    def __init__(self, path, start, step=1, limit=UidAllocator.UID_MAX, block_size=100):
+        r"""Arguments:
+        path -- Journal file path (created if it does not exist)
+        start -- First UID to hand out, if the journal does not contain a higher one
+        block_size -- Number of UIDs reserved per journal write
+        """
+        super(JournaledUidAllocator, self).__init__(start, step=step, limit=limit)
+        self.path = path
+        self.block_size = block_size
+        self.owner = '%d:%s:%s' % (os.getpid(), self._process_token(os.getpid()), uuid.uuid4().hex[:8])
+        self._block_end = start
+        self._high_water_mark = start
+        self._open_blocks = {}
+        self._gaps = []
+        self._voided = []
+        self._granted = set()
+        self._journal_offset = 0
+        self._journal = open(path, 'a+b')
+
+        with self._locked_journal():
+            self._recover()
+
+    def reserve(self, count):
+        uids = super(JournaledUidAllocator, self).reserve(count)
+        with self._lock:
+            self._granted.update(uids)
+        return uids
+
+    def requeue(self, uids):
+        with self._lock:
+            self._granted.difference_update(uids)
+        super(JournaledUidAllocator, self).requeue(uids)
+
+    def commit(self, uids):
+        with self._lock:
+            self._granted.difference_update(uids)
+        super(JournaledUidAllocator, self).commit(uids)
+
+    def void(self, uids):
+        with self._lock:
+            self._granted.difference_update(uids)
+            if self._journal is None:
+                raise ValueError('UID journal is closed.')
+            with self._locked_journal():
+                self._append(['V %d %d' % (uid, uid + self.step) for uid in sorted(uids)])
+        super(JournaledUidAllocator, self).void(uids)
+
+    def close(self):
+        r"""Record the unused UIDs as gaps, the uncommitted ones as void, and release the journal"""
+        with self._lock:
+            if self._journal is None:
+                return
+
+            gaps = []
+            if self._next < self._block_end:
+                gaps.append((self._next, self._block_end))
+            gaps.extend((uid, uid + self.step) for uid in sorted(self._requeued))
+            voided = [(uid, uid + self.step) for uid in sorted(self._granted)]
+            self._requeued = []
+            self._granted = set()
+            self._next = self._block_end = self.limit + 1
+
+            with self._locked_journal():
+                self._append(['G %d %d closed' % gap for gap in gaps] + ['V %d %d' % void for void in voided] +
+                             ['C %s' % self.owner])
+
+            self._journal.close()
+            self._journal = None
+
+    def gaps(self):
+        r"""List of (first, end, reason) tuples of UIDs that have been skipped"""
+        with self._lock:
+            if self._journal is not None:
+                # catch up with the gaps recorded by other processes
+                with self._locked_journal():
+                    pass
+            return list(self._gaps)
+
+    def voided(self):
+        r"""List of (first, end) tuples of UIDs that have been handed out but never committed"""
+        with self._lock:
+            if self._journal is not None:
+                with self._locked_journal():
+                    pass
+            return list(self._voided)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def _take_fresh(self, count):
+        uids = []
+        while len(uids) < count:
+            if self._next >= self._block_end and not self._reserve_block():
+                # other processes took the rest of the range
+                self._next = self._block_end = self.limit + 1
+                break
+
+            taken = min(count - len(uids), (self._block_end - self._next) // self.step)
+            uids.extend(range(self._next, self._next + taken * self.step, self.step))
+            self._next += taken * self.step
+
+        return uids
+
+    def _reserve_block(self):
+        if self._journal is None:
+            raise ValueError('UID journal is closed.')
+
+        with self._locked_journal():
+            first = max(self._next, self._high_water_mark)
+            count = min(self.block_size, (self.limit - first) // self.step + 1)
+            if count <= 0:
+                return False
+
+            end = first + count * self.step
+            self._append(['R %s %d %d' % (self.owner, first, end)])
+
+        self._next = first
+        self._block_end = end
+        return True
+
+    def _recover(self):
+        for owner, (first, end) in sorted(self._open_blocks.items()):
+            if owner != self.owner and not self._owner_alive(owner):
+                self._append(['G %d %d crashed' % (first, end), 'C %s' % owner])
+
+    @contextmanager
+    def _locked_journal(self):
+        r"""Lock the journal and catch up with the records written by other processes"""
+        fcntl.flock(self._journal.fileno(), fcntl.LOCK_EX)
+        try:
+            self._read_journal()
+            yield
+        finally:
+            fcntl.flock(self._journal.fileno(), fcntl.LOCK_UN)
+
+    def _read_journal(self):
+        self._journal.seek(self._journal_offset)
+        data = self._journal.read()
+        length = data.rfind(b'\n') + 1
+
+        if length < len(data):
+            # torn record left by a crash in the middle of a write (we hold the lock)
+            self._journal.truncate(self._journal_offset + length)
+
+        for line in data[:length].decode('ascii').splitlines():
+            self._apply(line.split())
+        self._journal_offset += length
+
+    def _append(self, records):
+        data = ''.join(record + '\n' for record in records).encode('ascii')
+        self._journal.seek(0, os.SEEK_END)
+        self._journal.write(data)
+        self._journal.flush()
+        os.fsync(self._journal.fileno())
+
+        for record in records:
+            self._apply(record.split())
+        self._journal_offset += len(data)
+
+    def _apply(self, record):
+        if record[0] == 'R':
+            first, end = int(record[2]), int(record[3])
+            self._open_blocks[record[1]] = (first, end)
+            self._high_water_mark = max(self._high_water_mark, end)
+        elif record[0] == 'G':
+            self._gaps.append((int(record[1]), int(record[2]), record[3]))
+        elif record[0] == 'V':
+            self._voided.append((int(record[1]), int(record[2])))
+        elif record[0] == 'C':
+            self._open_blocks.pop(record[1], None)
+
+    @classmethod
+    def _owner_alive(cls, owner):
+        pid, token, _ = owner.split(':')
+        pid = int(pid)
+
+        if pid != os.getpid():
+            try:
+                os.kill(pid, 0)
+            except OSError as e:
+                if e.errno != errno.EPERM:
+                    return False
+        # the pid might have been reused by a new process since the owner wrote its block
+        return token == cls._process_token(pid)
+
+    @staticmethod
+    def _process_token(pid):
+        r"""Start time of process `pid` (in clock ticks since boot), or '-' where unavailable"""
+        try:
+            with open('/proc/%d/stat' % pid) as stat:
+                # the command name (2nd field) might contain spaces; the start time is the 22nd field
+                return stat.read().rsplit(')', 1)[1].split()[19]
+        except (IOError, OSError, IndexError):
+            return '-'
@@ -0,0 +1,154 @@
+# Copyright (c) 2019 charlysan
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+r"""Measurements of an attached reader, used by `rfid_cli --bench`
+
+Every measurement runs `warmup` operations that are not recorded, then `repetitions` timed ones (the write
+measurements `write_warmup` and `write_repetitions`, every write wears the tag), and returns a dictionary with the latency statistics of the successful operations (seconds, see
+stats.LatencyHistogram.summary), the number of `errors` and the `rate` (successful operations per second).
+"""
+
+import usb.core
+
+from .compat import monotonic
+from .deadline import wait
+from .stats import LatencyHistogram
+
+
+class HardwareBench(object):
+    r"""Benchmark of a RfidHid device"""
+
+    # gaps (seconds) between two commands tried by `min_gap`, from the largest one
+    GAPS = (0.05, 0.02, 0.01, 0.005, 0.002, 0.001, 0)
+
+    def __init__(self, rfid, warmup=10, repetitions=100, write_warmup=0, write_repetitions=5, timeout=None,
+                 cancel=None, clock=monotonic):
+        r"""Arguments:
+        rfid -- RfidHid object
+        warmup -- Operations run (and ignored) before the measured ones
+        repetitions -- Measured operations
+        write_warmup -- Writes run (and ignored) before the measured ones by `write_verify`
+        write_repetitions -- Measured writes of `write_verify`
+        timeout -- Timeout in seconds for each USB transfer (defaults to the one set for the device)
+        cancel -- CancellationToken checked before every operation
+        """
+        self.rfid = rfid
+        self.warmup = warmup
+        self.repetitions = repetitions
+        self.write_warmup = write_warmup
+        self.write_repetitions = write_repetitions
+        self.timeout = timeout
+        self.cancel = cancel
+        self.clock = clock
+
+    def round_trip(self):
+        r"""Raw SET_REPORT + GET_REPORT of a read command, without parsing the response
+
+        A SET_REPORT that does not send the whole buffer is counted as an error, like RfidHid does.
+        """
+        hid = self.rfid.hid
+        buff = self.rfid._initialize_write_buffer([self.rfid.CMD_READ_TAG, 0x00, 0x00])
+        timeout = self.rfid._timeout_ms(self.timeout, None)
+
+        def transaction():
+            if hid.set_feature_report(1, buff, timeout=timeout) != self.rfid.BUFFER_SIZE:
+                raise ValueError('Communication Error.')
+            hid.get_feature_report(2, self.rfid.BUFFER_SIZE, timeout=timeout)
+
+        return self._measure(transaction)
+
+    def read_polls(self):
+        r"""RfidHid.read_tag() back to back. Run it with and without a tag close to the reader"""
+        return self._measure(lambda: self.rfid.read_tag(timeout=self.timeout, cancel=self.cancel))
+
+    def tag_present(self):
+        return self.rfid.read_tag(timeout=self.timeout, cancel=self.cancel).has_id_data()
+
+    def write_verify(self, tag_type, verify_delay=0.2):
+        r"""Write and read back the tag close to the reader, with its own CID and UID (the tag is not modified)
+
+        Runs `write_warmup` + `write_repetitions` writes. Failed verifications are counted as errors.
+        Raises ValueError if there is no tag.
+        """
+        payload_response = self.rfid.read_tag(timeout=self.timeout, cancel=self.cancel)
+        if not payload_response.has_id_data():
+            raise ValueError('No tag close to the reader.')
+        cid, uid = payload_response.get_tag_cid(), payload_response.get_tag_uid()
+
+        def write():
+            if not self.rfid.write_tag_and_verify(cid, uid, tag_type, verify_delay=verify_delay,
+                                                  timeout=self.timeout, cancel=self.cancel):
+                raise ValueError('Verification failed.')
+
+        return self._measure(write, self.write_warmup, self.write_repetitions)
+
+    def min_gap(self, gaps=GAPS):
+        r"""Find the minimum gap between two reads before errors ('Communication Error.') show up
+
+        `repetitions` reads are run for every gap, from the largest one. Returns a dictionary with
+        the errors of every gap tried and `min_gap`: the smallest gap such that neither it nor any
+        larger one had errors (None if the largest one already had errors).
+        """
+        results = []
+        min_gap = None
+        for gap in gaps:
+            errors = 0
+            for _ in range(self.repetitions):
+                wait(gap, cancel=self.cancel)
+                if not self._run(lambda: self.rfid.read_tag(timeout=self.timeout, cancel=self.cancel)):
+                    errors += 1
+            results.append({'gap': gap, 'errors': errors})
+            if errors:
+                break
+            min_gap = gap
+
+        return {'gaps': results, 'min_gap': min_gap}
+
+    def _measure(self, operation, warmup=None, repetitions=None):
+        warmup = self.warmup if warmup is None else warmup
+        repetitions = self.repetitions if repetitions is None else repetitions
+        for _ in range(warmup):
+            self._run(operation)
+
+        histogram = LatencyHistogram()
+        errors = 0
+        started = self.clock()
+        for _ in range(repetitions):
+            operation_started = self.clock()
+            if self._run(operation):
+                histogram.add(self.clock() - operation_started)
+            else:
+                errors += 1
+        elapsed = self.clock() - started
+
+        result = histogram.summary()
+        result['errors'] = errors
+        result['rate'] = histogram.count / elapsed if elapsed > 0 else None
+        return result
+
+    def _run(self, operation):
+        r"""Returns False if the operation failed (the device did not take the command, USB error or timeout)"""
+        if self.cancel is not None:
+            self.cancel.check()
+        try:
+            operation()
+            return True
+        except (ValueError, usb.core.USBError):
+            return False
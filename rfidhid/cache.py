@@ -0,0 +1,94 @@
+# Copyright (c) 2019 charlysan
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+r"""Bounded caches"""
+
+from collections import OrderedDict
+
+from .compat import monotonic
+
+
+class TtlCache(object):
+    r"""Set of keys that expire after `ttl` seconds, holding at most `max_size` keys
+
+    When the cache is full the least recently added key is evicted. All operations are O(1).
+    """
+
+    def __init__(self, max_size=1024, ttl=60, clock=monotonic):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.clock = clock
+        self._entries = OrderedDict()
+
+    def add(self, key):
+        r"""Add (or refresh) a key"""
+        self._entries.pop(key, None)
+        self._entries[key] = self.clock() + self.ttl
+
+        if len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def discard(self, key):
+        self._entries.pop(key, None)
+
+    def __contains__(self, key):
+        expires = self._entries.get(key)
+        if expires is None:
+            return False
+        if expires <= self.clock():
+            del self._entries[key]
+            return False
+        return True
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class LruCache(object):
+    r"""Mapping holding at most `max_size` keys
+
+    When the cache is full the least recently used key is evicted. All operations are O(1).
+    """
+
+    def __init__(self, max_size=1024):
+        self.max_size = max_size
+        self._entries = OrderedDict()
+
+    def get(self, key, default=None):
+        r"""Get the value of a key, marking it as recently used"""
+        try:
+            value = self._entries.pop(key)
+        except KeyError:
+            return default
+        self._entries[key] = value
+        return value
+
+    def put(self, key, value):
+        self._entries.pop(key, None)
+        self._entries[key] = value
+
+        if len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def __len__(self):
+        return len(self._entries)
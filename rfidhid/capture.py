@@ -0,0 +1,155 @@
+# Copyright (c) 2019 charlysan
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+r"""Columnar storage of the polls of a reader (see RfidHid.capture)
+
+The samples are written into preallocated columns: a NumPy structured array (dtype CAPTURE_DTYPE) when
+NumPy is installed, `array` module buffers otherwise. The summary helpers are vectorized with NumPy and
+fall back to plain loops.
+"""
+
+import bisect
+from array import array
+from collections import Counter
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+CAPTURE_DTYPE = [('timestamp', 'f8'), ('hit', '?'), ('cid', 'u1'), ('uid', 'u4'), ('crc', 'u1')]
+
+
+class Capture(object):
+    r"""Samples of a capture: seconds since its start, hit/miss flag, CID, UID and CRC (0 on a miss)
+
+    `errors` counts the polls that failed (USB error, timeout or 'Communication Error.'): they have no sample.
+    """
+
+    def __init__(self, max_samples, use_numpy=None):
+        r"""Arguments:
+        max_samples -- Number of samples preallocated
+        use_numpy -- Store the samples in a NumPy structured array (defaults to True if NumPy is installed)
+        """
+        self.max_samples = max_samples
+        self.use_numpy = numpy is not None if use_numpy is None else use_numpy
+        self.count = 0
+        self.errors = 0
+        self.duration = 0.0
+
+        if self.use_numpy:
+            self.samples = numpy.zeros(max_samples, dtype=CAPTURE_DTYPE)
+            self._columns = [self.samples[name] for name, _ in CAPTURE_DTYPE]
+        else:
+            self.samples = None
+            self._columns = [array('d', [0.0]) * max_samples, array('B', [0]) * max_samples,
+                             array('B', [0]) * max_samples, array('L', [0]) * max_samples,
+                             array('B', [0]) * max_samples]
+
+    def __len__(self):
+        return self.count
+
+    def append(self, timestamp, hit, cid=0, uid=0, crc=0):
+        index = self.count
+        timestamps, hits, cids, uids, crcs = self._columns
+        timestamps[index] = timestamp
+        hits[index] = hit
+        cids[index] = cid
+        uids[index] = uid
+        crcs[index] = crc
+        self.count = index + 1
+
+    @property
+    def timestamp(self):
+        return self._columns[0][:self.count]
+
+    @property
+    def hit(self):
+        return self._columns[1][:self.count]
+
+    @property
+    def cid(self):
+        return self._columns[2][:self.count]
+
+    @property
+    def uid(self):
+        return self._columns[3][:self.count]
+
+    @property
+    def crc(self):
+        return self._columns[4][:self.count]
+
+    def hit_rate(self):
+        r"""Share (0-1) of the polls that read a tag (None if there are no samples)"""
+        if not self.count:
+            return None
+        if self.use_numpy:
+            return float(numpy.count_nonzero(self.hit)) / self.count
+        return float(sum(self.hit)) / self.count
+
+    def polls_per_second(self):
+        return self.count / self.duration if self.duration > 0 else None
+
+    def gaps(self):
+        r"""Seconds between consecutive reads of a tag (hits)"""
+        if self.use_numpy:
+            return numpy.diff(self.timestamp[self.hit])
+        hits = [timestamp for timestamp, hit in zip(self.timestamp, self.hit) if hit]
+        return array('d', [current - previous for previous, current in zip(hits, hits[1:])])
+
+    def gap_histogram(self, bins):
+        r"""Histogram of the gaps between reads
+
+        `bins` is the sorted list of bin edges in seconds (e.g. [0, 0.01, 0.05, 0.1, 1]). Like numpy.histogram,
+        the last bin includes its right edge and gaps outside the edges are not counted.
+        Returns the list of counts, one per bin (len(bins) - 1).
+        """
+        gaps = self.gaps()
+        if self.use_numpy:
+            return numpy.histogram(gaps, bins=bins)[0].tolist()
+
+        counts = [0] * (len(bins) - 1)
+        for gap in gaps:
+            if bins[0] <= gap <= bins[-1]:
+                index = min(bisect.bisect_right(bins, gap) - 1, len(counts) - 1)
+                counts[index] += 1
+        return counts
+
+    def uid_counts(self):
+        r"""Number of reads of every tag: {(cid, uid): count}"""
+        if self.use_numpy:
+            keys = self.cid[self.hit].astype('u8') << numpy.uint64(32) | self.uid[self.hit]
+            values, counts = numpy.unique(keys, return_counts=True)
+            return dict(((int(value) >> 32, int(value) & 0xffffffff), int(count))
+                        for value, count in zip(values, counts))
+
+        return dict(Counter((cid, uid) for cid, uid, hit in zip(self.cid, self.uid, self.hit) if hit))
+
+    def summary(self, bins=(0, 0.01, 0.02, 0.05, 0.1, 0.2, 0.5, 1)):
+        r"""Dictionary with the samples, errors, polls per second, hit rate, gap histogram and per tag counts"""
+        return {
+            'samples': self.count,
+            'errors': self.errors,
+            'duration': self.duration,
+            'polls_per_second': self.polls_per_second(),
+            'hit_rate': self.hit_rate(),
+            'gap_histogram': {'bins': list(bins), 'counts': self.gap_histogram(list(bins))},
+            'uid_counts': self.uid_counts(),
+        }
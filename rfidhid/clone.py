@@ -0,0 +1,446 @@
+# Copyright (c) 2019 charlysan
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+r"""Hands-free cloning of a source tag to many target tags, and two-reader clone stations"""
+
+import threading
+from collections import namedtuple
+from time import sleep
+
+import usb.core
+
+from .core import RfidHid
+from .compat import monotonic, queue
+from .deadline import Deadline
+from .presence import wait_for_tag, wait_for_departure
+from .tagtype import write_tag_and_verify_auto
+from .usb_hid import device_gone
+
+# transfer errors that might go away on retry (USB errors, timeouts, 'Communication Error.')
+TRANSIENT_ERRORS = (usb.core.USBError, ValueError)
+
+
+CopyResult = namedtuple('CopyResult', ['ok', 'attempts', 'elapsed'])
+
+
+def write_copy(rfid, cid, uid, tag_type, type_detector, tag, verify_delay, deadline=None):
+    r"""Write and verify a copy, detecting the tag type with `type_detector` if set. Returns True if verified"""
+    if type_detector is None:
+        return rfid.write_tag_and_verify(cid, uid, tag_type=tag_type, verify_delay=verify_delay, deadline=deadline)
+    return write_tag_and_verify_auto(rfid, cid, uid, type_detector, tag=tag, verify_delay=verify_delay,
+                                     deadline=deadline) is not None
+
+
+def retry_transient(on_error, stop, interval, function, *args):
+    r"""Call function(*args) until it does not fail with a transient error
+
+    Every transient error is passed to on_error(e), then the call is retried after `interval` seconds.
+    Errors meaning the device is gone are raised.
+
+    Returns the result of the function, or None if `stop` (threading.Event, CancellationToken or None) has
+    been set while waiting to retry.
+    """
+    while True:
+        try:
+            return function(*args)
+        except TRANSIENT_ERRORS as e:
+            if device_gone(e):
+                raise
+            on_error(e)
+            if stop is None:
+                sleep(interval)
+            elif stop.wait(interval):
+                return None
+
+
+class BulkCloner(object):
+    r"""Write the same CID and UID to every tag placed close to the reader
+
+    Tags are detected automatically: as soon as a tag arrives it is written and verified, and the
+    next one is expected once it has been taken away. Tags already carrying the source CID and UID
+    (e.g. the source tag itself) are ignored.
+
+    Transient USB errors are counted (`errors`) and the step that failed is retried; a write that fails
+    with one is a failed attempt, and the tag is reported as a failed copy once `retries` attempts have
+    failed. Only errors meaning the device is gone stop the run (they are raised).
+    """
+
+    def __init__(self, rfid, cid, uid, tag_type=RfidHid.TAG_EM4305, copies=None, read_interval=0.1,
+                 verify_delay=0.2, misses=2, retries=2, beep=False, on_copy=None, stop=None, deadline=None,
+                 type_detector=None):
+        r"""Arguments:
+        rfid -- RfidHid object used to write the tags
+        cid, uid -- CID and UID read from the source tag
+        tag_type -- Tag type of the copies (ignored if `type_detector` is set)
+        copies -- Number of verified copies to produce (None for no limit)
+        misses -- Consecutive reads without a tag required to consider it taken away
+        retries -- Write attempts on the same tag
+        on_copy -- Callable invoked as on_copy(result) with a CopyResult after every target tag
+        stop -- threading.Event (or CancellationToken) used to stop cloning
+        deadline -- Deadline object (or seconds from now) for the whole run. Raises DeadlineExceededError.
+        type_detector -- TagTypeDetector used to detect the type of every target tag (see `tagtype.py`)
+        """
+        self.rfid = rfid
+        self.cid = cid
+        self.uid = uid
+        self.tag_type = tag_type
+        self.copies = copies
+        self.read_interval = read_interval
+        self.verify_delay = verify_delay
+        self.misses = misses
+        self.retries = retries
+        self.beep = beep
+        self.on_copy = on_copy
+        self.stop = stop
+        self.deadline = Deadline.from_value(deadline)
+        self.type_detector = type_detector
+        self.results = []
+        self.errors = 0
+        self.last_error = None
+
+    def run(self):
+        r"""Clone tags until the number of copies has been reached (or `stop` is set)
+
+        Returns the list of CopyResult
+        """
+        # the source tag might still be close to the reader
+        if not self._retry(wait_for_departure, self.rfid, self.read_interval, self.misses, self.stop,
+                           self.deadline):
+            return self.results
+
+        while self.copies is None or self.copied() < self.copies:
+            payload_response = self._retry(wait_for_tag, self.rfid, self.read_interval, self.stop, self.deadline)
+            if payload_response is None:
+                break
+
+            tag = (payload_response.get_tag_cid(), payload_response.get_tag_uid())
+            if tag != (self.cid, self.uid):
+                self._copy(tag)
+
+            if not self._retry(wait_for_departure, self.rfid, self.read_interval, self.misses, self.stop,
+                               self.deadline):
+                break
+
+        return self.results
+
+    def copied(self):
+        r"""Number of verified copies"""
+        return sum(1 for result in self.results if result.ok)
+
+    def stats(self):
+        r"""Copy counters and per-copy time (arrival to verified) in seconds"""
+        elapsed = [result.elapsed for result in self.results if result.ok]
+
+        return {
+            'copied': len(elapsed),
+            'failed': len(self.results) - len(elapsed),
+            'errors': self.errors,
+            'min': min(elapsed) if elapsed else 0.0,
+            'avg': sum(elapsed) / len(elapsed) if elapsed else 0.0,
+            'max': max(elapsed) if elapsed else 0.0,
+        }
+
+    def _copy(self, tag):
+        started = monotonic()
+        ok = False
+        attempts = 0
+
+        while not ok and attempts < self.retries:
+            attempts += 1
+            try:
+                ok = write_copy(self.rfid, self.cid, self.uid, self.tag_type, self.type_detector, tag,
+                                self.verify_delay, self.deadline)
+            except TRANSIENT_ERRORS as e:
+                if device_gone(e):
+                    raise
+                self._count_error(e)
+
+        result = CopyResult(ok, attempts, monotonic() - started)
+        self.results.append(result)
+
+        if ok and self.beep:
+            self._retry(self.rfid.beep, 2, None, self.deadline)
+        if self.on_copy:
+            self.on_copy(result)
+
+        return result
+
+    def _retry(self, function, *args):
+        return retry_transient(self._count_error, self.stop, self.read_interval, function, *args)
+
+    def _count_error(self, e):
+        r"""Count a transient USB error, timeout or 'Communication Error.'"""
+        self.errors += 1
+        self.last_error = e
+
+
+class CloneStation(object):
+    r"""Pipelined clone station pairing a source reader and a writer device
+
+    The source stage reads master badges and queues their CID and UID; the writer stage takes them from
+    the queue and writes and verifies a copy (`copies_per_source` copies) on every blank tag placed on the
+    writer. Both stages run concurrently on their own thread, so the next master can be staged while the
+    previous copy is being encoded. The queue is bounded: the source stage waits when it is full.
+
+    Tags placed on the writer that already carry the CID and UID to copy are ignored. A failed copy is
+    retried on the next tag placed on the writer.
+
+    Transient USB errors are counted (`errors`) and the step that failed is retried; a write that fails
+    with one is a failed attempt. Only errors meaning a device is gone stop the station (`error`).
+    """
+
+    # share of the elapsed time a stage can wait on the other one with the station still balanced
+    BALANCED_RATIO = 0.01
+
+    def __init__(self, source, writer, tag_type=RfidHid.TAG_EM4305, queue_size=4, copies_per_source=1,
+                 read_interval=0.1, verify_delay=0.2, misses=2, retries=2, beep=False, on_source=None,
+                 on_copy=None, stop=None, type_detector=None):
+        r"""Arguments:
+        source -- RfidHid object reading the master badges
+        writer -- RfidHid object writing the copies
+        tag_type -- Tag type of the copies (ignored if `type_detector` is set)
+        queue_size -- Master badges read and not yet copied that can be waiting in the queue
+        copies_per_source -- Verified copies of every master badge
+        misses -- Consecutive reads without a tag required to consider it taken away
+        retries -- Write attempts on the same tag
+        on_source -- Callable invoked as on_source(cid, uid) after every master badge queued
+        on_copy -- Callable invoked as on_copy(cid, uid, result) with a CopyResult after every target tag
+        stop -- threading.Event (or CancellationToken) used to stop the station
+        type_detector -- TagTypeDetector used to detect the type of every target tag (see `tagtype.py`).
+                         Only the writer stage uses it.
+        """
+        self.source = source
+        self.writer = writer
+        self.tag_type = tag_type
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.copies_per_source = copies_per_source
+        self.read_interval = read_interval
+        self.verify_delay = verify_delay
+        self.misses = misses
+        self.retries = retries
+        self.beep = beep
+        self.on_source = on_source
+        self.on_copy = on_copy
+        self.type_detector = type_detector
+
+        self.results = []
+        self.sources_read = 0
+        self.source_blocked = 0.0
+        self.writer_starved = 0.0
+        self.writer_waiting = 0.0
+        self.writer_busy = 0.0
+        self.max_queued = 0
+        self.errors = 0
+        self.last_error = None
+        self.error = None
+        self.started_at = None
+        self.stopped_at = None
+        self._stop_event = stop if stop is not None else threading.Event()
+        self._threads = [threading.Thread(target=self._run_stage, args=(self._read_sources,), name='clone-source'),
+                         threading.Thread(target=self._run_stage, args=(self._write_copies,), name='clone-writer')]
+        for thread in self._threads:
+            thread.daemon = True
+
+    def start(self):
+        self.started_at = monotonic()
+        for thread in self._threads:
+            thread.start()
+
+    def stop(self):
+        r"""Ask both stages to finish. Master badges still queued are not copied"""
+        self._stop_event.set()
+
+    def join(self, timeout=None):
+        for thread in self._threads:
+            thread.join(timeout)
+        if not self.is_alive() and self.stopped_at is None:
+            self.stopped_at = monotonic()
+
+    def is_alive(self):
+        return any(thread.is_alive() for thread in self._threads)
+
+    def stats(self):
+        r"""Per-stage counters and throughput, and the stage limiting the station
+
+        `source.blocked` is the time the source stage waited for room in the queue (the writer is slower),
+        and `writer.starved` the time the writer stage waited for a master badge (the source is slower).
+        `writer.waiting` is the time the writer stage waited for a blank tag to be placed, and `writer.busy`
+        the time spent encoding.
+
+        `bottleneck` is 'source' or 'writer', 'blanks' when the writer is the slower stage because it mostly
+        waited for blank tags rather than encoded, 'balanced' when neither stage waited on the other for more
+        than `BALANCED_RATIO` of the elapsed time, and 'none' if the station has not run.
+        """
+        elapsed = (self.stopped_at or monotonic()) - self.started_at if self.started_at is not None else 0.0
+        copied = sum(1 for result in self.results if result.ok)
+        encode_times = [result.elapsed for result in self.results]
+
+        def per_hour(count):
+            return count * 3600.0 / elapsed if elapsed else 0.0
+
+        return {
+            'elapsed': elapsed,
+            'queued': self.queue.qsize(),
+            'max_queued': self.max_queued,
+            'source': {
+                'read': self.sources_read,
+                'per_hour': per_hour(self.sources_read),
+                'blocked': self.source_blocked,
+            },
+            'writer': {
+                'copied': copied,
+                'failed': len(self.results) - copied,
+                'per_hour': per_hour(copied),
+                'busy': self.writer_busy,
+                'starved': self.writer_starved,
+                'waiting': self.writer_waiting,
+                'avg': sum(encode_times) / len(encode_times) if encode_times else 0.0,
+            },
+            'errors': self.errors,
+            'bottleneck': self._bottleneck(elapsed),
+        }
+
+    def _bottleneck(self, elapsed):
+        if not elapsed:
+            return 'none'
+        if max(self.source_blocked, self.writer_starved) <= elapsed * self.BALANCED_RATIO:
+            return 'balanced'
+        if self.source_blocked > self.writer_starved:
+            return 'blanks' if self.writer_waiting > self.writer_busy else 'writer'
+        return 'source'
+
+    def _run_stage(self, stage):
+        try:
+            stage()
+        except Exception as e:
+            self.error = e
+            # the other stage cannot make progress on its own
+            self._stop_event.set()
+
+    def _retry(self, function, *args):
+        return retry_transient(self._count_error, self._stop_event, self.read_interval, function, *args)
+
+    def _count_error(self, e):
+        r"""Count a transient USB error, timeout or 'Communication Error.'"""
+        self.errors += 1
+        self.last_error = e
+
+    def _read_sources(self):
+        stop = self._stop_event
+        while not stop.is_set():
+            payload_response = self._retry(wait_for_tag, self.source, self.read_interval, stop)
+            if payload_response is None:
+                break
+
+            cid, uid = payload_response.get_tag_cid(), payload_response.get_tag_uid()
+            if not self._put((cid, uid)):
+                break
+            self.sources_read += 1
+
+            if self.on_source:
+                self.on_source(cid, uid)
+            if self.beep:
+                self._retry(self.source.beep)
+
+            if not self._retry(wait_for_departure, self.source, self.read_interval, self.misses, stop):
+                break
+
+    def _write_copies(self):
+        while not self._stop_event.is_set():
+            tag = self._get()
+            if tag is None:
+                break
+
+            copied = 0
+            while copied < self.copies_per_source:
+                result = self._copy(*tag)
+                if result is None:
+                    return
+                if result.ok:
+                    copied += 1
+
+    def _put(self, tag):
+        r"""Queue a master badge, waiting for room. Returns False if the station has been stopped"""
+        started = monotonic()
+        try:
+            while not self._stop_event.is_set():
+                try:
+                    self.queue.put(tag, timeout=self.read_interval)
+                    self.max_queued = max(self.max_queued, self.queue.qsize())
+                    return True
+                except queue.Full:
+                    pass
+            return False
+        finally:
+            self.source_blocked += monotonic() - started
+
+    def _get(self):
+        r"""Take the next master badge, waiting for one. Returns None if the station has been stopped"""
+        started = monotonic()
+        try:
+            while not self._stop_event.is_set():
+                try:
+                    return self.queue.get(timeout=self.read_interval)
+                except queue.Empty:
+                    pass
+            return None
+        finally:
+            self.writer_starved += monotonic() - started
+
+    def _copy(self, cid, uid):
+        r"""Copy to the next blank tag placed on the writer. Returns the CopyResult, or None if stopped"""
+        stop = self._stop_event
+        started = monotonic()
+        try:
+            while True:
+                payload_response = self._retry(wait_for_tag, self.writer, self.read_interval, stop)
+                if payload_response is None:
+                    return None
+                tag = (payload_response.get_tag_cid(), payload_response.get_tag_uid())
+                if tag != (cid, uid):
+                    break
+                if not self._retry(wait_for_departure, self.writer, self.read_interval, self.misses, stop):
+                    return None
+        finally:
+            self.writer_waiting += monotonic() - started
+
+        started = monotonic()
+        ok = False
+        attempts = 0
+        while not ok and attempts < self.retries:
+            attempts += 1
+            try:
+                ok = write_copy(self.writer, cid, uid, self.tag_type, self.type_detector, tag, self.verify_delay)
+            except TRANSIENT_ERRORS as e:
+                if device_gone(e):
+                    raise
+                self._count_error(e)
+
+        result = CopyResult(ok, attempts, monotonic() - started)
+        self.writer_busy += result.elapsed
+        self.results.append(result)
+
+        if ok and self.beep:
+            self._retry(self.writer.beep, 2)
+        if self.on_copy:
+            self.on_copy(cid, uid, result)
+
+        self._retry(wait_for_departure, self.writer, self.read_interval, self.misses, stop)
+        return result
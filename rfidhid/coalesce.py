@@ -0,0 +1,167 @@
+# Copyright (c) 2019 charlysan
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+r"""Single-flight coalescing of the reads of a device shared by several consumers
+
+Every RfidHid.read_tag() is a SET_REPORT/GET_REPORT round trip. When several threads poll the same
+reader, `CoalescingReader` runs at most one read at a time: the reads requested while one is in
+flight wait for it and get the same PayloadResponse, and so do the reads requested within `freshness`
+seconds after it has completed.
+
+E.g.
+    reader = CoalescingReader(RfidHid(), freshness=0.01)
+    # from any number of threads
+    payload_response = reader.read_tag()
+"""
+
+import threading
+
+from .compat import monotonic
+from .deadline import Deadline, DeadlineExceededError, OperationCancelledError, RfidTimeoutError
+from .session import Future
+
+
+class CoalescingReader(object):
+    r"""Wraps a RfidHid so that concurrent reads share one USB transaction
+
+    Only `read_tag` is coalesced. The write methods drop the last read (the tag has changed) and every
+    other attribute is the one of the wrapped RfidHid. Transfers other than reads are not serialized:
+    use a RfidSession for that.
+
+    Counters:
+    hits -- reads answered without a USB transaction (the transactions saved)
+    misses -- reads that did a USB transaction
+    """
+
+    def __init__(self, rfid, freshness=0, clock=monotonic):
+        r"""Arguments:
+        rfid -- RfidHid (or compatible) object
+        freshness -- Seconds during which the result of a completed read is returned to the following reads.
+                     0 only coalesces the reads requested while one is in flight.
+        clock -- Function returning the current time in seconds
+        """
+        self.rfid = rfid
+        self.freshness = freshness
+        self.clock = clock
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._in_flight = None
+        self._last = None
+        self._last_time = None
+        # bumped by invalidate(): a read started before a write must not be kept as the last read
+        self._generation = 0
+
+    def __getattr__(self, name):
+        return getattr(self.rfid, name)
+
+    def read_tag(self, timeout=None, deadline=None, cancel=None):
+        r"""Read a tag, or join the read in flight (or the fresh one)
+
+        The arguments are the ones of RfidHid.read_tag(). A read that joins another one shares its
+        outcome (PayloadResponse or exception), but still honors its own `deadline` and `cancel`
+        while waiting. If the read it joined was stopped by the deadline or the cancellation token of
+        the thread that started it, the joined read is retried. The returned PayloadResponse is shared:
+        do not modify it.
+        """
+        if cancel is not None:
+            cancel.check()
+        deadline = Deadline.from_value(deadline)
+
+        while True:
+            with self._lock:
+                if self._last is not None and self.clock() - self._last_time <= self.freshness:
+                    self.hits += 1
+                    return self._last
+
+                flight = self._in_flight
+                if flight is None:
+                    self.misses += 1
+                    flight = self._in_flight = Future()
+                    generation = self._generation
+                    leader = True
+                else:
+                    leader = False
+
+            if leader:
+                return self._lead(flight, generation, timeout, deadline, cancel)
+
+            self._join(flight, deadline, cancel)
+            if isinstance(flight.exception(), (DeadlineExceededError, OperationCancelledError)):
+                # the other thread gave up, the device did not fail: start (or join) a new read
+                continue
+
+            with self._lock:
+                self.hits += 1
+            return flight.result()
+
+    def invalidate(self):
+        r"""Drop the last read, so the next read does a USB transaction"""
+        with self._lock:
+            self._last = None
+            self._generation += 1
+
+    def write_tag(self, *args, **kwargs):
+        self.invalidate()
+        return self.rfid.write_tag(*args, **kwargs)
+
+    def write_tag_from_cid_and_uid(self, *args, **kwargs):
+        self.invalidate()
+        return self.rfid.write_tag_from_cid_and_uid(*args, **kwargs)
+
+    def write_tag_and_verify(self, *args, **kwargs):
+        self.invalidate()
+        return self.rfid.write_tag_and_verify(*args, **kwargs)
+
+    def _lead(self, flight, generation, timeout, deadline, cancel):
+        try:
+            payload_response = self.rfid.read_tag(timeout=timeout, deadline=deadline, cancel=cancel)
+        except Exception as e:
+            with self._lock:
+                self._in_flight = None
+            flight.set_exception(e)
+            raise
+
+        with self._lock:
+            self._in_flight = None
+            # the tag was written while the read was in flight: its result might already be stale
+            if generation == self._generation:
+                self._last = payload_response
+                self._last_time = self.clock()
+        flight.set_result(payload_response)
+
+        return payload_response
+
+    @staticmethod
+    def _join(flight, deadline, cancel):
+        r"""Wait until the read in flight is done"""
+        # wake up regularly to honor the cancellation token
+        while True:
+            if cancel is not None:
+                cancel.check()
+            wait_time = 0.05 if deadline is None else min(0.05, deadline.remaining())
+            try:
+                flight.exception(timeout=wait_time)
+            except RfidTimeoutError:
+                # still in flight
+                if deadline is not None and deadline.expired():
+                    raise DeadlineExceededError('Deadline exceeded.')
+                continue
+            return
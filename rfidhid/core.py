@@ -19,9 +19,13 @@
 # SOFTWARE.
 
 
-from time import sleep
+import math
 import struct
+import usb.core
 from . import usb_hid
+from .compat import monotonic
+from .deadline import Deadline, DeadlineExceededError, wait
+from .sink import EVENT_READ, EVENT_WRITE, tag_event
 
 
 class RfidHid(object):
@@ -41,32 +45,85 @@ class RfidHid(object):
 
     BUFFER_SIZE = 256
 
-    def __init__(self, vendor_id=DEVICE_DEFAULT_VID, product_id=DEVICE_DEFAULT_PID):
+    report_descriptor = None
+
+    def __init__(self, vendor_id=DEVICE_DEFAULT_VID, product_id=DEVICE_DEFAULT_PID, hid=None, timeout=None,
+                 sink=None, name=None, port_path=None, serial=None):
         r"""Open the device using vid and pid
 
         If no arguments are supplied then the default vid and pid will be used.
+
+        Arguments:
+        hid -- An already opened `usb_hid.HID` (or compatible) object. If supplied vid and pid are ignored.
+        port_path -- Open the device plugged at this USB port path (e.g. '1-1.2'). See `usb_hid.HID`
+        serial -- Open the device with this serial number
+        timeout -- Default timeout in seconds for every USB transfer (None: pyusb default)
+        sink -- Object (e.g. sink.SqliteSink) whose `record` method is called with a sink.TagEvent for
+                every tag read and every tag written
+        name -- Name of the device reported in the events
+        """
+        self.hid = hid if hid is not None else usb_hid.HID(
+            vendor_id, product_id, port_path=port_path, serial=serial)
+        self.timeout = timeout
+        self.sink = sink
+        self.name = name
+
+    @classmethod
+    def find_all(cls, vendor_id=DEVICE_DEFAULT_VID, product_id=DEVICE_DEFAULT_PID, timeout=None, sink=None):
+        r"""Open every attached device matching vid and pid
+
+        Returns a list of RfidHid objects (empty if no device is found)
         """
-        self.hid = usb_hid.HID(vendor_id, product_id)
+        return [cls(hid=hid, timeout=timeout, sink=sink)
+                for hid in usb_hid.HID.find_all(vendor_id, product_id)]
 
-    def init(self):
+    def init(self, timeout=None, force=False):
         r"""Initialize the device
 
         This method should be use to initialize the device in case the OS does not find it.
         Issuing a `sudo lsusb -vd vid:pid` should produce the same result.
+
+        The report descriptor is only fetched the first time (unless `force` is set): once the device
+        has been initialized this method is a no-op that returns the cached descriptor.
+        Use `wait_ready` to wait until the device answers commands.
         """
+        if self.report_descriptor is not None and not force:
+            return self.report_descriptor
+
         desc = self.hid.get_report_descriptor(
-            self.DEVICE_HID_REPORT_DESCRIPTOR_SIZE)
+            self.DEVICE_HID_REPORT_DESCRIPTOR_SIZE, timeout=self._timeout_ms(timeout, None))
 
         if not desc:
             raise ValueError("Cannot initialize Device.")
 
+        self.report_descriptor = desc
         return desc
 
-    def beep(self, times=1):
+    def wait_ready(self, timeout=2, interval=0.01, cancel=None):
+        r"""Wait until the device answers a command, e.g. after `init`
+
+        The device is polled with a read command every `interval` seconds.
+
+        Returns the seconds waited. Raises DeadlineExceededError if the device is not ready within `timeout`.
+        """
+        started = monotonic()
+        deadline = Deadline(timeout)
+
+        while True:
+            try:
+                self._read(None, deadline, cancel)
+                return monotonic() - started
+            except DeadlineExceededError:
+                raise
+            except (usb.core.USBError, ValueError):
+                wait(interval, deadline, cancel)
+
+    def beep(self, times=1, timeout=None, deadline=None, cancel=None):
         r"""Send a command to make the device to emit a "beep"
 
         Arguments:
         times -- Number of "beeps" to emit
+        timeout, deadline, cancel -- See `read_tag`
         """
         payload = [0x00] * 0x03
 
@@ -76,41 +133,41 @@ class RfidHid(object):
 
         buff = self._initialize_write_buffer(payload)
 
+        deadline = Deadline.from_value(deadline)
         for _ in range(0, times):
-            self.hid.set_feature_report(1, buff)
-            sleep(0.2)
+            self._set_report(buff, timeout, deadline, cancel)
+            wait(0.2, deadline, cancel)
 
-    def read_tag(self):
+    def read_tag(self, timeout=None, deadline=None, cancel=None):
         r"""Send a command to "read a tag" and retrieve the response from the device.
 
+        Arguments:
+        timeout -- Timeout in seconds for each USB transfer (defaults to the one set for the device).
+                   Raises usb_hid.TransferTimeoutError when exceeded.
+        deadline -- Deadline object (or seconds from now) by which the whole operation must complete.
+                    Raises DeadlineExceededError when exceeded.
+        cancel -- CancellationToken checked before every USB transfer. Raises OperationCancelledError.
+
         Returns a PayloadResponse object
         """
-        payload = [0x00] * 0x03
+        payload_response = self._read(timeout, Deadline.from_value(deadline), cancel)
 
-        # Setup payload for reading operation
-        payload[0x00] = self.CMD_READ_TAG
-
-        buff = self._initialize_write_buffer(payload)
-
-        # Write Feature Report 1
-        response = self.hid.set_feature_report(1, buff)
-
-        if response != self.BUFFER_SIZE:
-            raise ValueError('Communication Error.')
-
-        # Read from Feature Report 2
-        response = self.hid.get_feature_report(2, self.BUFFER_SIZE).tolist()
+        if self.sink is not None and payload_response.has_id_data():
+            self.sink.record(tag_event(EVENT_READ, payload_response.get_tag_cid(), payload_response.get_tag_uid(),
+                                       reader=self.name))
 
-        return PayloadResponse(response)
+        return payload_response
 
-    def write_tag(self, id_bytes, tag_type=TAG_EM4305):
+    def write_tag(self, id_bytes, tag_type=TAG_EM4305, timeout=None, deadline=None, cancel=None):
         r"""Send a command to "write a tag" 
 
         Arguments:
         id_bytes (list) -- Customer ID + UID to be written in binary byte format.
                            Format: [cid, uid_b3, uid_b2, uid_b1, uid_b0]
         tag_type (int)  -- Tag Type (EM4305 or T5577)
+        timeout, deadline, cancel -- See `read_tag`
         """
+        deadline = Deadline.from_value(deadline)
         payload = [0x00] * 0x1a
 
         # Payload containing CID, UID and CRC
@@ -129,10 +186,10 @@ class RfidHid(object):
         buff[0x06] = 0x1f  # Override 0x08 with 0x1f for write operation
 
         # Write to Feature Report 1
-        self.hid.set_feature_report(1, buff)
+        self._set_report(buff, timeout, deadline, cancel)
 
         # Read from Feature Report 2
-        response = self.hid.get_feature_report(2, self.BUFFER_SIZE)
+        response = self._get_report(timeout, deadline, cancel)
 
         # T5577 tags cannot be read after a write operation without taking them out
         # of the field before. A workaround is to send a "beep" command with buff[0x0c] = 0x05
@@ -146,16 +203,21 @@ class RfidHid(object):
         buff = self._initialize_write_buffer(payload)
 
         # Write to Feature Report 1
-        self.hid.set_feature_report(1, buff)
+        self._set_report(buff, timeout, deadline, cancel)
+
+        if self.sink is not None:
+            uid = (id_bytes[1] << 24) | (id_bytes[2] << 16) | (id_bytes[3] << 8) | id_bytes[4]
+            self.sink.record(tag_event(EVENT_WRITE, id_bytes[0], uid, tag_type, self.name))
 
         return response
 
-    def write_tag_from_cid_and_uid(self, cid, uid, tag_type=TAG_EM4305):
+    def write_tag_from_cid_and_uid(self, cid, uid, tag_type=TAG_EM4305, timeout=None, deadline=None, cancel=None):
         r"""Send a command to "write a tag" 
 
         Arguments:
         cid -- (32 bits Integer) Customer ID
         uid -- (8 bits Integer)  UID
+        timeout, deadline, cancel -- See `read_tag`
         """
         packed_uid = struct.pack('>I', uid)
 
@@ -166,7 +228,129 @@ class RfidHid(object):
             # python 3
             ids_bytes = [cid] + list(packed_uid)
 
-        return self.write_tag(ids_bytes, tag_type)
+        return self.write_tag(ids_bytes, tag_type, timeout, deadline, cancel)
+
+    def write_tag_and_verify(self, cid, uid, tag_type=TAG_EM4305, verify_delay=0.2, timeout=None, deadline=None,
+                             cancel=None):
+        r"""Write a tag and read it back
+
+        Arguments:
+        cid -- (8 bits Integer) Customer ID
+        uid -- (32 bits Integer)  UID
+        verify_delay -- Seconds to wait before reading the tag back (it cannot be read right after a write)
+        timeout, deadline, cancel -- See `read_tag`
+
+        Returns True if the tag carries the written CID and UID
+        """
+        deadline = Deadline.from_value(deadline)
+        self.write_tag_from_cid_and_uid(cid, uid, tag_type, timeout, deadline, cancel)
+        wait(verify_delay, deadline, cancel)
+        payload_response = self.read_tag(timeout, deadline, cancel)
+
+        return payload_response.get_tag_cid() == cid and payload_response.get_tag_uid() == uid
+
+    def capture(self, duration=None, max_samples=100000, timeout=None, cancel=None, use_numpy=None, clock=monotonic):
+        r"""Poll the device as fast as possible and store every poll in a capture.Capture (site surveys)
+
+        The responses are decoded straight into the preallocated columns of the capture: no PayloadResponse
+        is created and nothing is recorded to the sink. Failed polls are counted in `errors`.
+
+        Arguments:
+        duration -- Seconds to poll for (None: until `max_samples` polls)
+        max_samples -- Maximum number of polls (failed ones included)
+        timeout -- Timeout in seconds for each USB transfer (defaults to the one set for the device)
+        cancel -- CancellationToken checked before every poll. Raises OperationCancelledError.
+        use_numpy -- See capture.Capture
+
+        Returns a capture.Capture object
+        """
+        # imported here: NumPy takes a while to import and only captures use it
+        from .capture import Capture
+
+        samples = Capture(max_samples, use_numpy=use_numpy)
+        buff = self._initialize_write_buffer([self.CMD_READ_TAG, 0x00, 0x00])
+        timeout_ms = self._timeout_ms(timeout, None)
+        set_feature_report, get_feature_report = self.hid.set_feature_report, self.hid.get_feature_report
+        length_with_tag = PayloadResponse.RESPONSE_LENGTH_WITH_TAG
+        cid_pos, uid_pos, crc_pos = PayloadResponse.CID_POS, PayloadResponse.UID_MSB_POS, PayloadResponse.CRC_READ_POS
+
+        started = clock()
+        end = None if duration is None else started + duration
+        while samples.count + samples.errors < max_samples:
+            if cancel is not None:
+                cancel.check()
+            now = clock()
+            if end is not None and now >= end:
+                break
+
+            try:
+                if set_feature_report(1, buff, timeout=timeout_ms) != self.BUFFER_SIZE:
+                    raise ValueError('Communication Error.')
+                response = get_feature_report(2, self.BUFFER_SIZE, timeout=timeout_ms)
+            except (ValueError, usb.core.USBError):
+                samples.errors += 1
+                continue
+
+            if len(response) == length_with_tag:
+                samples.append(now - started, True, response[cid_pos],
+                               response[uid_pos] << 24 | response[uid_pos + 1] << 16 |
+                               response[uid_pos + 2] << 8 | response[uid_pos + 3],
+                               response[crc_pos])
+            else:
+                samples.append(now - started, False)
+
+        samples.duration = clock() - started
+        return samples
+
+    def _read(self, timeout, deadline, cancel):
+        r"""Send a read command and return the PayloadResponse"""
+        payload = [0x00] * 0x03
+
+        # Setup payload for reading operation
+        payload[0x00] = self.CMD_READ_TAG
+
+        buff = self._initialize_write_buffer(payload)
+
+        # Write Feature Report 1
+        response = self._set_report(buff, timeout, deadline, cancel)
+
+        if response != self.BUFFER_SIZE:
+            raise ValueError('Communication Error.')
+
+        # Read from Feature Report 2
+        response = self._get_report(timeout, deadline, cancel).tolist()
+
+        return PayloadResponse(response)
+
+    def _set_report(self, buff, timeout, deadline, cancel):
+        r"""Write Feature Report 1 honoring timeout, deadline and cancellation"""
+        return self._transfer(self.hid.set_feature_report, 1, buff, timeout, deadline, cancel)
+
+    def _get_report(self, timeout, deadline, cancel):
+        r"""Read Feature Report 2 honoring timeout, deadline and cancellation"""
+        return self._transfer(self.hid.get_feature_report, 2, self.BUFFER_SIZE, timeout, deadline, cancel)
+
+    def _transfer(self, method, report_number, data, timeout, deadline, cancel):
+        if cancel is not None:
+            cancel.check()
+        if deadline is not None:
+            deadline.check()
+
+        try:
+            return method(report_number, data, timeout=self._timeout_ms(timeout, deadline))
+        except usb_hid.TransferTimeoutError:
+            if deadline is not None and deadline.expired():
+                raise DeadlineExceededError('Deadline exceeded.')
+            raise
+
+    def _timeout_ms(self, timeout, deadline):
+        r"""Timeout of the next transfer in milliseconds: the per-call (or per-device) one, bounded by the deadline"""
+        if timeout is None:
+            timeout = self.timeout
+        if deadline is not None:
+            timeout = deadline.remaining() if timeout is None else min(timeout, deadline.remaining())
+
+        return None if timeout is None else max(1, int(math.ceil(timeout * 1000)))
 
     @staticmethod
     def _calculate_crc_sum(payload_data, init_val=0):
@@ -0,0 +1,117 @@
+# Copyright (c) 2019 charlysan
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+r"""Deadlines, cancellation and the exceptions raised when they are hit"""
+
+import threading
+from time import sleep
+
+from .compat import monotonic
+
+
+class RfidTimeoutError(Exception):
+    r"""Base class of the errors raised when an operation takes too long"""
+
+
+class DeadlineExceededError(RfidTimeoutError):
+    r"""Raised when an operation cannot complete before its deadline"""
+
+
+class OperationCancelledError(Exception):
+    r"""Raised when an operation is cancelled through a CancellationToken"""
+
+
+class Deadline(object):
+    r"""Point in time (monotonic clock) by which an operation must complete"""
+
+    def __init__(self, timeout, clock=monotonic):
+        r"""Arguments:
+        timeout -- Seconds from now
+        """
+        self.clock = clock
+        self.expires_at = clock() + timeout
+
+    @classmethod
+    def from_value(cls, value):
+        r"""Get a Deadline from a Deadline object, a number of seconds from now, or None"""
+        if value is None or isinstance(value, Deadline):
+            return value
+        return cls(value)
+
+    def remaining(self):
+        r"""Seconds left (0 once expired)"""
+        return max(0.0, self.expires_at - self.clock())
+
+    def expired(self):
+        return self.clock() >= self.expires_at
+
+    def check(self):
+        r"""Raise DeadlineExceededError if the deadline has expired"""
+        if self.expired():
+            raise DeadlineExceededError('Deadline exceeded.')
+
+
+class CancellationToken(object):
+    r"""Flag shared with long running operations to ask them to stop
+
+    It can be used wherever a `stop` threading.Event is accepted.
+    """
+
+    def __init__(self):
+        self._event = threading.Event()
+
+    def cancel(self):
+        self._event.set()
+
+    def is_cancelled(self):
+        return self._event.is_set()
+
+    # threading.Event interface
+    set = cancel
+    is_set = is_cancelled
+
+    def wait(self, timeout=None):
+        r"""Wait until cancelled or `timeout` seconds have elapsed. Returns True if cancelled"""
+        self._event.wait(timeout)
+        return self._event.is_set()
+
+    def check(self):
+        r"""Raise OperationCancelledError if the token has been cancelled"""
+        if self.is_cancelled():
+            raise OperationCancelledError('Operation cancelled.')
+
+
+def wait(seconds, deadline=None, cancel=None):
+    r"""Sleep for `seconds`, but not past `deadline`
+
+    Raises OperationCancelledError as soon as `cancel` is cancelled, and DeadlineExceededError
+    if the deadline expires.
+    """
+    if deadline is not None:
+        seconds = min(seconds, deadline.remaining())
+
+    if cancel is not None:
+        cancel.wait(seconds)
+        cancel.check()
+    elif seconds > 0:
+        sleep(seconds)
+
+    if deadline is not None:
+        deadline.check()
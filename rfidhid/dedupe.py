@@ -0,0 +1,110 @@
+# Copyright (c) 2019 charlysan
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+r"""De-duplication of tags read in a loop
+
+Both engines answer "has this tag been seen before?" in O(1) time using a fixed amount of memory:
+
+TtlDedupe -- a tag is reported again once it has not been seen for `ttl` seconds. Bounded LRU: when
+             `max_size` tags are tracked the least recently seen one is forgotten.
+BloomDedupe -- a tag is reported once per session. Uses a Bloom filter, so millions of tags fit in a few
+               MB, at the cost of a small probability (`error_rate`) of a new tag being taken as seen.
+"""
+
+import hashlib
+import math
+import re
+import struct
+
+from .cache import TtlCache
+from .compat import monotonic
+
+
+class TtlDedupe(object):
+    r"""Report a tag again only after it has not been seen for `ttl` seconds"""
+
+    def __init__(self, ttl=5, max_size=65536, clock=monotonic):
+        self.ttl = ttl
+        self._cache = TtlCache(max_size=max_size, ttl=ttl, clock=clock)
+
+    def seen(self, key):
+        r"""Returns True if `key` has been seen within the last `ttl` seconds, and records it as seen now"""
+        seen = key in self._cache
+        self._cache.add(key)
+        return seen
+
+    def __len__(self):
+        return len(self._cache)
+
+
+class BloomDedupe(object):
+    r"""Report a tag only the first time it is seen, using a Bloom filter"""
+
+    def __init__(self, capacity=1000000, error_rate=0.001):
+        r"""Arguments:
+        capacity -- Number of distinct tags the filter is sized for
+        error_rate -- Probability of a new tag being taken as seen once `capacity` tags have been added
+        """
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.size = int(math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, int(round(self.size / float(capacity) * math.log(2))))
+        self.count = 0
+        self._bits = bytearray((self.size + 7) // 8)
+
+    def seen(self, key):
+        r"""Returns True if `key` has (probably) been seen before, and records it as seen"""
+        seen = True
+        for position in self._positions(key):
+            byte, mask = position >> 3, 1 << (position & 7)
+            if not self._bits[byte] & mask:
+                seen = False
+                self._bits[byte] |= mask
+
+        if not seen:
+            self.count += 1
+        return seen
+
+    def __len__(self):
+        return self.count
+
+    def _positions(self, key):
+        r"""Bit positions of a key, using double hashing on a single digest"""
+        digest = hashlib.md5(repr(key).encode('utf-8')).digest()
+        h1, h2 = struct.unpack('<QQ', digest)
+        return [(h1 + i * h2) % self.size for i in range(self.hashes)]
+
+
+def parse_dedupe(spec):
+    r"""Create a dedupe engine from a spec string
+
+    'ttl=SECONDS' (e.g. 'ttl=5', 'ttl=5s', 'ttl=500ms', 'ttl=2m') -- TtlDedupe
+    'session' or 'session=CAPACITY' -- BloomDedupe sized for CAPACITY tags
+    """
+    match = re.match(r'^ttl=(\d+(?:\.\d*)?)(ms|s|m|h)?$', spec)
+    if match:
+        units = {'ms': 0.001, 's': 1, 'm': 60, 'h': 3600}
+        return TtlDedupe(ttl=float(match.group(1)) * units[match.group(2) or 's'])
+
+    match = re.match(r'^session(?:=(\d+))?$', spec)
+    if match:
+        return BloomDedupe(capacity=int(match.group(1))) if match.group(1) else BloomDedupe()
+
+    raise ValueError("Invalid dedupe mode '%s'. Use ttl=SECONDS (e.g. ttl=5s) or session" % spec)
@@ -0,0 +1,328 @@
+# Copyright (c) 2019 charlysan
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+r"""In-memory emulation of the USB HID RFID Reader/Writer
+
+`EmulatedHID` implements the same feature report interface as `usb_hid.HID`, so it can be
+handed to `RfidHid(hid=...)` in order to run the real read/write/verify code paths without hardware.
+`EmulatedUsbContext` emulates the asynchronous transfers of python-libusb1 on top of EmulatedHID
+devices, for `usb_async.AsyncHID`.
+"""
+
+import errno
+import heapq
+import itertools
+import random
+import threading
+from array import array
+from collections import Counter
+from time import sleep
+
+import usb.core
+
+from . import usb_async
+from .compat import monotonic
+from .usb_hid import HID, TransferTimeoutError
+
+
+class EmulatedTag(object):
+    r"""A 125Khz tag that can be placed close to an emulated reader"""
+
+    def __init__(self, cid, uid, tag_type=0x02):
+        self.cid = cid
+        self.uid = uid
+        self.tag_type = tag_type
+
+    def id_bytes(self):
+        return [self.cid, (self.uid >> 24) & 0xff, (self.uid >> 16) & 0xff, (self.uid >> 8) & 0xff, self.uid & 0xff]
+
+
+class FaultInjector(object):
+    r"""Random faults injected by an EmulatedHID
+
+    Every rate is the probability (0-1) of the fault on each transfer:
+    usb_error_rate -- the transfer fails with usb.core.USBError
+    truncated_rate -- GET_REPORT returns a truncated response (it fails the RESPONSE_LENGTH_WITH_TAG check)
+    slow_rate -- the transfer takes `slow_latency` extra seconds (it might exceed the transfer timeout)
+    """
+
+    def __init__(self, usb_error_rate=0, truncated_rate=0, slow_rate=0, slow_latency=0.5, seed=None):
+        self.usb_error_rate = usb_error_rate
+        self.truncated_rate = truncated_rate
+        self.slow_rate = slow_rate
+        self.slow_latency = slow_latency
+        self.injected = Counter()
+        self._random = random.Random(seed)
+
+    def usb_error(self):
+        return self._roll('usb_error', self.usb_error_rate)
+
+    def truncated(self):
+        return self._roll('truncated', self.truncated_rate)
+
+    def extra_latency(self):
+        return self.slow_latency if self._roll('slow', self.slow_rate) else 0
+
+    def truncate(self, response):
+        return response[:self._random.randrange(1, len(response))]
+
+    def _roll(self, fault, rate):
+        if rate and self._random.random() < rate:
+            self.injected[fault] += 1
+            return True
+        return False
+
+
+class EmulatedHID(object):
+    r"""Emulates the device side of the feature report protocol"""
+    CMD_POS = 0x0b
+    CMD_READ_TAG = 0x25
+    CMD_WRITE_TAG = 0x21
+    CMD_BEEP = 0x89
+    CMD_UNKNOWN_RESPONSE = 0x8f
+
+    def __init__(self, tag=None, latency=0, faults=None):
+        r"""Arguments:
+        tag -- EmulatedTag placed on the reader at startup
+        latency -- Seconds spent on every control transfer (emulates the USB round trip). Transfers
+                   with a shorter timeout raise usb_hid.TransferTimeoutError, like a wedged reader.
+        faults -- FaultInjector used to make transfers fail
+        """
+        self.tag = tag
+        self.latency = latency
+        self.faults = faults
+        self.beeps = 0
+        self.transfers = 0
+        self._response = self._status_response(self.CMD_UNKNOWN_RESPONSE)
+        self._lock = threading.Lock()
+
+    def place(self, tag):
+        r"""Put a tag close to the reader"""
+        self.tag = tag
+
+    def remove(self):
+        r"""Take the tag away from the reader"""
+        tag, self.tag = self.tag, None
+        return tag
+
+    def get_report_descriptor(self, length=0xff, timeout=None):
+        self._transfer(timeout)
+        return self._report_descriptor(length)
+
+    def set_feature_report(self, report_number, data, timeout=None):
+        self._transfer(timeout)
+        return self._set_report(data)
+
+    def get_feature_report(self, report_number, report_length, timeout=None):
+        self._transfer(timeout)
+        return self._get_report(report_length)
+
+    def _report_descriptor(self, length):
+        return array('B', [0x06, 0x00, 0xff, 0x09, 0x01, 0xa1, 0x01] + [0x00] * (length - 7))
+
+    def _set_report(self, data):
+        cmd = data[self.CMD_POS]
+
+        with self._lock:
+            if cmd == self.CMD_READ_TAG:
+                self._response = self._read_response()
+            elif cmd == self.CMD_WRITE_TAG:
+                self._response = self._write(data)
+            elif cmd == self.CMD_BEEP:
+                # 0x04/0x05 is the post-write workaround, not an actual beep
+                if data[self.CMD_POS + 1] == 0x01:
+                    self.beeps += 1
+                self._response = self._status_response(0x00)
+            else:
+                self._response = self._status_response(self.CMD_UNKNOWN_RESPONSE)
+
+        return len(data)
+
+    def _get_report(self, report_length):
+        with self._lock:
+            response = self._response[:report_length]
+
+        if self.faults is not None and self.faults.truncated():
+            response = self.faults.truncate(response)
+
+        return array('B', response)
+
+    def _transfer(self, timeout=None):
+        r"""Emulate the duration of a transfer. `timeout` is in milliseconds, like in usb_hid.HID"""
+        latency = self._transfer_latency()
+
+        if timeout is not None and latency * 1000 > timeout:
+            sleep(timeout / 1000.0)
+            raise TransferTimeoutError('Operation timed out', None, errno.ETIMEDOUT)
+        if latency:
+            sleep(latency)
+
+    def _transfer_latency(self):
+        r"""Count a transfer and return its duration in seconds. Raises the injected USB errors"""
+        self.transfers += 1
+        latency = self.latency
+
+        if self.faults is not None:
+            if self.faults.usb_error():
+                raise usb.core.USBError('Input/Output Error', None, errno.EIO)
+            latency += self.faults.extra_latency()
+
+        return latency
+
+    def _write(self, data):
+        tag = self.tag
+        # payload starts after SOM, reserved byte and length
+        payload = data[0x0b:0x0b + data[0x0a]]
+        if tag is not None and tag.tag_type == payload[0x04]:
+            tag.cid = payload[0x05]
+            tag.uid = payload[0x06] << 24 | payload[0x07] << 16 | payload[0x08] << 8 | payload[0x09]
+        return self._status_response(0x00)
+
+    def _read_response(self):
+        tag = self.tag
+        if tag is None:
+            return self._status_response(0x00)
+
+        id_data = [0x06, 0x00] + tag.id_bytes()
+        crc = 0
+        for byte in id_data:
+            crc = crc ^ byte
+
+        return [0x03, 0x00, 0x00, 0x00, 0x00, 0x00, 0x00, 0x00, 0x02, 0x00] + id_data + [crc, 0x03]
+
+    @staticmethod
+    def _status_response(status):
+        return [0x03, 0x00, 0x00, 0x00, 0x00, 0x00, 0x00, 0x00, 0x02, 0x00, 0x01, 0x00, status, 0x03]
+
+
+class EmulatedUsbContext(object):
+    r"""Emulates the part of a python-libusb1 USBContext used by usb_async
+
+    Submitted transfers complete after the latency of their EmulatedHID (plus the injected faults), from
+    the thread calling `handleEventsTimeout`, e.g. an usb_async.UsbEventLoop.
+    """
+
+    def __init__(self):
+        self._completions = []
+        self._sequence = itertools.count()
+        self._condition = threading.Condition()
+
+    def open(self, hid):
+        r"""Return the device handle of an EmulatedHID"""
+        return EmulatedDeviceHandle(self, hid)
+
+    def handleEventsTimeout(self, tv=0):
+        r"""Complete the transfers that are due, waiting up to `tv` seconds for one"""
+        end = monotonic() + tv
+        with self._condition:
+            while True:
+                now = monotonic()
+                if self._completions and self._completions[0][0] <= now:
+                    break
+                wake_up = min(end, self._completions[0][0]) if self._completions else end
+                if wake_up <= now:
+                    return
+                self._condition.wait(wake_up - now)
+
+            due = []
+            while self._completions and self._completions[0][0] <= now:
+                due.append(heapq.heappop(self._completions)[2])
+
+        for transfer in due:
+            transfer.complete()
+
+    def schedule(self, delay, transfer):
+        with self._condition:
+            heapq.heappush(self._completions, (monotonic() + delay, next(self._sequence), transfer))
+            self._condition.notify()
+
+
+class EmulatedDeviceHandle(object):
+    r"""Emulates a python-libusb1 USBDeviceHandle"""
+
+    def __init__(self, context, hid):
+        self.context = context
+        self.hid = hid
+
+    def getTransfer(self):
+        return EmulatedTransfer(self)
+
+    def close(self):
+        pass
+
+
+class EmulatedTransfer(object):
+    r"""Emulates a python-libusb1 USBTransfer set up with setControl"""
+
+    def __init__(self, handle):
+        self.handle = handle
+        self._status = None
+        self._buffer = b''
+        self._actual_length = 0
+
+    def setControl(self, request_type, request, value, index, buffer_or_len, callback=None, user_data=None,
+                   timeout=0):
+        self._request = (request_type, request)
+        self._data_or_length = buffer_or_len
+        self._callback = callback
+        self._user_data = user_data
+        self._timeout = timeout
+
+    def submit(self):
+        try:
+            latency = self.handle.hid._transfer_latency()
+            self._status = usb_async.TRANSFER_COMPLETED
+        except usb.core.USBError:
+            latency = 0
+            self._status = usb_async.TRANSFER_ERROR
+
+        if self._timeout and latency * 1000 > self._timeout:
+            latency = self._timeout / 1000.0
+            self._status = usb_async.TRANSFER_TIMED_OUT
+
+        self.handle.context.schedule(latency, self)
+
+    def complete(self):
+        if self._status == usb_async.TRANSFER_COMPLETED:
+            hid = self.handle.hid
+            if self._request == (HID.REQUEST_HOST_TO_DEVICE_CLASS_INTERFACE, HID.SET_REPORT):
+                self._buffer = self._data_or_length
+                self._actual_length = hid._set_report(bytearray(self._data_or_length))
+            else:
+                if self._request == (HID.REQUEST_DEVICE_TO_HOST_CLASS_INTERFACE, HID.GET_REPORT):
+                    response = hid._get_report(self._data_or_length)
+                else:
+                    response = hid._report_descriptor(self._data_or_length)
+                self._buffer = response.tobytes() if hasattr(response, 'tobytes') else response.tostring()
+                self._actual_length = len(response)
+
+        self._callback(self)
+
+    def getStatus(self):
+        return self._status
+
+    def getActualLength(self):
+        return self._actual_length
+
+    def getBuffer(self):
+        return self._buffer
+
+    def getUserData(self):
+        return self._user_data
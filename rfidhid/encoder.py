@@ -0,0 +1,240 @@
+# Copyright (c) 2019 charlysan
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+r"""Multi-station encoding line
+
+Several writer devices are driven concurrently from a single process. Each device runs its own
+write->verify loop on a dedicated thread, and all of them draw UIDs from a shared `UidAllocator`,
+so no UID is written twice. UIDs that fail verification (the tag is read back with another UID) are
+requeued.
+
+Transient USB errors and timeouts are counted as failed attempts and the station keeps running; only
+errors it cannot recover from (e.g. the device has been unplugged) stop it. The UID of an attempt that
+failed with an error is voided, not requeued: the write might have reached the tag.
+"""
+
+import threading
+
+import usb.core
+
+from .core import RfidHid
+from .compat import monotonic
+from .allocator import UidExhaustedError
+from .deadline import wait
+from .presence import wait_for_tag, wait_for_departure
+from .usb_hid import device_gone
+
+
+class EncodingStation(threading.Thread):
+    r"""Write->verify loop for a single writer device"""
+
+    def __init__(self, rfid, allocator, cid, tag_type=RfidHid.TAG_EM4305, name=None, block_size=8,
+                 read_interval=0.1, verify_delay=0.2, retries=3, beep=False, on_result=None, stop=None):
+        r"""Arguments:
+        rfid -- RfidHid object used to write the tags
+        allocator -- UidAllocator shared by all the stations
+        cid -- Customer ID to be written
+        block_size -- Number of UIDs to reserve from the allocator at once
+        verify_delay -- Seconds to wait between the write and the verify read
+        retries -- Write attempts on the same tag before waiting for it to be taken away
+        on_result -- Callable invoked as on_result(station, uid, ok, elapsed) after every verify
+        stop -- threading.Event (or CancellationToken) used to stop the station
+        """
+        super(EncodingStation, self).__init__(name=name)
+        self.daemon = True
+        self.rfid = rfid
+        self.allocator = allocator
+        self.cid = cid
+        self.tag_type = tag_type
+        self.block_size = block_size
+        self.read_interval = read_interval
+        self.verify_delay = verify_delay
+        self.retries = retries
+        self.beep = beep
+        self.on_result = on_result
+
+        self.written = 0
+        self.failed = 0
+        self.voided = 0
+        self.errors = 0
+        self.last_error = None
+        self.error = None
+        self.started_at = None
+        self.stopped_at = None
+        self._block = []
+        self._stop_event = stop if stop is not None else threading.Event()
+
+    def stop(self):
+        r"""Ask the station to finish after the current tag"""
+        self._stop_event.set()
+
+    def run(self):
+        self.started_at = monotonic()
+        try:
+            while not self._stop_event.is_set():
+                try:
+                    if wait_for_tag(self.rfid, self.read_interval, stop=self._stop_event) is None:
+                        break
+                    if not self._encode():
+                        # do not hold UIDs back from the other stations while waiting for the operator
+                        self._release_block()
+                    wait_for_departure(self.rfid, self.read_interval, stop=self._stop_event)
+                except (usb.core.USBError, ValueError) as e:
+                    if isinstance(e, UidExhaustedError) or device_gone(e):
+                        raise
+                    self._count_error(e)
+                    self._stop_event.wait(self.read_interval)
+        except UidExhaustedError:
+            pass
+        except Exception as e:
+            self.error = e
+        finally:
+            self._release_block()
+            self.stopped_at = monotonic()
+
+    def stats(self):
+        elapsed = self._elapsed()
+        return {
+            'name': self.name,
+            'written': self.written,
+            'failed': self.failed,
+            'voided': self.voided,
+            'errors': self.errors,
+            'elapsed': elapsed,
+            'badges_per_hour': self.written * 3600.0 / elapsed if elapsed else 0.0,
+        }
+
+    def _encode(self):
+        for _ in range(self.retries):
+            uid = self._next_uid()
+            started = monotonic()
+            try:
+                ok = self._write_and_verify(uid)
+            except (usb.core.USBError, ValueError) as e:
+                # the write might have reached the tag: the UID must never be written again
+                self.allocator.void([uid])
+                self.voided += 1
+                if device_gone(e):
+                    raise
+                self._count_error(e)
+                ok = None
+
+            if self.on_result:
+                self.on_result(self, uid, bool(ok), monotonic() - started)
+
+            if ok:
+                self.written += 1
+                self.allocator.commit([uid])
+                if self.beep:
+                    self.rfid.beep()
+                return True
+
+            self.failed += 1
+            if ok is False:
+                self.allocator.requeue([uid])
+
+        return False
+
+    def _write_and_verify(self, uid):
+        r"""Write a tag and read it back
+
+        Returns True if the tag carries the written CID and UID, False if it carries others, or None if
+        no tag has been read back (it is not known whether the write has reached the tag).
+        """
+        self.rfid.write_tag_from_cid_and_uid(self.cid, uid, self.tag_type)
+        wait(self.verify_delay)
+        payload_response = self.rfid.read_tag()
+        if not payload_response.has_id_data():
+            return None
+        return payload_response.get_tag_cid() == self.cid and payload_response.get_tag_uid() == uid
+
+    def _count_error(self, e):
+        r"""Count a transient USB error, timeout or 'Communication Error.'"""
+        self.errors += 1
+        self.last_error = e
+
+    def _next_uid(self):
+        while not self._block:
+            try:
+                self._block = self.allocator.reserve(self.block_size)
+            except UidExhaustedError:
+                # UIDs reserved by other stations might still be requeued
+                if self.allocator.exhausted() or self._stop_event.is_set():
+                    raise
+                self._stop_event.wait(self.read_interval)
+        return self._block.pop(0)
+
+    def _release_block(self):
+        if self._block:
+            self.allocator.requeue(self._block)
+            self._block = []
+
+    def _elapsed(self):
+        if self.started_at is None:
+            return 0.0
+        return (self.stopped_at or monotonic()) - self.started_at
+
+
+class EncodingLine(object):
+    r"""Drive several writer devices concurrently, sharing a single UidAllocator"""
+
+    def __init__(self, devices, allocator, cid, **kwargs):
+        r"""Arguments:
+        devices -- list of RfidHid objects (one station per device)
+        allocator -- UidAllocator shared by all the stations
+        cid -- Customer ID to be written
+
+        Any other keyword argument (e.g. a shared `stop` CancellationToken) is passed to every
+        EncodingStation.
+        """
+        self.allocator = allocator
+        self.stations = [EncodingStation(rfid, allocator, cid, name='station-%d' % i, **kwargs)
+                         for i, rfid in enumerate(devices)]
+
+    def start(self):
+        for station in self.stations:
+            station.start()
+
+    def stop(self):
+        for station in self.stations:
+            station.stop()
+
+    def join(self, timeout=None):
+        for station in self.stations:
+            station.join(timeout)
+
+    def is_alive(self):
+        return any(station.is_alive() for station in self.stations)
+
+    def stats(self):
+        r"""Aggregated and per-station write counters and badges per hour"""
+        stations = [station.stats() for station in self.stations]
+        elapsed = max([s['elapsed'] for s in stations] or [0.0])
+        written = sum(s['written'] for s in stations)
+
+        return {
+            'written': written,
+            'failed': sum(s['failed'] for s in stations),
+            'voided': sum(s['voided'] for s in stations),
+            'errors': sum(s['errors'] for s in stations),
+            'elapsed': elapsed,
+            'badges_per_hour': written * 3600.0 / elapsed if elapsed else 0.0,
+            'stations': stations,
+        }
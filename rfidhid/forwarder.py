@@ -0,0 +1,252 @@
+# Copyright (c) 2019 charlysan
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+r"""Store-and-forward delivery of tag events to an HTTP endpoint
+
+`HttpForwarder` is a sink (see `sink.py`): events are taken off the reader loop, grouped in batches
+(by size and time) and POSTed as JSON over a keep-alive connection. While the endpoint is unreachable
+batches are spilled to an on-disk spool, and replayed in order once it is back.
+
+Every batch is sent as:
+
+    POST <url>
+    Content-Type: application/json
+
+    {"events": [{"timestamp": 1559563200.5, "kind": "read", "cid": 12, "uid": 123456, "tag_type": null,
+                 "reader": "door"}, ...]}
+
+Any 2xx response acknowledges the batch. 408, 429, 5xx responses and network errors are transient: the
+batch is retried (spooled). Any other 4xx response rejects the batch for good (e.g. a payload the
+endpoint does not accept): it is appended to a dead-letter file instead of blocking the spool, one JSON
+object per line:
+
+    {"error": "HTTP 400 Bad Request", "events": [...]}
+"""
+
+import json
+import os
+import socket
+
+from .compat import http_client, monotonic, urlsplit
+from .sink import BatchSink, TagEvent
+
+
+class DeliveryError(Exception):
+    r"""Raised when a batch is not acknowledged by the endpoint"""
+
+
+class RejectedError(DeliveryError):
+    r"""Raised when the endpoint rejects a batch for good: sending it again would fail again"""
+
+
+class DiskSpool(object):
+    r"""Bounded FIFO of batches, one file per batch
+
+    When the spool exceeds `max_bytes` the oldest batches are dropped (and counted in `dropped` events).
+    """
+    SUFFIX = '.batch'
+
+    def __init__(self, path, max_bytes=64 * 1024 * 1024):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.dropped = 0
+
+        if not os.path.isdir(path):
+            os.makedirs(path)
+
+        for name in os.listdir(path):
+            if name.endswith(self.SUFFIX + '.tmp'):
+                # interrupted push
+                os.remove(os.path.join(path, name))
+
+        self._files = sorted(name for name in os.listdir(path) if name.endswith(self.SUFFIX))
+        self._sequence = int(self._files[-1].split('-')[0]) + 1 if self._files else 0
+        self._bytes = sum(os.path.getsize(os.path.join(path, name)) for name in self._files)
+
+    def push(self, body, count):
+        r"""Append a batch (`count` events serialized in `body`)"""
+        name = '%020d-%d%s' % (self._sequence, count, self.SUFFIX)
+        self._sequence += 1
+
+        tmp = os.path.join(self.path, name + '.tmp')
+        with open(tmp, 'wb') as f:
+            f.write(body)
+            f.flush()
+            os.fsync(f.fileno())
+        # a crash never leaves a partial batch in the spool
+        os.rename(tmp, os.path.join(self.path, name))
+
+        self._files.append(name)
+        self._bytes += len(body)
+
+        while self._bytes > self.max_bytes and len(self._files) > 1:
+            self.dropped += self._count(self._files[0])
+            self.pop()
+
+    def peek(self):
+        r"""Returns (body, count) of the oldest batch, or None if the spool is empty"""
+        if not self._files:
+            return None
+        with open(os.path.join(self.path, self._files[0]), 'rb') as f:
+            return f.read(), self._count(self._files[0])
+
+    def pop(self):
+        r"""Remove the oldest batch"""
+        path = os.path.join(self.path, self._files.pop(0))
+        self._bytes -= os.path.getsize(path)
+        os.remove(path)
+
+    def __len__(self):
+        return len(self._files)
+
+    def _count(self, name):
+        return int(name[:-len(self.SUFFIX)].split('-')[1])
+
+
+class HttpForwarder(BatchSink):
+    r"""Send tag events in batches to an HTTP endpoint, spooling them to disk while it is unreachable"""
+
+    def __init__(self, url, spool_dir=None, spool_max_bytes=64 * 1024 * 1024, batch_size=100, flush_interval=1.0,
+                 timeout=5, retry_interval=5, headers=None, max_pending=100000, dead_letter_path=None):
+        r"""Arguments:
+        url -- Endpoint (http:// or https://) the batches are POSTed to
+        spool_dir -- Directory where undelivered batches are kept (None: batches are dropped while the
+                     endpoint is unreachable). Batches left from a previous run are sent first.
+        spool_max_bytes -- Maximum size of the spool. The oldest batches are dropped when exceeded.
+        timeout -- Socket timeout in seconds for every request
+        retry_interval -- Seconds between delivery attempts while the endpoint is unreachable
+        headers -- Additional HTTP headers (e.g. Authorization)
+        dead_letter_path -- File the rejected batches are appended to (default: rejected.jsonl in the spool
+                            directory; None without spool: rejected batches are only counted in `rejected`)
+        batch_size, flush_interval, max_pending -- See `sink.BatchSink`
+        """
+        parts = urlsplit(url)
+        if parts.scheme not in ('http', 'https'):
+            raise ValueError("Unsupported URL '%s'. Use http:// or https://" % url)
+
+        self.url = url
+        self.timeout = timeout
+        self.retry_interval = retry_interval
+        self.headers = dict(headers or {}, **{'Content-Type': 'application/json'})
+        self.spool = DiskSpool(spool_dir, spool_max_bytes) if spool_dir else None
+        self.failures = 0
+        self.lost = 0
+        self.rejected = 0
+        if dead_letter_path is None and spool_dir:
+            dead_letter_path = os.path.join(spool_dir, 'rejected.jsonl')
+        self.dead_letter_path = dead_letter_path
+        self._parts = parts
+        self._path = (parts.path or '/') + ('?' + parts.query if parts.query else '')
+        self._connection = None
+        self._retry_at = 0
+
+        super(HttpForwarder, self).__init__(batch_size, flush_interval, max_pending, name='http-forwarder')
+
+    def _write(self, batch):
+        body = json.dumps({'events': [event._asdict() for event in batch]}).encode('utf-8')
+
+        if self._replay() and self._try_send(body, len(batch)):
+            pass
+        elif self.spool is not None:
+            self.spool.push(body, len(batch))
+        else:
+            self.lost += len(batch)
+
+    def _idle(self):
+        self._replay()
+
+    def _close(self):
+        # undelivered batches stay in the spool for the next run
+        if self._connection is not None:
+            self._connection.close()
+
+    def _replay(self):
+        r"""Send the spooled batches in order. Returns True if the spool is empty"""
+        if self.spool is None:
+            return True
+
+        while len(self.spool):
+            body, count = self.spool.peek()
+            if not self._try_send(body, count):
+                return False
+            self.spool.pop()
+        return True
+
+    def _try_send(self, body, count):
+        r"""Send a batch of `count` events. Returns True once it is done with: acknowledged or rejected"""
+        if monotonic() < self._retry_at:
+            return False
+        try:
+            self._send(body)
+            self.written += count
+            return True
+        except RejectedError as e:
+            self.rejected += count
+            self._dead_letter(body, e)
+            return True
+        except (DeliveryError, socket.error, http_client.HTTPException):
+            self.failures += 1
+            self._disconnect()
+            self._retry_at = monotonic() + self.retry_interval
+            return False
+
+    def _send(self, body):
+        for attempt in range(2):
+            fresh = self._connection is None
+            if fresh:
+                cls = http_client.HTTPSConnection if self._parts.scheme == 'https' else http_client.HTTPConnection
+                self._connection = cls(self._parts.hostname, self._parts.port, timeout=self.timeout)
+            try:
+                self._connection.request('POST', self._path, body, self.headers)
+                response = self._connection.getresponse()
+                response.read()
+                break
+            except (socket.error, http_client.HTTPException):
+                self._disconnect()
+                # the server might have closed an idle keep-alive connection: retry once on a new one
+                if fresh or attempt:
+                    raise
+
+        if response.getheader('connection', '').lower() == 'close':
+            self._disconnect()
+        if not 200 <= response.status < 300:
+            error = 'HTTP %d %s' % (response.status, response.reason)
+            if 400 <= response.status < 500 and response.status not in (408, 429):
+                raise RejectedError(error)
+            raise DeliveryError(error)
+
+    def _dead_letter(self, body, error):
+        if self.dead_letter_path is None:
+            return
+        record = {'error': str(error), 'events': json.loads(body.decode('utf-8'))['events']}
+        with open(self.dead_letter_path, 'a') as f:
+            f.write(json.dumps(record) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+
+    def _disconnect(self):
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+
+
+def parse_events(body):
+    r"""Decode the body of a batch into a list of TagEvent. Useful on the receiving side"""
+    return [TagEvent(**event) for event in json.loads(body.decode('utf-8'))['events']]
@@ -0,0 +1,236 @@
+# Copyright (c) 2019 charlysan
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+r"""Fusion of the tags seen by several readers with overlapping coverage
+
+When the field of several readers overlaps (entry/exit pads, portal arrays) the same tag is read by two or
+more of them within milliseconds. The sightings of every reader are merged by timestamp (a heap merge, so
+O(log readers) per sighting), and the sightings of the same CID and UID within `window` seconds of the first
+one are collapsed into a single FusedEvent telling which reader saw the tag first and which other readers
+saw it.
+
+fuse -- fuses finite (or endless) per-reader iterables of sink.TagEvent, e.g. recorded events
+TagFusion -- incremental fusion, fed by reader threads
+FusedReaders -- polls several RfidHid devices and reports FusedEvents
+"""
+
+import heapq
+import threading
+import time
+from collections import OrderedDict, deque, namedtuple
+
+FusedEvent = namedtuple('FusedEvent', ['timestamp', 'cid', 'uid', 'reader', 'others', 'last_seen'])
+
+
+class _Collapser(object):
+    r"""Collapses time ordered sightings of the same tag within `window` seconds of the first one"""
+
+    def __init__(self, window):
+        self.window = window
+        # (cid, uid) -> [first timestamp, first reader, other readers, last timestamp], in first timestamp order
+        self._open = OrderedDict()
+
+    def add(self, timestamp, reader, cid, uid):
+        r"""Add a sighting (not older than the previous ones). Returns the FusedEvents completed"""
+        fused = self.expire(timestamp)
+
+        group = self._open.get((cid, uid))
+        if group is None:
+            self._open[(cid, uid)] = [timestamp, reader, [], timestamp]
+        else:
+            if reader != group[1] and reader not in group[2]:
+                group[2].append(reader)
+            group[3] = timestamp
+
+        return fused
+
+    def expire(self, now):
+        r"""Returns the FusedEvents whose window ended before `now`"""
+        fused = []
+        while self._open:
+            key, group = next(iter(self._open.items()))
+            if group[0] + self.window >= now:
+                break
+            del self._open[key]
+            fused.append(FusedEvent(group[0], key[0], key[1], group[1], tuple(group[2]), group[3]))
+        return fused
+
+    def drain(self):
+        return self.expire(float('inf'))
+
+
+def fuse(streams, window=0.05):
+    r"""Merge per-reader streams of TagEvents and collapse the sightings of the same tag
+
+    Arguments:
+    streams -- dict of reader name -> iterable of TagEvent sorted by timestamp
+    window -- Seconds after the first sighting of a tag during which other sightings are collapsed
+
+    Yields FusedEvents in timestamp order. Events without CID and UID are ignored.
+    """
+    def decorate(index, reader, events):
+        for event in events:
+            yield event.timestamp, index, reader, event
+
+    collapser = _Collapser(window)
+    merged = heapq.merge(*[decorate(index, reader, events) for index, (reader, events) in enumerate(streams.items())])
+    for timestamp, _, reader, event in merged:
+        if event.uid is None:
+            continue
+        for fused in collapser.add(timestamp, reader, event.cid, event.uid):
+            yield fused
+
+    for fused in collapser.drain():
+        yield fused
+
+
+class TagFusion(object):
+    r"""Incremental fusion of the sightings pushed by several readers (from any thread)
+
+    Every reader pushes its sightings in timestamp order, and advances its watermark (the time up to which
+    it has reported everything it has seen) after every poll, even when no tag has been seen. A sighting is
+    only merged once every reader's watermark has passed it, so the output is in timestamp order.
+    """
+
+    def __init__(self, readers, window=0.05):
+        self.window = window
+        self._collapser = _Collapser(window)
+        self._pending = dict((reader, deque()) for reader in readers)
+        self._watermarks = dict((reader, float('-inf')) for reader in readers)
+        self._order = dict((reader, index) for index, reader in enumerate(readers))
+        self._heads = []
+        self._lock = threading.Lock()
+
+    def push(self, reader, timestamp, cid, uid):
+        r"""Report a sighting. Also advances the reader watermark to `timestamp`"""
+        with self._lock:
+            pending = self._pending[reader]
+            if not pending:
+                heapq.heappush(self._heads, (timestamp, self._order[reader], reader))
+            pending.append((timestamp, cid, uid))
+            self._watermarks[reader] = max(self._watermarks[reader], timestamp)
+
+    def advance(self, reader, timestamp):
+        r"""Tell that `reader` will not report sightings older than `timestamp`"""
+        with self._lock:
+            self._watermarks[reader] = max(self._watermarks[reader], timestamp)
+
+    def remove(self, reader):
+        r"""Stop waiting for a reader (e.g. it has been disconnected)"""
+        with self._lock:
+            self._watermarks[reader] = float('inf')
+
+    def poll(self):
+        r"""Returns the FusedEvents completed up to the lowest reader watermark"""
+        with self._lock:
+            safe = min(self._watermarks.values())
+            fused = []
+            while self._heads and self._heads[0][0] <= safe:
+                _, order, reader = heapq.heappop(self._heads)
+                pending = self._pending[reader]
+                timestamp, cid, uid = pending.popleft()
+                if pending:
+                    heapq.heappush(self._heads, (pending[0][0], order, reader))
+                fused.extend(self._collapser.add(timestamp, reader, cid, uid))
+
+            fused.extend(self._collapser.expire(safe))
+            return fused
+
+    def drain(self):
+        r"""Returns every remaining FusedEvent, regardless of the watermarks"""
+        for reader in self._watermarks:
+            self.remove(reader)
+        fused = self.poll()
+        with self._lock:
+            return fused + self._collapser.drain()
+
+
+class FusedReaders(object):
+    r"""Poll several readers on parallel threads and report the fused sightings
+
+    E.g.
+        readers = FusedReaders(RfidHid.find_all(), window=0.05, on_event=print)
+        readers.start()
+    """
+
+    def __init__(self, rfids, window=0.05, interval=0.05, on_event=None, stop=None, clock=time.time):
+        r"""Arguments:
+        rfids -- RfidHid objects. Readers are named after `rfid.name` (or 'reader-N')
+        window -- See `fuse`
+        interval -- Seconds between polls of every reader
+        on_event -- Callable invoked as on_event(fused_event), from the fusion thread
+        stop -- threading.Event (or CancellationToken) used to stop the readers
+        """
+        self.rfids = rfids
+        self.names = [rfid.name or 'reader-%d' % index for index, rfid in enumerate(rfids)]
+        self.interval = interval
+        self.on_event = on_event
+        self.stop_event = stop if stop is not None else threading.Event()
+        self.clock = clock
+        self.fusion = TagFusion(self.names, window)
+        self.errors = 0
+        self._threads = []
+
+    def start(self):
+        self._threads = [threading.Thread(target=self._poll, args=(rfid, name), name=name)
+                         for rfid, name in zip(self.rfids, self.names)]
+        self._threads.append(threading.Thread(target=self._fuse, name='fusion'))
+        for thread in self._threads:
+            thread.daemon = True
+            thread.start()
+
+    def stop(self):
+        self.stop_event.set()
+
+    def join(self, timeout=None):
+        for thread in self._threads:
+            thread.join(timeout)
+
+    def _poll(self, rfid, name):
+        try:
+            while not self.stop_event.is_set():
+                started = self.clock()
+                try:
+                    payload_response = rfid.read_tag()
+                except Exception:
+                    # a failed poll has not seen anything
+                    self.errors += 1
+                else:
+                    if payload_response.has_id_data():
+                        self.fusion.push(name, started, payload_response.get_tag_cid(), payload_response.get_tag_uid())
+                # sightings of the next poll will not be older than its start
+                self.fusion.advance(name, started)
+                self.stop_event.wait(self.interval)
+        finally:
+            self.fusion.remove(name)
+
+    def _fuse(self):
+        while not self.stop_event.wait(self.interval):
+            self._emit(self.fusion.poll())
+
+        # the sightings of the last polls
+        for thread in self._threads[:-1]:
+            thread.join()
+        self._emit(self.fusion.drain())
+
+    def _emit(self, events):
+        if self.on_event is not None:
+            for event in events:
+                self.on_event(event)
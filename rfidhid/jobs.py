@@ -0,0 +1,212 @@
+# Copyright (c) 2019 charlysan
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+r"""Programmatic read/write/clone jobs
+
+The flows of `rfid_cli` as a library: a `JobRunner` wraps an already opened RfidHid object and runs jobs
+described by a `JobConfig`. Jobs return structured results and raise exceptions (never exit the process),
+so a long-lived process can run any number of jobs back to back on the same device.
+
+E.g.
+    runner = JobRunner(RfidHid())
+    try:
+        result = runner.write(JobConfig(cid=12, uid=1000, deadline=10))
+    except VerifyError as e:
+        print('Write Error! %s' % (e.result,))
+"""
+
+from collections import namedtuple
+
+from .core import RfidHid
+from .cache import TtlCache
+from .compat import monotonic
+from .deadline import Deadline, wait
+from .presence import wait_for_tag, wait_for_departure
+from .tagtype import TagTypeDetector, write_tag_and_verify_auto
+
+UID_MAX = 0xffffffff
+CID_MAX = 0xff
+
+ReadResult = namedtuple('ReadResult', ['cid', 'uid', 'payload_response'])
+
+WriteResult = namedtuple('WriteResult', ['cid', 'uid', 'tag_type', 'previous', 'written', 'verified', 'elapsed'])
+
+
+class JobError(Exception):
+    r"""Base class of the errors raised by jobs"""
+
+
+class InvalidConfigError(JobError, ValueError):
+    r"""Raised when a JobConfig is not valid for a job"""
+
+
+class VerifyError(JobError):
+    r"""Raised when the tag does not carry the written CID and UID. `result` is the WriteResult"""
+
+    def __init__(self, message, result):
+        super(VerifyError, self).__init__(message)
+        self.result = result
+
+
+class JobConfig(object):
+    r"""Parameters of a job"""
+
+    def __init__(self, cid=None, uid=None, tag_type=RfidHid.TAG_EM4305, auto_type=False, verify=True,
+                 read_before_write=True, skip_written=True, read_interval=0.2, verify_delay=0.2, timeout=None,
+                 deadline=None):
+        r"""Arguments:
+        cid, uid -- CID and UID to be written
+        tag_type -- Tag type (RfidHid.TAG_EM4305 or RfidHid.TAG_T5577)
+        auto_type -- Detect the tag type (see `tagtype.py`). Writes are always verified.
+        verify -- Read the tag back after writing it
+        read_before_write -- Wait for a tag before writing it (otherwise write right away)
+        skip_written -- Do not write tags already carrying `cid` and `uid`, or written recently by the runner
+        read_interval -- Seconds between reads while waiting for a tag
+        verify_delay -- Seconds between the write and the verify read
+        timeout -- Timeout in seconds of every USB transfer (None: the one of the device)
+        deadline -- Seconds (or Deadline object) by which the whole job must complete
+        """
+        self.cid = cid
+        self.uid = uid
+        self.tag_type = tag_type
+        self.auto_type = auto_type
+        self.verify = verify
+        self.read_before_write = read_before_write
+        self.skip_written = skip_written
+        self.read_interval = read_interval
+        self.verify_delay = verify_delay
+        self.timeout = timeout
+        self.deadline = deadline
+
+    def copy(self, **changes):
+        r"""Returns a copy of the config with some parameters changed"""
+        config = JobConfig()
+        config.__dict__.update(self.__dict__, **changes)
+        return config
+
+    def validate_ids(self):
+        if self.cid is None or self.uid is None:
+            raise InvalidConfigError('Please set Tag CID and UID')
+        if not 0 <= self.cid <= CID_MAX:
+            raise InvalidConfigError('Invalid Customer ID (%s)' % self.cid)
+        if not 0 <= self.uid <= UID_MAX:
+            raise InvalidConfigError('Invalid UID (%s)' % self.uid)
+
+
+class JobRunner(object):
+    r"""Run jobs on an open device
+
+    The runner keeps the state shared by consecutive jobs: the recently written tags (to skip rewriting
+    them), the tag type detector (created by the first `auto_type` job) and the job counters.
+    """
+
+    def __init__(self, rfid, cancel=None, rewrite_window=60, written_cache_size=1024):
+        r"""Arguments:
+        rfid -- Open RfidHid object
+        cancel -- CancellationToken used to cancel the running job (OperationCancelledError is raised)
+        rewrite_window -- Seconds during which a written tag is not written again (see JobConfig.skip_written)
+        """
+        self.rfid = rfid
+        self.cancel = cancel
+        self.written_cache = TtlCache(max_size=written_cache_size, ttl=rewrite_window)
+        self.type_detector = None
+        self.writes = 0
+        self.skipped = 0
+
+    def read(self, config=None):
+        r"""Wait for a tag and read it
+
+        Returns a ReadResult. Raises DeadlineExceededError if no tag is found before the config deadline.
+        """
+        config = config or JobConfig()
+        deadline = Deadline.from_value(config.deadline)
+        payload_response = wait_for_tag(self.rfid, config.read_interval, self.cancel, deadline)
+        if payload_response is None:
+            self.cancel.check()
+
+        return ReadResult(payload_response.get_tag_cid(), payload_response.get_tag_uid(), payload_response)
+
+    def write(self, config, tag=None):
+        r"""Write config.cid and config.uid to a tag
+
+        Arguments:
+        tag -- (cid, uid) already read from the target tag, if any. Otherwise the tag is read first if
+               config.read_before_write is set.
+
+        Returns a WriteResult (`written` is False if the tag has been skipped). Raises VerifyError if the
+        tag cannot be read back with the written CID and UID.
+        """
+        config.validate_ids()
+        started = monotonic()
+        deadline = Deadline.from_value(config.deadline)
+        target = (config.cid, config.uid)
+
+        if tag is None and config.read_before_write:
+            read = self.read(config.copy(deadline=deadline))
+            tag = (read.cid, read.uid)
+
+        if config.skip_written and tag is not None and (tag == target or tag in self.written_cache):
+            self.skipped += 1
+            return WriteResult(config.cid, config.uid, None, tag, False, None, monotonic() - started)
+
+        if config.auto_type:
+            if self.type_detector is None:
+                self.type_detector = TagTypeDetector(default=config.tag_type)
+            tag_type = write_tag_and_verify_auto(self.rfid, config.cid, config.uid, self.type_detector, tag=tag,
+                                                 verify_delay=config.verify_delay, timeout=config.timeout,
+                                                 deadline=deadline, cancel=self.cancel)
+            verified = tag_type is not None
+        else:
+            tag_type = config.tag_type
+            self.rfid.write_tag_from_cid_and_uid(config.cid, config.uid, tag_type, config.timeout, deadline,
+                                                 self.cancel)
+            verified = self._verify(config, deadline) if config.verify else None
+
+        self.writes += 1
+        self.written_cache.add(target)
+        result = WriteResult(config.cid, config.uid, tag_type, tag, True, verified, monotonic() - started)
+
+        if verified is False:
+            raise VerifyError('Write Error!', result)
+        return result
+
+    def clone(self, config=None, on_source=None):
+        r"""Read a source tag, wait until it is taken away, then write its CID and UID to the next tag
+
+        Arguments:
+        on_source -- Callable invoked as on_source(read_result) once the source tag has been read
+
+        Returns the WriteResult of the target tag. Raises VerifyError if the copy cannot be verified.
+        """
+        config = config or JobConfig()
+        config = config.copy(deadline=Deadline.from_value(config.deadline))
+        source = self.read(config)
+        if on_source is not None:
+            on_source(source)
+
+        if not wait_for_departure(self.rfid, config.read_interval, stop=self.cancel, deadline=config.deadline):
+            self.cancel.check()
+
+        return self.write(config.copy(cid=source.cid, uid=source.uid, read_before_write=True))
+
+    def _verify(self, config, deadline):
+        wait(config.verify_delay, deadline, self.cancel)
+        payload_response = self.rfid.read_tag(config.timeout, deadline, self.cancel)
+        return payload_response.get_tag_cid() == config.cid and payload_response.get_tag_uid() == config.uid
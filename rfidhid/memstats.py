@@ -0,0 +1,219 @@
+# Copyright (c) 2019 charlysan
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+r"""Memory tracking of long running loops (e.g. `rfid_cli -r --loop --memstats`)
+
+`MemoryTracker.iteration()` is called once per loop iteration. Tracing starts after `warmup` iterations
+(caches, lazy imports and so on are filled by then), and every `interval` seconds a `MemorySample`
+is taken with tracemalloc (memory allocated by Python and still in use, and the peak since the previous
+sample) and the process RSS. From the samples it reports:
+
+growth per iteration -- traced memory retained by each iteration since the first sample. A loop that
+                        does not leak is close to 0
+blocks per iteration -- memory blocks allocated by each iteration and still alive (tracemalloc snapshot
+                        diff since the first sample). tracemalloc only sees live blocks: the blocks an
+                        iteration allocates and frees are not counted, the working set accounts for them
+working set per iteration -- peak traced memory above the level at the previous sample: the memory an
+                             iteration needs at once (its temporary allocations)
+top sites -- the source lines whose allocations grew the most since the first sample
+trend -- growth of traced memory and RSS per hour (least squares slope of the samples)
+
+tracemalloc is not available on Python 2.7: only RSS is sampled there.
+"""
+
+import linecache
+import os
+import resource
+import sys
+from collections import deque, namedtuple
+
+from .compat import monotonic
+
+try:
+    import tracemalloc
+except ImportError:
+    # python 2.7
+    tracemalloc = None
+
+
+def rss_bytes():
+    r"""Current resident set size (peak RSS if /proc is not available)"""
+    try:
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (IOError, OSError):
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # kilobytes on Linux, bytes on MacOS
+        return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def slope(points):
+    r"""Least squares slope of a list of (x, y) points (None with less than 2 distinct x)"""
+    if len(points) < 2:
+        return None
+
+    mean_x = sum(x for x, _ in points) / float(len(points))
+    mean_y = sum(y for _, y in points) / float(len(points))
+    variance = sum((x - mean_x) ** 2 for x, _ in points)
+    if not variance:
+        return None
+    return sum((x - mean_x) * (y - mean_y) for x, y in points) / variance
+
+
+MemorySample = namedtuple('MemorySample', ['time', 'iterations', 'traced', 'peak', 'rss'])
+
+AllocationSite = namedtuple('AllocationSite', ['location', 'size_diff', 'count_diff', 'size', 'count', 'line'])
+
+
+class MemoryTracker(object):
+    r"""Periodic tracemalloc/RSS sampling of a loop"""
+
+    def __init__(self, interval=60, warmup=100, max_samples=10080, frames=1, on_sample=None, clock=monotonic):
+        r"""Arguments:
+        interval -- Seconds between samples
+        warmup -- Iterations run before starting tracing and taking the first sample
+        max_samples -- Samples kept for the trend (10080: a week with 1 minute intervals). The first one is always kept
+        frames -- Frames stored by tracemalloc for every allocation (more frames: slower)
+        on_sample -- Function called with every MemorySample
+        clock -- Function returning the current time in seconds
+        """
+        self.interval = interval
+        self.warmup = warmup
+        self.frames = frames
+        self.on_sample = on_sample
+        self.clock = clock
+        self.iterations = 0
+        self.first_sample = None
+        self.samples = deque(maxlen=max_samples)
+        self._baseline = None
+        self._next_sample = None
+        self._started_tracing = False
+
+    def start(self):
+        r"""Start tracing and take the first sample. Called by `iteration` once the warm-up is over"""
+        if tracemalloc is not None and not tracemalloc.is_tracing():
+            tracemalloc.start(self.frames)
+            self._started_tracing = True
+        if tracemalloc is not None:
+            self._baseline = self._snapshot()
+        self.sample()
+
+    def stop(self):
+        r"""Stop tracing (if started by this tracker). Get the `report` first: top sites need tracing"""
+        if self._started_tracing:
+            tracemalloc.stop()
+            self._started_tracing = False
+
+    def iteration(self):
+        r"""Count a loop iteration and take a sample if `interval` has elapsed"""
+        self.iterations += 1
+        if self._next_sample is None:
+            if self.iterations >= self.warmup:
+                self.start()
+        elif self.clock() >= self._next_sample:
+            self.sample()
+
+    def sample(self):
+        traced = peak = None
+        if tracemalloc is not None and tracemalloc.is_tracing():
+            traced, peak = tracemalloc.get_traced_memory()
+            if hasattr(tracemalloc, 'reset_peak'):
+                # python 3.9+: peak since the previous sample
+                tracemalloc.reset_peak()
+
+        sample = MemorySample(self.clock(), self.iterations, traced, peak, rss_bytes())
+        if self.first_sample is None:
+            self.first_sample = sample
+        self.samples.append(sample)
+        self._next_sample = sample.time + self.interval
+        if self.on_sample is not None:
+            self.on_sample(sample)
+        return sample
+
+    def growth_per_iteration(self):
+        r"""Traced bytes retained per iteration between the first and the last sample"""
+        if not self.samples:
+            return None
+        first, last = self.first_sample, self.samples[-1]
+        if first.traced is None or last.iterations == first.iterations:
+            return None
+        return (last.traced - first.traced) / float(last.iterations - first.iterations)
+
+    def blocks_per_iteration(self):
+        r"""Memory blocks retained per iteration since `start` (snapshot diff; None without tracing)"""
+        if self._baseline is None or not tracemalloc.is_tracing():
+            return None
+        iterations = self.iterations - self.first_sample.iterations
+        if not iterations:
+            return None
+        blocks = sum(stat.count_diff for stat in self._snapshot().compare_to(self._baseline, 'filename'))
+        return blocks / float(iterations)
+
+    def working_set_per_iteration(self):
+        r"""Largest peak above the level of the previous sample, over the samples taken so far"""
+        samples = list(self.samples)
+        working_sets = [sample.peak - previous.traced for previous, sample in zip(samples, samples[1:])
+                        if sample.peak is not None and sample.iterations > previous.iterations]
+        return max(working_sets) if working_sets else None
+
+    def trend(self):
+        r"""Growth in bytes per hour of the traced memory and of the RSS (None with less than 2 samples)"""
+        traced = [(sample.time, sample.traced) for sample in self.samples if sample.traced is not None]
+        rss = [(sample.time, sample.rss) for sample in self.samples]
+        traced_slope, rss_slope = slope(traced), slope(rss)
+        return {
+            'traced_per_hour': traced_slope * 3600 if traced_slope is not None else None,
+            'rss_per_hour': rss_slope * 3600 if rss_slope is not None else None,
+        }
+
+    def top_sites(self, limit=10):
+        r"""The `limit` allocation sites whose traced memory grew the most since `start`"""
+        if self._baseline is None or not tracemalloc.is_tracing():
+            return []
+
+        sites = []
+        for stat in self._snapshot().compare_to(self._baseline, 'lineno')[:limit]:
+            frame = stat.traceback[0]
+            sites.append(AllocationSite('%s:%d' % (frame.filename, frame.lineno), stat.size_diff, stat.count_diff,
+                                        stat.size, stat.count, linecache.getline(frame.filename, frame.lineno).strip()))
+        return sites
+
+    def report(self, limit=10):
+        r"""Dictionary with the iterations, the last sample, growth, blocks and working set per iteration, trend and top sites"""
+        last = self.samples[-1] if self.samples else None
+        return {
+            'iterations': self.iterations,
+            'traced': last.traced if last is not None else None,
+            'rss': last.rss if last is not None else rss_bytes(),
+            'growth_per_iteration': self.growth_per_iteration(),
+            'blocks_per_iteration': self.blocks_per_iteration(),
+            'working_set_per_iteration': self.working_set_per_iteration(),
+            'trend': self.trend(),
+            'top_sites': [site._asdict() for site in self.top_sites(limit)],
+        }
+
+    @staticmethod
+    def _snapshot():
+        r"""tracemalloc snapshot without the allocations of the tracking itself"""
+        return tracemalloc.take_snapshot().filter_traces([
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, linecache.__file__),
+            tracemalloc.Filter(False, __file__),
+        ])
@@ -0,0 +1,195 @@
+# Copyright (c) 2019 charlysan
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+r"""Helpers to detect tags arriving to and departing from a reader"""
+
+from collections import namedtuple
+from time import sleep
+
+from .compat import monotonic
+from .deadline import Deadline
+
+EVENT_ARRIVED = 'arrived'
+EVENT_DEPARTED = 'departed'
+EVENT_STILL_PRESENT = 'still_present'
+
+# `dwell` is the time between the arrival and the last read of the tag (on arrival: 0)
+PresenceEvent = namedtuple('PresenceEvent', ['kind', 'reader', 'cid', 'uid', 'timestamp', 'dwell'])
+
+
+def wait_for_tag(rfid, interval=0.1, stop=None, deadline=None):
+    r"""Poll the reader until a tag is present
+
+    Arguments:
+    stop -- threading.Event (or CancellationToken) used to stop waiting
+    deadline -- Deadline object (or seconds from now). Raises DeadlineExceededError when exceeded.
+
+    Returns the PayloadResponse of the tag, or None if `stop` has been set.
+    """
+    deadline = Deadline.from_value(deadline)
+    tracker = PresenceTracker()
+    while stop is None or not stop.is_set():
+        payload_response = rfid.read_tag(deadline=deadline)
+        tracker.update(payload_response)
+        if tracker.present():
+            return payload_response
+        _pause(interval, stop, deadline)
+
+    return None
+
+
+def wait_for_departure(rfid, interval=0.1, misses=2, stop=None, deadline=None):
+    r"""Poll the reader until the tag has been taken away
+
+    A single missed read is not enough to consider the tag gone: `misses` consecutive
+    reads without id data are required (the departure rule of PresenceTracker). Any tag read,
+    even with a different CID and UID (e.g. the tag that has just been written), counts as present.
+
+    Arguments:
+    stop -- threading.Event (or CancellationToken) used to stop waiting
+    deadline -- Deadline object (or seconds from now). Raises DeadlineExceededError when exceeded.
+
+    Returns True once the tag has departed, or False if `stop` has been set.
+    """
+    deadline = Deadline.from_value(deadline)
+    tracker = PresenceTracker(misses)
+    while stop is None or not stop.is_set():
+        tracker.update(rfid.read_tag(deadline=deadline))
+        if tracker.absent():
+            return True
+        _pause(interval, stop, deadline)
+
+    return False
+
+
+def read_tags(rfid, interval=0.1, dedupe=None, stop=None, deadline=None):
+    r"""Poll the reader and yield the PayloadResponse of every tag read
+
+    Arguments:
+    dedupe -- dedupe.TtlDedupe or dedupe.BloomDedupe object. Tags already seen (by CID and UID) are skipped.
+    stop -- threading.Event (or CancellationToken) used to stop reading
+    deadline -- Deadline object (or seconds from now). Raises DeadlineExceededError when exceeded.
+    """
+    deadline = Deadline.from_value(deadline)
+    while stop is None or not stop.is_set():
+        payload_response = rfid.read_tag(deadline=deadline)
+        if payload_response.has_id_data():
+            tag = (payload_response.get_tag_cid(), payload_response.get_tag_uid())
+            if dedupe is None or not dedupe.seen(tag):
+                yield payload_response
+        _pause(interval, stop, deadline)
+
+
+class PresenceTracker(object):
+    r"""Turn the polls of a reader into arrival, departure and dwell time events
+
+    A tag has departed after `misses` consecutive polls without it, so a single missed read is not
+    taken as a departure. A different tag read while a tag is present is the departure of the first
+    one and the arrival of the second one.
+
+    E.g.
+        tracker = PresenceTracker(misses=2, reader='door')
+        for event in tracker.update(rfid.read_tag()):
+            print(event.kind, event.cid, event.uid, event.dwell)
+    """
+
+    def __init__(self, misses=2, still_present_interval=None, reader=None, clock=monotonic):
+        r"""Arguments:
+        misses -- Consecutive polls without the tag required to consider it departed
+        still_present_interval -- Seconds between `still_present` events while the tag stays (None: never)
+        reader -- Name of the reader reported in the events
+        clock -- Function returning the current time in seconds
+        """
+        self.misses = misses
+        self.still_present_interval = still_present_interval
+        self.reader = reader
+        self.clock = clock
+        self.tag = None
+        self.arrived_at = None
+        self.last_seen = None
+        self._missed = 0
+        self._reported_at = None
+
+    def present(self):
+        r"""Check if a tag is present"""
+        return self.tag is not None
+
+    def absent(self):
+        r"""Check if no tag has been read in the last `misses` polls (whether or not one was present before)"""
+        return self._missed >= self.misses
+
+    def update(self, payload_response, timestamp=None):
+        r"""Feed the PayloadResponse of a poll. Returns the list of PresenceEvent it causes (often empty)"""
+        now = self.clock() if timestamp is None else timestamp
+        events = []
+
+        if payload_response.has_id_data():
+            tag = (payload_response.get_tag_cid(), payload_response.get_tag_uid())
+            if self.tag is not None and tag != self.tag:
+                events.append(self._depart())
+            if self.tag is None:
+                self.tag = tag
+                self.arrived_at = self._reported_at = now
+                events.append(self._event(EVENT_ARRIVED, now))
+            elif self.still_present_interval is not None and now - self._reported_at >= self.still_present_interval:
+                self._reported_at = now
+                events.append(self._event(EVENT_STILL_PRESENT, now))
+            self.last_seen = now
+            self._missed = 0
+        else:
+            self._missed += 1
+            if self.tag is not None and self.absent():
+                events.append(self._depart())
+
+        return events
+
+    def _depart(self):
+        event = self._event(EVENT_DEPARTED, self.last_seen)
+        self.tag = None
+        return event
+
+    def _event(self, kind, timestamp):
+        cid, uid = self.tag
+        return PresenceEvent(kind, self.reader, cid, uid, timestamp, timestamp - self.arrived_at)
+
+
+def track_presence(rfid, interval=0.1, misses=2, still_present_interval=None, stop=None, deadline=None):
+    r"""Poll the reader and yield a PresenceEvent on every arrival, departure (and still present interval)
+
+    Arguments:
+    misses, still_present_interval -- See PresenceTracker
+    stop -- threading.Event (or CancellationToken) used to stop polling
+    deadline -- Deadline object (or seconds from now). Raises DeadlineExceededError when exceeded.
+    """
+    deadline = Deadline.from_value(deadline)
+    tracker = PresenceTracker(misses, still_present_interval, reader=rfid.name)
+    while stop is None or not stop.is_set():
+        for event in tracker.update(rfid.read_tag(deadline=deadline)):
+            yield event
+        _pause(interval, stop, deadline)
+
+
+def _pause(interval, stop, deadline):
+    if deadline is not None:
+        interval = min(interval, deadline.remaining())
+    if stop is not None:
+        stop.wait(interval)
+    elif interval > 0:
+        sleep(interval)
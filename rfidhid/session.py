@@ -0,0 +1,240 @@
+# Copyright (c) 2019 charlysan
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+r"""Sharing a device between threads
+
+Every RfidHid operation is a sequence of dependent transfers (SET_REPORT on report 1, then GET_REPORT on
+report 2, plus the beep workaround after a write). If several threads use the same RfidHid object at the
+same time those sequences interleave and responses get mixed up.
+
+A `RfidSession` owns the device: operations are submitted from any number of threads, queued by priority,
+and run one at a time on the session thread. Every submission returns a `Future`.
+"""
+
+import itertools
+import threading
+
+from .compat import queue
+from .deadline import RfidTimeoutError
+
+
+class SessionClosedError(RuntimeError):
+    r"""Raised when submitting an operation to a closed session"""
+
+
+class Future(object):
+    r"""Result of an operation run by a RfidSession
+
+    Mirrors the part of `concurrent.futures.Future` needed here, which is not available on Python 2.7.
+    """
+
+    def __init__(self):
+        self._done = threading.Event()
+        self._lock = threading.Lock()
+        self._result = None
+        self._exception = None
+        self._cancelled = False
+        self._running = False
+        self._callbacks = []
+
+    def cancel(self):
+        r"""Cancel the operation if it has not started yet. Returns True if it has been cancelled"""
+        with self._lock:
+            if self._running or self._done.is_set():
+                return self._cancelled
+            self._cancelled = True
+        self._finish()
+        return True
+
+    def cancelled(self):
+        return self._cancelled
+
+    def done(self):
+        return self._done.is_set()
+
+    def result(self, timeout=None):
+        r"""Wait for the operation and return its result (or raise its exception)
+
+        Raises RfidTimeoutError if the operation has not completed within `timeout` seconds.
+        """
+        if not self._done.wait(timeout):
+            raise RfidTimeoutError('Timed out waiting for the operation result.')
+        if self._cancelled:
+            raise SessionClosedError('Operation cancelled.')
+        if self._exception is not None:
+            raise self._exception
+        return self._result
+
+    def exception(self, timeout=None):
+        if not self._done.wait(timeout):
+            raise RfidTimeoutError('Timed out waiting for the operation result.')
+        return self._exception
+
+    def add_done_callback(self, callback):
+        r"""Call `callback(future)` when the operation completes (right away if it already has)"""
+        with self._lock:
+            if not self._done.is_set():
+                self._callbacks.append(callback)
+                return
+        callback(self)
+
+    def set_running(self):
+        r"""Returns False if the operation has been cancelled"""
+        with self._lock:
+            if self._cancelled:
+                return False
+            self._running = True
+            return True
+
+    def set_result(self, result):
+        self._result = result
+        self._finish()
+
+    def set_exception(self, exception):
+        self._exception = exception
+        self._finish()
+
+    def _finish(self):
+        with self._lock:
+            self._done.set()
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            callback(self)
+
+
+class RfidSession(object):
+    r"""Run the operations of a RfidHid object on a single thread, by priority
+
+    Operations with a lower priority value run first; operations with the same priority run in
+    submission order. By default writes run before reads, and reads before beeps.
+
+    E.g.
+        with RfidSession(RfidHid()) as session:
+            payload_response = session.read_tag().result()
+    """
+    PRIORITY_INIT = 0
+    PRIORITY_WRITE = 10
+    PRIORITY_READ = 20
+    PRIORITY_BEEP = 30
+
+    def __init__(self, rfid, priorities=None, name='rfid-session'):
+        r"""Arguments:
+        rfid -- RfidHid object owned by the session. It must not be used directly while the session is open.
+        priorities -- dict overriding the default priorities of 'init', 'write', 'read' and 'beep' operations
+        """
+        self.rfid = rfid
+        self.priorities = {
+            'init': self.PRIORITY_INIT,
+            'write': self.PRIORITY_WRITE,
+            'read': self.PRIORITY_READ,
+            'beep': self.PRIORITY_BEEP,
+        }
+        self.priorities.update(priorities or {})
+
+        self._queue = queue.PriorityQueue()
+        self._sequence = itertools.count()
+        self._lock = threading.Lock()
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name=name)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def submit(self, priority, function, *args, **kwargs):
+        r"""Queue `function(rfid, *args, **kwargs)` to be run on the session thread. Returns a Future"""
+        future = Future()
+        with self._lock:
+            if self._closed:
+                raise SessionClosedError('Session closed.')
+            self._queue.put((priority, next(self._sequence), function, args, kwargs, future))
+        return future
+
+    def init(self, **kwargs):
+        return self._call('init', 'init', **kwargs)
+
+    def read_tag(self, **kwargs):
+        r"""Queue RfidHid.read_tag. Returns a Future of the PayloadResponse"""
+        return self._call('read', 'read_tag', **kwargs)
+
+    def write_tag(self, id_bytes, **kwargs):
+        return self._call('write', 'write_tag', id_bytes, **kwargs)
+
+    def write_tag_from_cid_and_uid(self, cid, uid, **kwargs):
+        return self._call('write', 'write_tag_from_cid_and_uid', cid, uid, **kwargs)
+
+    def write_tag_and_verify(self, cid, uid, **kwargs):
+        r"""Queue RfidHid.write_tag_and_verify. The write and the verify read run as a single operation"""
+        return self._call('write', 'write_tag_and_verify', cid, uid, **kwargs)
+
+    def beep(self, times=1, **kwargs):
+        return self._call('beep', 'beep', times, **kwargs)
+
+    def pending(self):
+        r"""Number of queued operations (approximate)"""
+        return self._queue.qsize()
+
+    def close(self, cancel_pending=False):
+        r"""Stop accepting operations and wait for the queued ones (cancel them if `cancel_pending`)"""
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            # runs after every queued operation
+            self._queue.put((float('inf'), next(self._sequence), None, None, None, None))
+
+        if cancel_pending:
+            for item in self._drain():
+                item[-1].cancel()
+        self._thread.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def _call(self, kind, method, *args, **kwargs):
+        return self.submit(self.priorities[kind], lambda rfid: getattr(rfid, method)(*args, **kwargs))
+
+    def _drain(self):
+        r"""Remove the queued operations (keeping the stop marker)"""
+        items = []
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                return items
+            if item[2] is None:
+                self._queue.put(item)
+                return items
+            items.append(item)
+
+    def _run(self):
+        while True:
+            _, _, function, args, kwargs, future = self._queue.get()
+            if function is None:
+                return
+            if not future.set_running():
+                continue
+            try:
+                result = function(self.rfid, *args, **kwargs)
+            except Exception as e:
+                future.set_exception(e)
+            else:
+                future.set_result(result)
@@ -0,0 +1,333 @@
+# Copyright (c) 2019 charlysan
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+r"""Tag event sinks
+
+RfidHid reports every tag read (with ID data) and every tag written to the `sink` it has been created with
+(see `RfidHid(sink=...)`). A sink is any object with a `record(event)` method taking a `TagEvent`; it is called
+from the reader loop, so it must not block.
+
+`SqliteSink` stores the events in a SQLite database. Events are queued and inserted in batches, one
+transaction per batch, by a background thread (see `BatchSink`). `EventLog` runs summary queries on the same database; the
+database is in WAL mode so queries do not block the writer (and vice versa).
+"""
+
+import sqlite3
+import threading
+import time
+from collections import namedtuple
+
+from .compat import queue
+
+TagEvent = namedtuple('TagEvent', ['timestamp', 'kind', 'cid', 'uid', 'tag_type', 'reader'])
+
+DaySummary = namedtuple('DaySummary', ['day', 'cid', 'uid', 'first', 'last', 'reads'])
+
+UidSummary = namedtuple('UidSummary', ['cid', 'uid', 'reads', 'writes', 'first', 'last'])
+
+EVENT_READ = 'read'
+EVENT_WRITE = 'write'
+
+
+def tag_event(kind, cid, uid, tag_type=None, reader=None):
+    r"""Create a TagEvent timestamped (in seconds since the epoch) now"""
+    return TagEvent(time.time(), kind, cid, uid, tag_type, reader)
+
+
+class SinkGroup(object):
+    r"""Record every event on several sinks"""
+
+    def __init__(self, *sinks):
+        self.sinks = sinks
+
+    def record(self, event):
+        for sink in self.sinks:
+            sink.record(event)
+
+    def flush(self):
+        for sink in self.sinks:
+            sink.flush()
+
+    def close(self):
+        for sink in self.sinks:
+            sink.close()
+
+
+class BatchSink(object):
+    r"""Base class of the sinks that store events in batches on a background thread
+
+    Subclasses implement `_open` (called on the background thread), `_write(batch)`, and optionally
+    `_idle` (called when no event has arrived within `flush_interval`) and `_close`.
+
+    An exception raised by `_write` or `_idle` does not stop the background thread: it is counted in
+    `errors` (and kept in `last_error`), the batch is discarded and the next events are written as usual.
+    An exception raised by `_open` stops it: it is kept in `error` and raised again by `record`, `flush`
+    and `close`.
+    """
+
+    def __init__(self, batch_size=500, flush_interval=1.0, max_pending=100000, name='sink'):
+        r"""Arguments:
+        batch_size -- Maximum number of events written at once
+        flush_interval -- Maximum seconds an event waits in the queue before being written
+        max_pending -- Maximum number of queued events. Events recorded while the queue is full are
+                       dropped (and counted in `dropped`) instead of blocking the reader loop.
+        """
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.dropped = 0
+        self.written = 0
+        self.errors = 0
+        self.last_error = None
+        self.error = None
+        self._queue = queue.Queue(max_pending)
+        self._closed = False
+
+        self._thread = threading.Thread(target=self._run, name=name)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def record(self, event):
+        r"""Queue a TagEvent to be stored. Never blocks"""
+        self._raise_error()
+        try:
+            self._queue.put_nowait(event)
+        except queue.Full:
+            self.dropped += 1
+
+    def flush(self, timeout=None):
+        r"""Wait until every queued event has been written
+
+        Returns False if the events are still queued after `timeout` seconds (None: no limit) or if the
+        background thread has stopped.
+        """
+        self._raise_error()
+        deadline = None if timeout is None else time.time() + timeout
+        done = self._queue.all_tasks_done
+        with done:
+            while self._queue.unfinished_tasks:
+                if not self._thread.is_alive():
+                    self._raise_error()
+                    return False
+                wait = self.flush_interval
+                if deadline is not None:
+                    wait = min(wait, deadline - time.time())
+                    if wait <= 0:
+                        return False
+                done.wait(wait)
+        return True
+
+    def close(self):
+        r"""Write the queued events and stop the background thread"""
+        if self._closed:
+            return
+        self._closed = True
+        # the background thread might have stopped with the queue full
+        while self._thread.is_alive():
+            try:
+                self._queue.put(None, timeout=self.flush_interval)
+                break
+            except queue.Full:
+                pass
+        self._thread.join()
+        self._raise_error()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def _open(self):
+        pass
+
+    def _write(self, batch):
+        raise NotImplementedError()
+
+    def _idle(self):
+        pass
+
+    def _close(self):
+        pass
+
+    def _raise_error(self):
+        if self.error is not None:
+            raise self.error
+
+    def _run(self):
+        try:
+            self._open()
+        except Exception as e:
+            self.errors += 1
+            self.error = self.last_error = e
+            return
+
+        try:
+            running = True
+            while running:
+                batch, running = self._next_batch()
+                try:
+                    if batch:
+                        self._write(batch)
+                    elif running:
+                        self._idle()
+                except Exception as e:
+                    self.errors += 1
+                    self.last_error = e
+                finally:
+                    for _ in range(len(batch) + (0 if running else 1)):
+                        self._queue.task_done()
+        finally:
+            self._close()
+
+    def _next_batch(self):
+        r"""Wait for an event, then collect the ones already queued. Returns (events, running)"""
+        try:
+            event = self._queue.get(timeout=self.flush_interval)
+        except queue.Empty:
+            return [], True
+
+        batch = []
+        while event is not None:
+            batch.append(event)
+            if len(batch) >= self.batch_size:
+                return batch, True
+            try:
+                event = self._queue.get_nowait()
+            except queue.Empty:
+                return batch, True
+
+        # None: closed
+        return batch, False
+
+
+class SqliteSink(BatchSink):
+    r"""Store tag events in a SQLite database using batched inserts on a background thread"""
+
+    SCHEMA = (
+        'CREATE TABLE IF NOT EXISTS events ('
+        '    id INTEGER PRIMARY KEY,'
+        '    timestamp REAL NOT NULL,'
+        '    kind TEXT NOT NULL,'
+        '    cid INTEGER,'
+        '    uid INTEGER,'
+        '    tag_type INTEGER,'
+        '    reader TEXT)',
+        'CREATE INDEX IF NOT EXISTS events_uid_timestamp ON events (uid, timestamp)',
+        'CREATE INDEX IF NOT EXISTS events_timestamp ON events (timestamp)',
+    )
+
+    INSERT = 'INSERT INTO events (timestamp, kind, cid, uid, tag_type, reader) VALUES (?, ?, ?, ?, ?, ?)'
+
+    connection = None
+
+    def __init__(self, path, batch_size=500, flush_interval=1.0, max_pending=100000):
+        r"""Arguments:
+        path -- Database file (created if it does not exist)
+        batch_size, flush_interval, max_pending -- See `BatchSink`
+        """
+        self.path = path
+
+        # create the schema before returning, so EventLog can be used right away
+        self._connect().close()
+
+        super(SqliteSink, self).__init__(batch_size, flush_interval, max_pending, name='sqlite-sink')
+
+    def _connect(self):
+        connection = sqlite3.connect(self.path)
+        connection.execute('PRAGMA journal_mode=WAL')
+        # with WAL a crash might lose the last transactions, but never corrupts the database
+        connection.execute('PRAGMA synchronous=NORMAL')
+        for statement in self.SCHEMA:
+            connection.execute(statement)
+        connection.commit()
+        return connection
+
+    def _open(self):
+        # sqlite3 connections can only be used by the thread that created them
+        self.connection = self._connect()
+
+    def _write(self, batch):
+        with self.connection:
+            self.connection.executemany(self.INSERT, batch)
+        self.written += len(batch)
+
+    def _close(self):
+        self.connection.close()
+
+
+class EventLog(object):
+    r"""Queries on a database written by SqliteSink
+
+    Time ranges are given in seconds since the epoch: `start` is inclusive and `end` is exclusive.
+    Days are in local time.
+    """
+
+    def __init__(self, path):
+        self.connection = sqlite3.connect(path)
+
+    def first_last_seen(self, uid=None, start=None, end=None):
+        r"""First and last time every UID has been read on each day
+
+        Returns a list of DaySummary sorted by day and UID
+        """
+        where, params = self._where(EVENT_READ, uid, start, end)
+        rows = self.connection.execute(
+            "SELECT date(timestamp, 'unixepoch', 'localtime') AS day, cid, uid, MIN(timestamp), MAX(timestamp), "
+            "COUNT(*) FROM events %s GROUP BY day, cid, uid ORDER BY day, uid, cid" % where, params)
+        return [DaySummary(*row) for row in rows]
+
+    def summary(self, uid=None, start=None, end=None):
+        r"""Number of reads and writes of every UID, along with the first and last time it has been seen
+
+        Returns a list of UidSummary sorted by UID
+        """
+        where, params = self._where(None, uid, start, end)
+        rows = self.connection.execute(
+            "SELECT cid, uid, SUM(kind = 'read'), SUM(kind = 'write'), MIN(timestamp), MAX(timestamp) "
+            "FROM events %s GROUP BY cid, uid ORDER BY uid, cid" % where, params)
+        return [UidSummary(*row) for row in rows]
+
+    def events(self, uid=None, start=None, end=None, limit=None):
+        r"""Returns a list of TagEvent sorted by time"""
+        where, params = self._where(None, uid, start, end)
+        sql = 'SELECT timestamp, kind, cid, uid, tag_type, reader FROM events %s ORDER BY timestamp' % where
+        if limit is not None:
+            sql += ' LIMIT ?'
+            params.append(limit)
+        return [TagEvent(*row) for row in self.connection.execute(sql, params)]
+
+    def close(self):
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    @staticmethod
+    def _where(kind, uid, start, end):
+        conditions, params = [], []
+        for condition, value in (('kind = ?', kind), ('uid = ?', uid), ('timestamp >= ?', start),
+                                 ('timestamp < ?', end)):
+            if value is not None:
+                conditions.append(condition)
+                params.append(value)
+        return ('WHERE ' + ' AND '.join(conditions) if conditions else ''), params
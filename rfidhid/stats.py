@@ -0,0 +1,145 @@
+# Copyright (c) 2019 charlysan
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+r"""Latency statistics"""
+
+import functools
+import math
+import threading
+from collections import OrderedDict
+
+from .compat import monotonic
+
+
+def percentile(values, p):
+    r"""Get the p-th percentile (0-100) of a list of values (nearest rank)"""
+    if not values:
+        return None
+
+    ordered = sorted(values)
+    rank = int(math.ceil(p / 100.0 * len(ordered)))
+    return ordered[max(rank, 1) - 1]
+
+
+class LatencyHistogram(object):
+    r"""Fixed-size histogram of durations (in seconds) with logarithmic buckets
+
+    Memory does not grow with the number of samples, so it can be used in long running processes.
+    Percentiles are approximated by the upper bound of the bucket, which is within `growth` (5% by
+    default) of the actual value.
+    """
+
+    def __init__(self, lowest=1e-6, highest=1e3, growth=1.05):
+        self.lowest = lowest
+        self.growth = growth
+        self._log_growth = math.log(growth)
+        self.buckets = [0] * (int(math.log(highest / lowest) / self._log_growth) + 2)
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = None
+
+    def add(self, value):
+        index = 0
+        if value > self.lowest:
+            index = min(int(math.log(value / self.lowest) / self._log_growth) + 1, len(self.buckets) - 1)
+
+        self.buckets[index] += 1
+        self.count += 1
+        self.total += value
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+
+    def merge(self, other):
+        r"""Add the samples of another histogram with the same bucket layout"""
+        for index, count in enumerate(other.buckets):
+            self.buckets[index] += count
+        self.count += other.count
+        self.total += other.total
+        if other.count:
+            self.min = other.min if self.min is None else min(self.min, other.min)
+            self.max = other.max if self.max is None else max(self.max, other.max)
+
+    def mean(self):
+        return self.total / self.count if self.count else None
+
+    def percentile(self, p):
+        r"""Get the (approximate) p-th percentile (0-100)"""
+        if not self.count:
+            return None
+
+        rank = max(int(math.ceil(p / 100.0 * self.count)), 1)
+        seen = 0
+        for index, count in enumerate(self.buckets):
+            seen += count
+            if seen >= rank:
+                upper = self.lowest * self.growth ** index
+                return min(max(upper, self.min), self.max)
+
+    def summary(self):
+        r"""Dictionary with count, mean, min, p50, p95, p99 and max"""
+        return {
+            'count': self.count,
+            'mean': self.mean(),
+            'min': self.min,
+            'p50': self.percentile(50),
+            'p95': self.percentile(95),
+            'p99': self.percentile(99),
+            'max': self.max,
+        }
+
+
+class Profiler(object):
+    r"""Wall clock time accounting by name (e.g. state callbacks, USB transfers)
+
+    Each name keeps a LatencyHistogram of the timed calls. Thread safe.
+    """
+
+    def __init__(self, clock=monotonic):
+        self.clock = clock
+        self.timers = OrderedDict()
+        self._lock = threading.Lock()
+
+    def add(self, name, elapsed):
+        with self._lock:
+            timer = self.timers.get(name)
+            if timer is None:
+                timer = self.timers[name] = LatencyHistogram()
+            timer.add(elapsed)
+
+    def wrap(self, name, function):
+        r"""Returns `function` wrapped so that every call is timed as `name`, even if it raises"""
+        @functools.wraps(function)
+        def timed(*args, **kwargs):
+            started = self.clock()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                self.add(name, self.clock() - started)
+
+        return timed
+
+    def total(self, name):
+        timer = self.timers.get(name)
+        return timer.total if timer is not None else 0.0
+
+    def count(self, name):
+        timer = self.timers.get(name)
+        return timer.count if timer is not None else 0
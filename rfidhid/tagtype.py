@@ -0,0 +1,118 @@
+# Copyright (c) 2019 charlysan
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+r"""Automatic tag type (EM4305 / T5577) detection
+
+Writes are sent with the most likely tag type; if the verify read fails they are retried with the
+other type. The type that worked is remembered per tag and per lot (tags of the same batch have
+UIDs sharing the same high bits), so later writes of the same or similar tags go straight to the
+right type.
+"""
+
+from .core import RfidHid
+from .cache import LruCache
+from .deadline import Deadline
+
+TAG_TYPES = (RfidHid.TAG_EM4305, RfidHid.TAG_T5577)
+
+SOURCE_TAG = 'tag'
+SOURCE_LOT = 'lot'
+SOURCE_DEFAULT = 'default'
+
+
+class TagTypeDetector(object):
+    r"""Guess the type of a tag and learn from the writes that worked"""
+
+    def __init__(self, default=RfidHid.TAG_EM4305, lot_shift=16, max_size=4096):
+        r"""Arguments:
+        default -- Type guessed for unknown tags until a write has succeeded; then the last type that
+                   worked is used
+        lot_shift -- Tags whose UIDs (and CIDs) only differ in the lowest `lot_shift` bits belong to the same lot
+        max_size -- Number of tags (and lots) remembered
+        """
+        self.default = default
+        self.lot_shift = lot_shift
+        self.tags = LruCache(max_size)
+        self.lots = LruCache(max_size)
+        self.guesses = dict((source, 0) for source in (SOURCE_TAG, SOURCE_LOT, SOURCE_DEFAULT))
+        self.first_try = 0
+        self.retried = 0
+        self.failed = 0
+
+    def guess(self, tag=None):
+        r"""Most likely type of a tag. `tag` is the (cid, uid) read from it, or None if unknown
+
+        Returns (tag_type, source), `source` being SOURCE_TAG, SOURCE_LOT or SOURCE_DEFAULT
+        """
+        if tag is not None:
+            tag_type = self.tags.get(tag)
+            if tag_type is not None:
+                return tag_type, SOURCE_TAG
+            tag_type = self.lots.get(self._lot(tag))
+            if tag_type is not None:
+                return tag_type, SOURCE_LOT
+        return self.default, SOURCE_DEFAULT
+
+    def record(self, tag_type, *tags):
+        r"""Remember the type of a tag known by any of the (cid, uid) `tags`"""
+        for tag in tags:
+            if tag is not None:
+                self.tags.put(tag, tag_type)
+                self.lots.put(self._lot(tag), tag_type)
+        self.default = tag_type
+
+    def stats(self):
+        r"""Dictionary with the guesses by source and the hit rate of the first write"""
+        writes = self.first_try + self.retried + self.failed
+        return dict(self.guesses, first_try=self.first_try, retried=self.retried, failed=self.failed,
+                    hit_rate=float(self.first_try) / writes if writes else None)
+
+    def _lot(self, tag):
+        cid, uid = tag
+        return cid, uid >> self.lot_shift
+
+
+def write_tag_and_verify_auto(rfid, cid, uid, detector, tag=None, verify_delay=0.2, timeout=None, deadline=None,
+                              cancel=None):
+    r"""Write a tag with the type guessed by `detector`, retrying with the other type if the verify fails
+
+    Arguments:
+    rfid -- RfidHid object
+    detector -- TagTypeDetector
+    tag -- (cid, uid) read from the tag before writing it, if known
+    verify_delay, timeout, deadline, cancel -- See `RfidHid.write_tag_and_verify`
+
+    Returns the tag type that worked, or None if the verify failed with both types
+    """
+    deadline = Deadline.from_value(deadline)
+    tag_type, source = detector.guess(tag)
+    detector.guesses[source] += 1
+
+    for attempt, tag_type in enumerate((tag_type, TAG_TYPES[1 - TAG_TYPES.index(tag_type)])):
+        if rfid.write_tag_and_verify(cid, uid, tag_type, verify_delay, timeout, deadline, cancel):
+            if attempt:
+                detector.retried += 1
+            else:
+                detector.first_try += 1
+            detector.record(tag_type, tag, (cid, uid))
+            return tag_type
+
+    detector.failed += 1
+    return None
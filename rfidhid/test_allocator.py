@@ -0,0 +1,187 @@
+# Copyright (c) 2019 charlysan
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import multiprocessing
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+from mock import mock
+from rfidhid.allocator import UidAllocator, JournaledUidAllocator, UidExhaustedError
+
+
+def allocate_from_journal(path, count, results):
+    allocator = JournaledUidAllocator(path, 0, block_size=10)
+    results.put([allocator.allocate() for _ in range(count)])
+    allocator.close()
+
+
+class TestUidAllocator(unittest.TestCase):
+
+    def test_allocate_with_step(self):
+        allocator = UidAllocator(10, step=5)
+        actual = [allocator.allocate() for _ in range(3)]
+        self.assertEqual([10, 15, 20], actual)
+
+    def test_reserve_truncated_by_limit(self):
+        allocator = UidAllocator(0, limit=4)
+        self.assertEqual([0, 1, 2], allocator.reserve(3))
+        self.assertEqual([3, 4], allocator.reserve(3))
+        self.assertRaises(UidExhaustedError, allocator.reserve, 1)
+
+    def test_requeued_uids_are_reissued_first(self):
+        allocator = UidAllocator(100)
+        allocator.reserve(4)
+        allocator.requeue([102, 101])
+        self.assertEqual([101, 102, 104], allocator.reserve(3))
+        self.assertEqual(0xffffffff - 104, allocator.remaining())
+
+    def test_exhausted_waits_for_outstanding_uids(self):
+        allocator = UidAllocator(0, limit=1)
+        uids = allocator.reserve(2)
+        self.assertFalse(allocator.exhausted())
+        allocator.requeue(uids[1:])
+        self.assertFalse(allocator.exhausted())
+        allocator.commit(uids[:1] + allocator.reserve(1))
+        self.assertTrue(allocator.exhausted())
+
+    def test_concurrent_allocations_are_unique(self):
+        allocator = UidAllocator(0, limit=3999)
+        allocated = []
+
+        def worker():
+            while True:
+                try:
+                    allocated.extend(allocator.reserve(7))
+                except UidExhaustedError:
+                    return
+
+        threads = [threading.Thread(target=worker) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(list(range(4000)), sorted(allocated))
+
+
+class TestJournaledUidAllocator(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp_dir, 'uids.journal')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_restart_continues_after_reserved_block(self):
+        with JournaledUidAllocator(self.path, 1000, step=2, block_size=5) as allocator:
+            self.assertEqual([1000, 1002, 1004], allocator.reserve(3))
+
+        with JournaledUidAllocator(self.path, 0, step=2, block_size=5) as allocator:
+            self.assertEqual(1010, allocator.allocate())
+            self.assertEqual([(1006, 1010, 'closed')], allocator.gaps())
+
+    def test_requeued_uids_become_gaps_on_close(self):
+        with JournaledUidAllocator(self.path, 0, block_size=4) as allocator:
+            allocator.reserve(4)
+            allocator.requeue([1])
+
+        with JournaledUidAllocator(self.path, 0) as allocator:
+            self.assertEqual([(1, 2, 'closed')], allocator.gaps())
+
+    def test_block_of_crashed_owner_becomes_gap(self):
+        crashed = JournaledUidAllocator(self.path, 0, block_size=10)
+        crashed.reserve(3)
+
+        with mock.patch.object(JournaledUidAllocator, '_owner_alive', return_value=False):
+            allocator = JournaledUidAllocator(self.path, 0, block_size=10)
+
+        self.assertEqual(10, allocator.allocate())
+        self.assertEqual([(0, 10, 'crashed')], allocator.gaps())
+
+    def test_block_of_previous_process_with_same_pid_becomes_gap(self):
+        with open(self.path, 'wb') as journal:
+            journal.write(b'R %d:1:0a1b2c3d 0 10\n' % os.getpid())
+
+        with JournaledUidAllocator(self.path, 0, block_size=10) as allocator:
+            self.assertEqual(10, allocator.allocate())
+            self.assertEqual([(0, 10, 'crashed')], allocator.gaps())
+
+    def test_block_of_other_allocator_in_same_process_is_kept(self):
+        with JournaledUidAllocator(self.path, 0, block_size=10) as first:
+            first.reserve(3)
+            with JournaledUidAllocator(self.path, 0, block_size=10) as second:
+                self.assertEqual(10, second.allocate())
+                self.assertEqual([], second.gaps())
+
+    def test_uncommitted_uids_become_void_on_close(self):
+        with JournaledUidAllocator(self.path, 0, block_size=10) as allocator:
+            uids = allocator.reserve(5)
+            allocator.commit(uids[:2])
+            allocator.requeue(uids[4:])
+
+        with JournaledUidAllocator(self.path, 0) as allocator:
+            self.assertEqual([(2, 3), (3, 4)], allocator.voided())
+            self.assertEqual([(5, 10, 'closed'), (4, 5, 'closed')], allocator.gaps())
+        allocator.close()
+
+    def test_voided_uids_are_journaled_right_away(self):
+        allocator = JournaledUidAllocator(self.path, 0, block_size=10)
+        allocator.void(allocator.reserve(2)[1:])
+
+        with JournaledUidAllocator(self.path, 0) as other:
+            self.assertEqual([(1, 2)], other.voided())
+        allocator.close()
+
+    def test_torn_record_is_discarded(self):
+        with JournaledUidAllocator(self.path, 0, block_size=10) as allocator:
+            allocator.allocate()
+        with open(self.path, 'ab') as journal:
+            journal.write(b'R 1:dead 10')
+
+        with JournaledUidAllocator(self.path, 0, block_size=10) as allocator:
+            self.assertEqual(10, allocator.allocate())
+
+    def test_limit_is_shared_across_allocators(self):
+        first = JournaledUidAllocator(self.path, 0, limit=14, block_size=10)
+        second = JournaledUidAllocator(self.path, 0, limit=14, block_size=10)
+
+        self.assertEqual(list(range(10)), first.reserve(10))
+        self.assertEqual(list(range(10, 15)), second.reserve(10))
+        self.assertRaises(UidExhaustedError, first.reserve, 1)
+        first.close()
+        second.close()
+
+    def test_concurrent_processes_get_unique_uids(self):
+        results = multiprocessing.Queue()
+        processes = [multiprocessing.Process(target=allocate_from_journal, args=(self.path, 95, results))
+                     for _ in range(3)]
+        for process in processes:
+            process.start()
+        allocated = [uid for _ in processes for uid in results.get(timeout=30)]
+        for process in processes:
+            process.join()
+
+        self.assertEqual(len(allocated), len(set(allocated)))
+        with JournaledUidAllocator(self.path, 0) as allocator:
+            skipped = sum(end - first for first, end, _ in allocator.gaps())
+            self.assertEqual(300, len(allocated) + skipped)
@@ -0,0 +1,101 @@
+# Copyright (c) 2019 charlysan
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import unittest
+from mock import mock
+from rfidhid.bench import HardwareBench
+from rfidhid.compat import monotonic
+from rfidhid.core import RfidHid
+from rfidhid.emulator import EmulatedHID, EmulatedTag, FaultInjector
+
+
+class BusyHID(EmulatedHID):
+    r"""Does not take a command sent less than `busy` seconds after the previous response"""
+
+    def __init__(self, busy, **kwargs):
+        super(BusyHID, self).__init__(**kwargs)
+        self.busy = busy
+        self.last_response = None
+
+    def set_feature_report(self, report_number, data, timeout=None):
+        if self.last_response is not None and monotonic() - self.last_response < self.busy:
+            return 0
+        return super(BusyHID, self).set_feature_report(report_number, data, timeout)
+
+    def get_feature_report(self, report_number, report_length, timeout=None):
+        response = super(BusyHID, self).get_feature_report(report_number, report_length, timeout)
+        self.last_response = monotonic()
+        return response
+
+
+class TestHardwareBench(unittest.TestCase):
+
+    def test_read_polls(self):
+        hid = EmulatedHID(tag=EmulatedTag(1, 2))
+        result = HardwareBench(RfidHid(hid=hid), warmup=5, repetitions=20).read_polls()
+
+        self.assertEqual(50, hid.transfers)
+        self.assertEqual((20, 0), (result['count'], result['errors']))
+        self.assertGreater(result['rate'], 0)
+        self.assertLessEqual(result['p50'], result['max'])
+
+    def test_errors_are_counted_not_timed(self):
+        hid = EmulatedHID(faults=FaultInjector(usb_error_rate=0.5, seed=1))
+        result = HardwareBench(RfidHid(hid=hid), warmup=0, repetitions=100).round_trip()
+
+        self.assertEqual(100, result['count'] + result['errors'])
+        self.assertGreater(result['errors'], 0)
+
+    def test_write_verify_keeps_the_tag_id(self):
+        hid = EmulatedHID(tag=EmulatedTag(12, 3456))
+        result = HardwareBench(RfidHid(hid=hid), write_repetitions=3).write_verify(RfidHid.TAG_EM4305, 0)
+
+        self.assertEqual((3, 0), (result['count'], result['errors']))
+        self.assertEqual((12, 3456), (hid.tag.cid, hid.tag.uid))
+
+    def test_write_verify_runs_few_writes(self):
+        hid = EmulatedHID(tag=EmulatedTag(12, 3456))
+        hid.set_feature_report = mock.Mock(side_effect=hid.set_feature_report)
+        result = HardwareBench(RfidHid(hid=hid)).write_verify(RfidHid.TAG_EM4305, 0)
+
+        writes = [call for call in hid.set_feature_report.call_args_list
+                  if call[0][1][EmulatedHID.CMD_POS] == EmulatedHID.CMD_WRITE_TAG]
+        self.assertEqual(5, result['count'])
+        self.assertEqual(5, len(writes))
+
+    def test_round_trip_short_set_report_is_an_error(self):
+        hid = EmulatedHID()
+        hid.set_feature_report = mock.Mock(return_value=8)
+        result = HardwareBench(RfidHid(hid=hid), warmup=0, repetitions=10).round_trip()
+
+        self.assertEqual((0, 10), (result['count'], result['errors']))
+
+    def test_write_verify_requires_a_tag(self):
+        bench = HardwareBench(RfidHid(hid=EmulatedHID()))
+        self.assertRaises(ValueError, bench.write_verify, RfidHid.TAG_EM4305)
+
+    def test_min_gap(self):
+        bench = HardwareBench(RfidHid(hid=BusyHID(0.004)), repetitions=5)
+        result = bench.min_gap()
+
+        self.assertEqual(0.005, result['min_gap'])
+        self.assertEqual([0, 0, 0, 0], [gap['errors'] for gap in result['gaps'][:-1]])
+        self.assertEqual(0.002, result['gaps'][-1]['gap'])
+        self.assertGreater(result['gaps'][-1]['errors'], 0)
@@ -0,0 +1,75 @@
+# Copyright (c) 2019 charlysan
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import unittest
+from rfidhid.cache import TtlCache, LruCache
+
+
+class FakeClock(object):
+    now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestTtlCache(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = FakeClock()
+        self.cache = TtlCache(max_size=2, ttl=10, clock=self.clock)
+
+    def test_keys_expire(self):
+        self.cache.add((12, 1))
+        self.clock.now = 9.9
+        self.assertTrue((12, 1) in self.cache)
+        self.clock.now = 10
+        self.assertFalse((12, 1) in self.cache)
+        self.assertEqual(0, len(self.cache))
+
+    def test_add_refreshes_expiration(self):
+        self.cache.add((12, 1))
+        self.clock.now = 5
+        self.cache.add((12, 1))
+        self.clock.now = 12
+        self.assertTrue((12, 1) in self.cache)
+
+    def test_oldest_key_is_evicted_when_full(self):
+        self.cache.add((12, 1))
+        self.cache.add((12, 2))
+        self.cache.add((12, 1))
+        self.cache.add((12, 3))
+        self.assertFalse((12, 2) in self.cache)
+        self.assertTrue((12, 1) in self.cache)
+        self.assertTrue((12, 3) in self.cache)
+
+
+class TestLruCache(unittest.TestCase):
+
+    def test_least_recently_used_key_is_evicted(self):
+        cache = LruCache(max_size=2)
+        cache.put('a', 1)
+        cache.put('b', 2)
+        self.assertEqual(1, cache.get('a'))
+        cache.put('c', 3)
+        self.assertFalse('b' in cache)
+        self.assertEqual(1, cache.get('a'))
+        self.assertEqual(3, cache.get('c'))
+        self.assertEqual(None, cache.get('b'))
+        self.assertEqual(2, len(cache))
@@ -0,0 +1,100 @@
+# Copyright (c) 2019 charlysan
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import unittest
+import usb.core
+from mock import mock
+from rfidhid.capture import Capture, numpy
+from rfidhid.core import RfidHid
+from rfidhid.emulator import EmulatedHID, EmulatedTag
+
+
+class TestRfidHidCapture(unittest.TestCase):
+
+    def test_capture_max_samples(self):
+        hid = EmulatedHID(tag=EmulatedTag(77, 1234567890))
+        capture = RfidHid(hid=hid).capture(max_samples=10)
+
+        self.assertEqual(10, len(capture))
+        self.assertEqual(1.0, capture.hit_rate())
+        self.assertEqual({(77, 1234567890): 10}, capture.uid_counts())
+        self.assertEqual([68] * 10, list(capture.crc))
+        self.assertEqual(sorted(capture.timestamp), list(capture.timestamp))
+
+    def test_capture_duration(self):
+        now = [0]
+
+        def clock():
+            now[0] += 0.01
+            return now[0]
+
+        # one clock reading per poll
+        capture = RfidHid(hid=EmulatedHID()).capture(duration=1, clock=clock)
+        self.assertEqual(99, len(capture))
+        self.assertEqual(0.0, capture.hit_rate())
+
+    def test_failed_polls_are_counted(self):
+        hid = EmulatedHID(tag=EmulatedTag(1, 2))
+        # USB error, short write (Communication Error), then 3 polls
+        hid.set_feature_report = mock.Mock(side_effect=[usb.core.USBError('Pipe error'), 0, 256, 256, 256])
+
+        capture = RfidHid(hid=hid).capture(max_samples=5)
+        self.assertEqual((3, 2), (len(capture), capture.errors))
+
+
+class CaptureHelpersMixin(object):
+    use_numpy = None
+
+    def setUp(self):
+        self.capture = Capture(10, use_numpy=self.use_numpy)
+        for timestamp, hit, cid, uid in [(0.0, True, 1, 10), (0.01, False, 0, 0), (0.02, True, 1, 10),
+                                         (0.05, True, 2, 20), (0.3, True, 1, 10), (0.31, False, 0, 0)]:
+            self.capture.append(timestamp, hit, cid, uid)
+
+    def test_hit_rate(self):
+        self.assertAlmostEqual(4 / 6.0, self.capture.hit_rate())
+
+    def test_gaps(self):
+        self.assertEqual([0.02, 0.03, 0.25], [round(gap, 6) for gap in self.capture.gaps()])
+
+    def test_gap_histogram(self):
+        self.assertEqual([0, 2, 0, 1], self.capture.gap_histogram([0, 0.01, 0.05, 0.1, 1]))
+
+    def test_uid_counts(self):
+        self.assertEqual({(1, 10): 3, (2, 20): 1}, self.capture.uid_counts())
+
+    def test_empty(self):
+        capture = Capture(10, use_numpy=self.use_numpy)
+        self.assertIsNone(capture.hit_rate())
+        self.assertEqual([0, 0], capture.gap_histogram([0, 0.1, 1]))
+        self.assertEqual({}, capture.uid_counts())
+
+
+class TestCaptureArrays(CaptureHelpersMixin, unittest.TestCase):
+    use_numpy = False
+
+
+@unittest.skipIf(numpy is None, 'NumPy is not installed')
+class TestCaptureNumpy(CaptureHelpersMixin, unittest.TestCase):
+    use_numpy = True
+
+    def test_structured_array(self):
+        self.assertEqual(('timestamp', 'hit', 'cid', 'uid', 'crc'), self.capture.samples.dtype.names)
+        self.assertEqual(10, len(self.capture.samples))
@@ -0,0 +1,227 @@
+# Copyright (c) 2019 charlysan
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import errno
+import threading
+import time
+import unittest
+import usb.core
+from mock import mock
+from rfidhid.core import RfidHid
+from rfidhid.clone import BulkCloner, CloneStation
+from rfidhid.emulator import EmulatedHID, EmulatedTag
+from rfidhid.tagtype import TagTypeDetector
+
+
+class ConveyorHID(EmulatedHID):
+    r"""Emulated reader where the given tags show up one after another, each one for a few reads"""
+
+    def __init__(self, tags, reads_per_tag=4):
+        super(ConveyorHID, self).__init__(tags[0])
+        self.queue = list(tags[1:])
+        self.reads_per_tag = reads_per_tag
+        self.reads = 0
+
+    def _read_response(self):
+        self.reads += 1
+        if self.reads % self.reads_per_tag == 0:
+            # take the current tag away, and bring the next one after a couple of reads
+            self.tag = None if self.tag is not None or not self.queue else self.queue.pop(0)
+        return super(ConveyorHID, self)._read_response()
+
+
+class TestBulkCloner(unittest.TestCase):
+
+    def test_copies_every_target_tag(self):
+        source = EmulatedTag(12, 4242)
+        targets = [EmulatedTag(0, i) for i in range(5)]
+        hid = ConveyorHID([source] + targets)
+        copies = []
+
+        cloner = BulkCloner(RfidHid(hid=hid), 12, 4242, copies=3, read_interval=0, verify_delay=0,
+                            on_copy=copies.append)
+        results = cloner.run()
+
+        self.assertEqual(3, len(results))
+        self.assertTrue(all(result.ok and result.attempts == 1 for result in results))
+        self.assertEqual([(12, 4242)] * 3 + [(0, 3), (0, 4)], [(tag.cid, tag.uid) for tag in targets])
+        self.assertEqual(results, copies)
+        self.assertEqual(3, cloner.stats()['copied'])
+
+    def test_failed_copies_are_reported(self):
+        targets = [EmulatedTag(0, 1, RfidHid.TAG_T5577), EmulatedTag(0, 2)]
+        hid = ConveyorHID([EmulatedTag(12, 4242)] + targets, reads_per_tag=8)
+
+        cloner = BulkCloner(RfidHid(hid=hid), 12, 4242, copies=1, read_interval=0, verify_delay=0)
+        results = cloner.run()
+
+        self.assertEqual([False, True], [result.ok for result in results])
+        self.assertEqual(2, results[0].attempts)
+        self.assertEqual(1, cloner.stats()['failed'])
+
+    def test_type_detector(self):
+        targets = [EmulatedTag(0, 1, RfidHid.TAG_T5577), EmulatedTag(0, 2, RfidHid.TAG_T5577)]
+        hid = ConveyorHID([EmulatedTag(12, 4242)] + targets, reads_per_tag=8)
+        detector = TagTypeDetector()
+
+        cloner = BulkCloner(RfidHid(hid=hid), 12, 4242, copies=2, read_interval=0, verify_delay=0,
+                            type_detector=detector)
+        results = cloner.run()
+
+        self.assertEqual([(True, 1), (True, 1)], [(result.ok, result.attempts) for result in results])
+        self.assertEqual([(12, 4242)] * 2, [(tag.cid, tag.uid) for tag in targets])
+        stats = detector.stats()
+        self.assertEqual((1, 1), (stats['first_try'], stats['retried']))
+
+    def test_transient_errors_do_not_abort_the_run(self):
+        targets = [EmulatedTag(0, i) for i in range(4)]
+        hid = ConveyorHID([EmulatedTag(12, 4242)] + targets, reads_per_tag=8)
+        set_feature_report = hid.set_feature_report
+        # the first write fails, then the verify read of the second attempt: the first tag is a failed copy
+        commands = [EmulatedHID.CMD_WRITE_TAG, EmulatedHID.CMD_READ_TAG]
+
+        def flaky_set_feature_report(report_number, data, timeout=None):
+            if commands and data[EmulatedHID.CMD_POS] == commands[0]:
+                commands.pop(0)
+                raise ValueError('Communication Error.')
+            return set_feature_report(report_number, data, timeout)
+
+        hid.set_feature_report = mock.Mock(side_effect=flaky_set_feature_report)
+        cloner = BulkCloner(RfidHid(hid=hid), 12, 4242, copies=3, read_interval=0, verify_delay=0)
+        results = cloner.run()
+
+        self.assertEqual([(False, 2), (True, 1), (True, 1), (True, 1)],
+                         [(result.ok, result.attempts) for result in results])
+        self.assertEqual((3, 1, 2), tuple(cloner.stats()[key] for key in ('copied', 'failed', 'errors')))
+
+    def test_unplugged_device_aborts_the_run(self):
+        hid = EmulatedHID()
+        hid.set_feature_report = mock.Mock(side_effect=usb.core.USBError('No such device', None, errno.ENODEV))
+        cloner = BulkCloner(RfidHid(hid=hid), 12, 4242, read_interval=0)
+        self.assertRaises(usb.core.USBError, cloner.run)
+
+    def test_stop(self):
+        stop = threading.Event()
+        stop.set()
+        cloner = BulkCloner(RfidHid(hid=EmulatedHID()), 12, 4242, read_interval=0, stop=stop)
+        self.assertEqual([], cloner.run())
+
+
+class TestCloneStation(unittest.TestCase):
+
+    def wait_for(self, condition, timeout=5):
+        started = time.time()
+        while not condition():
+            self.assertLess(time.time() - started, timeout)
+            time.sleep(0.005)
+
+    def test_copies_every_master_in_order(self):
+        masters = [EmulatedTag(12, 1000 + i) for i in range(3)]
+        targets = [EmulatedTag(0, i) for i in range(4)]
+        sources, copies = [], []
+
+        station = CloneStation(RfidHid(hid=ConveyorHID(masters)), RfidHid(hid=ConveyorHID(targets)),
+                               read_interval=0.001, verify_delay=0,
+                               on_source=lambda cid, uid: sources.append(uid),
+                               on_copy=lambda cid, uid, result: copies.append((uid, result.ok)))
+        station.start()
+        self.wait_for(lambda: len(copies) == 3)
+        station.stop()
+        station.join()
+
+        self.assertEqual([1000, 1001, 1002], sources)
+        self.assertEqual([(1000, True), (1001, True), (1002, True)], copies)
+        self.assertEqual([(12, 1000), (12, 1001), (12, 1002), (0, 3)], [(tag.cid, tag.uid) for tag in targets])
+
+        stats = station.stats()
+        self.assertEqual((3, 3, 0), (stats['source']['read'], stats['writer']['copied'], stats['writer']['failed']))
+        self.assertIsNone(station.error)
+
+    def test_queue_is_bounded(self):
+        masters = [EmulatedTag(12, 1000 + i) for i in range(3)]
+        # no blank tag on the writer: the writer stage waits with the first master
+        station = CloneStation(RfidHid(hid=ConveyorHID(masters)), RfidHid(hid=EmulatedHID()), queue_size=1,
+                               read_interval=0.001)
+        station.start()
+        self.wait_for(lambda: station.sources_read == 2)
+        # let the third master wait for room in the queue
+        time.sleep(0.05)
+        station.stop()
+        station.join()
+
+        stats = station.stats()
+        # one master taken by the writer, one in the queue, the third one waiting for room
+        self.assertEqual((2, 1, 1), (stats['source']['read'], stats['queued'], stats['max_queued']))
+        # the writer is not slow at encoding: it is waiting for a blank tag
+        self.assertEqual('blanks', stats['bottleneck'])
+        self.assertGreater(stats['writer']['waiting'], stats['writer']['busy'])
+
+    def test_bottleneck(self):
+        station = CloneStation(RfidHid(hid=EmulatedHID()), RfidHid(hid=EmulatedHID()))
+        self.assertEqual('none', station.stats()['bottleneck'])
+
+        station.started_at, station.stopped_at = 0.0, 100.0
+        self.assertEqual('balanced', station.stats()['bottleneck'])
+
+        station.source_blocked, station.writer_busy, station.writer_waiting = 30.0, 60.0, 10.0
+        self.assertEqual('writer', station.stats()['bottleneck'])
+        station.writer_waiting = 80.0
+        self.assertEqual('blanks', station.stats()['bottleneck'])
+
+        station.writer_starved = 40.0
+        self.assertEqual('source', station.stats()['bottleneck'])
+
+    def test_transient_error_is_retried(self):
+        writer = EmulatedHID(tag=EmulatedTag(0, 1))
+        set_feature_report = writer.set_feature_report
+        errors = [usb.core.USBError('Input/Output Error', None, errno.EIO),
+                  usb.core.USBError('Input/Output Error', None, errno.EIO)]
+
+        def flaky_set_feature_report(report_number, data, timeout=None):
+            # the first poll of the writer and its first write fail
+            if errors and (len(errors) == 2 or data[EmulatedHID.CMD_POS] == EmulatedHID.CMD_WRITE_TAG):
+                raise errors.pop()
+            return set_feature_report(report_number, data, timeout)
+
+        writer.set_feature_report = mock.Mock(side_effect=flaky_set_feature_report)
+        copies = []
+        station = CloneStation(RfidHid(hid=ConveyorHID([EmulatedTag(12, 1000)])), RfidHid(hid=writer),
+                               read_interval=0.001, verify_delay=0,
+                               on_copy=lambda cid, uid, result: copies.append((result.ok, result.attempts)))
+        station.start()
+        self.wait_for(lambda: copies)
+        station.stop()
+        station.join()
+
+        self.assertEqual([(True, 2)], copies)
+        self.assertEqual((12, 1000), (writer.tag.cid, writer.tag.uid))
+        self.assertEqual(2, station.stats()['errors'])
+        self.assertIsNone(station.error)
+
+    def test_unplugged_device_stops_the_station(self):
+        writer = EmulatedHID(tag=EmulatedTag(0, 1))
+        writer.set_feature_report = mock.Mock(side_effect=usb.core.USBError('No such device', None, errno.ENODEV))
+        station = CloneStation(RfidHid(hid=ConveyorHID([EmulatedTag(12, 1000)])), RfidHid(hid=writer),
+                               read_interval=0.001)
+        station.start()
+        station.join(5)
+
+        self.assertFalse(station.is_alive())
+        self.assertIsInstance(station.error, usb.core.USBError)
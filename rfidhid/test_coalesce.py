@@ -0,0 +1,156 @@
+# Copyright (c) 2019 charlysan
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import threading
+import unittest
+import usb.core
+from time import sleep
+from mock import mock
+from rfidhid.coalesce import CoalescingReader
+from rfidhid.core import RfidHid
+from rfidhid.deadline import DeadlineExceededError
+from rfidhid.emulator import EmulatedHID, EmulatedTag
+
+
+class TestCoalescingReader(unittest.TestCase):
+
+    def read_concurrently(self, reader, threads):
+        results = [None] * threads
+
+        def read(index):
+            try:
+                results[index] = reader.read_tag()
+            except Exception as e:
+                results[index] = e
+
+        workers = [threading.Thread(target=read, args=(index,)) for index in range(threads)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        return results
+
+    def test_concurrent_reads_share_one_transaction(self):
+        hid = EmulatedHID(tag=EmulatedTag(77, 1234567890), latency=0.05)
+        reader = CoalescingReader(RfidHid(hid=hid))
+
+        results = self.read_concurrently(reader, 8)
+
+        self.assertEqual(2, hid.transfers)
+        self.assertEqual((7, 1), (reader.hits, reader.misses))
+        self.assertTrue(all(result is results[0] for result in results))
+        self.assertEqual(1234567890, results[0].get_tag_uid())
+
+    def test_freshness_window(self):
+        now = [0.0]
+        hid = EmulatedHID(tag=EmulatedTag(1, 2))
+        reader = CoalescingReader(RfidHid(hid=hid), freshness=0.01, clock=lambda: now[0])
+
+        first = reader.read_tag()
+        now[0] = 0.005
+        self.assertIs(first, reader.read_tag())
+        now[0] = 0.02
+        self.assertIsNot(first, reader.read_tag())
+        self.assertEqual((1, 2), (reader.hits, reader.misses))
+
+    def test_no_freshness_reads_again(self):
+        hid = EmulatedHID(tag=EmulatedTag(1, 2))
+        reader = CoalescingReader(RfidHid(hid=hid))
+        reader.read_tag()
+        reader.read_tag()
+        self.assertEqual((0, 2), (reader.hits, reader.misses))
+
+    def test_write_drops_the_last_read(self):
+        hid = EmulatedHID(tag=EmulatedTag(1, 2))
+        reader = CoalescingReader(RfidHid(hid=hid), freshness=60)
+
+        reader.read_tag()
+        reader.write_tag_from_cid_and_uid(3, 4)
+        self.assertEqual(4, reader.read_tag().get_tag_uid())
+        self.assertEqual(2, reader.misses)
+
+    def test_write_during_a_read_is_not_cached(self):
+        rfid = RfidHid(hid=EmulatedHID(tag=EmulatedTag(1, 2)))
+        reader = CoalescingReader(rfid, freshness=60)
+        read_tag = rfid.read_tag
+
+        def read_tag_then_write(*args, **kwargs):
+            payload_response = read_tag(*args, **kwargs)
+            # the write lands after the tag has been read, before the read returns
+            reader.write_tag_from_cid_and_uid(3, 4)
+            return payload_response
+
+        rfid.read_tag = mock.Mock(side_effect=read_tag_then_write)
+        self.assertEqual(2, reader.read_tag().get_tag_uid())
+
+        rfid.read_tag = read_tag
+        self.assertEqual(4, reader.read_tag().get_tag_uid())
+        self.assertEqual((0, 2), (reader.hits, reader.misses))
+
+    def test_errors_are_shared_and_not_cached(self):
+        def failing_set_report(*args, **kwargs):
+            sleep(0.05)
+            raise usb.core.USBError('Pipe error')
+
+        hid = EmulatedHID()
+        hid.set_feature_report = mock.Mock(side_effect=failing_set_report)
+        reader = CoalescingReader(RfidHid(hid=hid), freshness=60)
+
+        results = self.read_concurrently(reader, 4)
+        self.assertTrue(all(isinstance(result, usb.core.USBError) for result in results))
+        self.assertEqual(1, hid.set_feature_report.call_count)
+
+        self.assertRaises(usb.core.USBError, reader.read_tag)
+        self.assertEqual(2, hid.set_feature_report.call_count)
+
+    def test_joined_read_honors_its_deadline(self):
+        reader = CoalescingReader(RfidHid(hid=EmulatedHID(latency=0.3)))
+        leader = threading.Thread(target=reader.read_tag)
+        leader.start()
+        while reader.misses == 0:
+            pass
+
+        self.assertRaises(DeadlineExceededError, reader.read_tag, deadline=0.05)
+        leader.join()
+
+    def test_join_retries_when_the_leader_gives_up(self):
+        hid = EmulatedHID(tag=EmulatedTag(12, 345), latency=0.2)
+        reader = CoalescingReader(RfidHid(hid=hid))
+        errors = []
+
+        def lead():
+            try:
+                reader.read_tag(deadline=0.05)
+            except DeadlineExceededError as e:
+                errors.append(e)
+
+        leader = threading.Thread(target=lead)
+        leader.start()
+        while reader.misses == 0:
+            pass
+
+        self.assertEqual(345, reader.read_tag().get_tag_uid())
+        leader.join()
+        self.assertEqual(1, len(errors))
+        self.assertEqual((2, 0), (reader.misses, reader.hits))
+
+    def test_delegates_other_attributes(self):
+        rfid = RfidHid(hid=EmulatedHID())
+        self.assertIs(rfid.hid, CoalescingReader(rfid).hid)
@@ -19,8 +19,11 @@
 # SOFTWARE.
 
 import unittest
+import usb.core
 from mock import mock
 from rfidhid.core import RfidHid, PayloadResponse
+from rfidhid.deadline import DeadlineExceededError
+from rfidhid.emulator import EmulatedHID
 
 
 class TestPayloadResponse(unittest.TestCase):
@@ -138,3 +141,32 @@ class TestPayloadResponse(unittest.TestCase):
         expected = 68
         actual = self.payload.calculate_crc()
         self.assertEqual(expected, actual)
+
+
+class TestRfidHidInit(unittest.TestCase):
+
+    def test_init_is_a_no_op_once_initialized(self):
+        hid = EmulatedHID()
+        hid.get_report_descriptor = mock.Mock(return_value=[0x06, 0xa0, 0xff])
+        rfid = RfidHid(hid=hid)
+
+        self.assertEqual([0x06, 0xa0, 0xff], rfid.init())
+        self.assertEqual([0x06, 0xa0, 0xff], rfid.init())
+        self.assertEqual(1, hid.get_report_descriptor.call_count)
+
+        rfid.init(force=True)
+        self.assertEqual(2, hid.get_report_descriptor.call_count)
+
+    def test_wait_ready_returns_as_soon_as_the_device_answers(self):
+        hid = EmulatedHID()
+        # not ready, short write (Communication Error), ready
+        hid.set_feature_report = mock.Mock(side_effect=[usb.core.USBError('Pipe error'), 0, RfidHid.BUFFER_SIZE])
+
+        elapsed = RfidHid(hid=hid).wait_ready(interval=0.01)
+        self.assertEqual(3, hid.set_feature_report.call_count)
+        self.assertLess(elapsed, 1)
+
+    def test_wait_ready_timeout(self):
+        hid = EmulatedHID()
+        hid.set_feature_report = mock.Mock(side_effect=usb.core.USBError('Pipe error'))
+        self.assertRaises(DeadlineExceededError, RfidHid(hid=hid).wait_ready, timeout=0.05)
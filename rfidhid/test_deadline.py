@@ -0,0 +1,98 @@
+# Copyright (c) 2019 charlysan
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import threading
+import unittest
+import usb.core
+from rfidhid.core import RfidHid
+from rfidhid.compat import monotonic
+from rfidhid.emulator import EmulatedHID, EmulatedTag
+from rfidhid.usb_hid import TransferTimeoutError
+from rfidhid.deadline import Deadline, CancellationToken, DeadlineExceededError, OperationCancelledError, \
+    RfidTimeoutError, wait
+
+
+class FakeClock(object):
+    now = 100.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestDeadline(unittest.TestCase):
+
+    def test_remaining_and_expired(self):
+        clock = FakeClock()
+        deadline = Deadline(2, clock=clock)
+        self.assertEqual(2, deadline.remaining())
+        clock.now = 103
+        self.assertEqual(0, deadline.remaining())
+        self.assertTrue(deadline.expired())
+        self.assertRaises(DeadlineExceededError, deadline.check)
+
+    def test_from_value(self):
+        deadline = Deadline(1)
+        self.assertTrue(Deadline.from_value(deadline) is deadline)
+        self.assertTrue(Deadline.from_value(None) is None)
+        self.assertTrue(0 < Deadline.from_value(5).remaining() <= 5)
+
+    def test_wait_is_bounded_by_deadline(self):
+        started = monotonic()
+        self.assertRaises(DeadlineExceededError, wait, 5, Deadline(0.05))
+        self.assertTrue(monotonic() - started < 1)
+
+    def test_wait_returns_on_cancel(self):
+        cancel = CancellationToken()
+        threading.Timer(0.05, cancel.cancel).start()
+        started = monotonic()
+        self.assertRaises(OperationCancelledError, wait, 5, None, cancel)
+        self.assertTrue(monotonic() - started < 1)
+
+
+class TestRfidHidTimeouts(unittest.TestCase):
+
+    def setUp(self):
+        self.hid = EmulatedHID(EmulatedTag(77, 1234567890), latency=0.1)
+
+    def test_transfer_timeout(self):
+        rfid = RfidHid(hid=self.hid)
+        with self.assertRaises(TransferTimeoutError) as context:
+            rfid.read_tag(timeout=0.01)
+        # still a pyusb timeout for existing callers
+        self.assertTrue(isinstance(context.exception, usb.core.USBTimeoutError))
+        self.assertTrue(isinstance(context.exception, RfidTimeoutError))
+
+    def test_session_timeout(self):
+        rfid = RfidHid(hid=self.hid, timeout=0.01)
+        self.assertRaises(TransferTimeoutError, rfid.beep)
+        self.assertEqual(77, rfid.read_tag(timeout=0.2).get_tag_cid())
+
+    def test_deadline_spans_all_transfers(self):
+        rfid = RfidHid(hid=self.hid)
+        # each transfer fits in the deadline, the three of a write do not
+        self.assertRaises(DeadlineExceededError, rfid.write_tag_from_cid_and_uid, 12, 1, deadline=0.25)
+        self.assertTrue(rfid.read_tag(deadline=0.25).has_id_data())
+
+    def test_cancelled_operation_does_not_reach_the_device(self):
+        rfid = RfidHid(hid=self.hid)
+        cancel = CancellationToken()
+        cancel.cancel()
+        self.assertRaises(OperationCancelledError, rfid.read_tag, cancel=cancel)
+        self.assertEqual(0, self.hid.transfers)
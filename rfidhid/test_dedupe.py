@@ -0,0 +1,99 @@
+# Copyright (c) 2019 charlysan
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import unittest
+from mock import mock
+from rfidhid.dedupe import TtlDedupe, BloomDedupe, parse_dedupe
+from rfidhid.presence import read_tags
+
+
+class TestTtlDedupe(unittest.TestCase):
+
+    def test_tag_is_reported_again_after_ttl_without_being_seen(self):
+        clock = mock.Mock(return_value=0)
+        dedupe = TtlDedupe(ttl=5, clock=clock)
+
+        self.assertFalse(dedupe.seen((12, 1)))
+        self.assertFalse(dedupe.seen((12, 2)))
+        clock.return_value = 4
+        # alternating badges are not reported again
+        self.assertTrue(dedupe.seen((12, 1)))
+        self.assertTrue(dedupe.seen((12, 2)))
+        clock.return_value = 8
+        self.assertTrue(dedupe.seen((12, 1)))
+        clock.return_value = 14
+        self.assertFalse(dedupe.seen((12, 1)))
+
+    def test_bounded_size(self):
+        dedupe = TtlDedupe(ttl=60, max_size=2)
+        for uid in range(3):
+            dedupe.seen((12, uid))
+        self.assertEqual(2, len(dedupe))
+        self.assertFalse(dedupe.seen((12, 0)))
+
+
+class TestBloomDedupe(unittest.TestCase):
+
+    def test_tags_are_reported_once(self):
+        dedupe = BloomDedupe(capacity=1000, error_rate=0.001)
+        self.assertEqual([False] * 1000, [dedupe.seen((12, uid)) for uid in range(1000)])
+        self.assertEqual([True] * 1000, [dedupe.seen((12, uid)) for uid in range(1000)])
+
+    def test_false_positive_rate(self):
+        dedupe = BloomDedupe(capacity=10000, error_rate=0.01)
+        false_positives = sum(dedupe.seen((12, uid)) for uid in range(10000))
+        self.assertLess(false_positives, 100)
+        self.assertEqual(10000 - false_positives, len(dedupe))
+
+    def test_fixed_memory(self):
+        dedupe = BloomDedupe(capacity=1000000, error_rate=0.001)
+        self.assertEqual(1797199, len(dedupe._bits))
+        self.assertEqual(10, dedupe.hashes)
+
+
+class TestParseDedupe(unittest.TestCase):
+
+    def test_parse(self):
+        self.assertEqual(5, parse_dedupe('ttl=5s').ttl)
+        self.assertEqual(0.5, parse_dedupe('ttl=500ms').ttl)
+        self.assertEqual(120, parse_dedupe('ttl=2m').ttl)
+        self.assertEqual(5, parse_dedupe('ttl=5').ttl)
+        self.assertEqual(5000, parse_dedupe('session=5000').capacity)
+        self.assertIsInstance(parse_dedupe('session'), BloomDedupe)
+        self.assertRaises(ValueError, parse_dedupe, 'lru')
+
+
+class TestReadTags(unittest.TestCase):
+
+    def test_alternating_tags_are_yielded_once(self):
+        rfid = mock.Mock()
+        rfid.read_tag.side_effect = [self.payload_response(uid) for uid in (1, 2, None, 1, 2, 1, 3)]
+        stream = read_tags(rfid, interval=0, dedupe=parse_dedupe('session'))
+
+        self.assertEqual([1, 2, 3], [next(stream).get_tag_uid() for _ in range(3)])
+
+    @staticmethod
+    def payload_response(uid):
+        return mock.Mock(**{'has_id_data.return_value': uid is not None, 'get_tag_cid.return_value': 12,
+                            'get_tag_uid.return_value': uid})
+
+
+if __name__ == '__main__':
+    unittest.main()
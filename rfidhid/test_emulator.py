@@ -0,0 +1,55 @@
+# Copyright (c) 2019 charlysan
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import unittest
+
+import usb.core
+
+from rfidhid.core import RfidHid
+from rfidhid.emulator import EmulatedHID, EmulatedTag, FaultInjector
+from rfidhid.usb_hid import TransferTimeoutError
+
+
+class TestFaultInjector(unittest.TestCase):
+
+    def test_usb_error(self):
+        faults = FaultInjector(usb_error_rate=1)
+        rfid = RfidHid(hid=EmulatedHID(EmulatedTag(77, 1234567890), faults=faults))
+        self.assertRaises(usb.core.USBError, rfid.read_tag)
+        self.assertEqual(1, faults.injected['usb_error'])
+
+    def test_truncated_response(self):
+        rfid = RfidHid(hid=EmulatedHID(EmulatedTag(77, 1234567890), faults=FaultInjector(truncated_rate=1)))
+        self.assertFalse(rfid.read_tag().has_id_data())
+
+    def test_slow_transfer_times_out(self):
+        faults = FaultInjector(slow_rate=1, slow_latency=0.05)
+        rfid = RfidHid(hid=EmulatedHID(EmulatedTag(77, 1234567890), faults=faults), timeout=0.01)
+        self.assertRaises(TransferTimeoutError, rfid.read_tag)
+
+    def test_no_faults(self):
+        faults = FaultInjector(seed=0)
+        rfid = RfidHid(hid=EmulatedHID(EmulatedTag(77, 1234567890), faults=faults))
+        self.assertEqual(1234567890, rfid.read_tag().get_tag_uid())
+        self.assertEqual(0, sum(faults.injected.values()))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,143 @@
+# Copyright (c) 2019 charlysan
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import errno
+import unittest
+import usb.core
+from mock import mock
+from rfidhid.core import RfidHid
+from rfidhid.allocator import UidAllocator
+from rfidhid.emulator import EmulatedHID, EmulatedTag
+from rfidhid.encoder import EncodingLine
+
+
+class FeederHID(EmulatedHID):
+    r"""Emulated reader where a new blank tag shows up shortly after the previous one is taken away"""
+
+    def __init__(self, tag_type=RfidHid.TAG_EM4305):
+        super(FeederHID, self).__init__()
+        self.tag_type = tag_type
+        self.empty_reads = 0
+
+    def _read_response(self):
+        if self.tag is None:
+            self.empty_reads += 1
+            if self.empty_reads > 2:
+                self.empty_reads = 0
+                self.place(EmulatedTag(0, 0, self.tag_type))
+        return super(FeederHID, self)._read_response()
+
+
+class TestEncodingLine(unittest.TestCase):
+
+    def run_line(self, hids, allocator, retries=3):
+        encoded = []
+
+        def on_result(station, uid, ok, elapsed):
+            # the operator takes the tag away after every attempt
+            tag = station.rfid.hid.remove()
+            if ok:
+                encoded.append((tag.cid, tag.uid))
+
+        line = EncodingLine([RfidHid(hid=hid) for hid in hids], allocator, 12,
+                            read_interval=0, verify_delay=0, retries=retries, on_result=on_result)
+        line.start()
+        line.join(10)
+        self.assertFalse(line.is_alive())
+
+        return line, encoded
+
+    def test_uids_are_unique_across_stations(self):
+        hids = [FeederHID() for _ in range(3)]
+        line, encoded = self.run_line(hids, UidAllocator(1000, step=2, limit=1058))
+
+        self.assertEqual([(12, uid) for uid in range(1000, 1060, 2)], sorted(encoded))
+        stats = line.stats()
+        self.assertEqual(30, stats['written'])
+        self.assertEqual(0, stats['failed'])
+        self.assertEqual(3, len(stats['stations']))
+
+    def test_failed_uids_are_requeued(self):
+        # wrong tag type: writes on the first station never verify
+        hids = [FeederHID(RfidHid.TAG_T5577), FeederHID()]
+        allocator = UidAllocator(0, limit=9)
+        line, encoded = self.run_line(hids, allocator, retries=1)
+
+        self.assertEqual([(12, uid) for uid in range(10)], sorted(encoded))
+        self.assertEqual(0, line.stations[0].written)
+        self.assertTrue(line.stations[0].failed > 0)
+        self.assertEqual(0, allocator.remaining())
+
+    def test_transient_usb_error_is_a_failed_attempt(self):
+        hid = FeederHID()
+        set_feature_report = hid.set_feature_report
+        # the first write fails with a USB error, then the device works again
+        errors = [usb.core.USBError('Input/Output Error', None, errno.EIO)]
+
+        def flaky_set_feature_report(report_number, data, timeout=None):
+            if errors and data[EmulatedHID.CMD_POS] == EmulatedHID.CMD_WRITE_TAG:
+                raise errors.pop()
+            return set_feature_report(report_number, data, timeout)
+
+        hid.set_feature_report = mock.Mock(side_effect=flaky_set_feature_report)
+        allocator = UidAllocator(0, limit=4)
+        line, encoded = self.run_line([hid], allocator, retries=1)
+
+        station = line.stations[0]
+        self.assertIsNone(station.error)
+        self.assertEqual((4, 1, 1, 1), (station.written, station.failed, station.errors, station.voided))
+        # the failed write might have reached the tag: its UID is not written again
+        self.assertEqual([(12, uid) for uid in range(1, 5)], sorted(encoded))
+        self.assertEqual(1, line.stats()['errors'])
+        self.assertTrue(allocator.exhausted())
+
+    def test_uid_is_voided_when_the_verify_read_fails(self):
+        hid = FeederHID()
+        set_feature_report = hid.set_feature_report
+        written = []
+
+        def flaky_set_feature_report(report_number, data, timeout=None):
+            cmd = data[EmulatedHID.CMD_POS]
+            if cmd == EmulatedHID.CMD_WRITE_TAG:
+                written.append(True)
+            elif cmd == EmulatedHID.CMD_READ_TAG and len(written) == 1:
+                # the verify read of the first write fails; the write itself went through
+                written.append(False)
+                raise usb.core.USBError('Input/Output Error', None, errno.EIO)
+            return set_feature_report(report_number, data, timeout)
+
+        hid.set_feature_report = mock.Mock(side_effect=flaky_set_feature_report)
+        allocator = UidAllocator(0, limit=4)
+        line, encoded = self.run_line([hid], allocator, retries=1)
+
+        station = line.stations[0]
+        self.assertIsNone(station.error)
+        self.assertEqual((4, 1, 1), (station.written, station.voided, station.errors))
+        self.assertEqual([(12, uid) for uid in range(1, 5)], sorted(encoded))
+        self.assertTrue(allocator.exhausted())
+
+    def test_unplugged_device_stops_the_station(self):
+        hid = FeederHID()
+        hid.set_feature_report = mock.Mock(side_effect=usb.core.USBError('No such device', None, errno.ENODEV))
+        allocator = UidAllocator(0, limit=4)
+        line, encoded = self.run_line([hid], allocator, retries=1)
+
+        self.assertIsInstance(line.stations[0].error, usb.core.USBError)
+        self.assertEqual(5, allocator.remaining())
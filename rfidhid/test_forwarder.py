@@ -0,0 +1,209 @@
+# Copyright (c) 2019 charlysan
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import json
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+
+try:
+    from http.server import HTTPServer, BaseHTTPRequestHandler
+except ImportError:
+    # python 2.7
+    from BaseHTTPServer import HTTPServer, BaseHTTPRequestHandler
+
+from rfidhid.forwarder import HttpForwarder, DiskSpool, parse_events
+from rfidhid.sink import TagEvent
+
+
+class EventHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def setup(self):
+        BaseHTTPRequestHandler.setup(self)
+        self.server.connections += 1
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers['Content-Length']))
+        uids = [event.uid for event in parse_events(body)]
+        status = self.server.status
+        if status == 200 and self.server.rejected_uids.intersection(uids):
+            status = 400
+        if status == 200:
+            self.server.batches.append(uids)
+        self.send_response(status)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+class StandInServer(HTTPServer):
+    r"""Local endpoint recording the UIDs of every batch received"""
+
+    def __init__(self):
+        HTTPServer.__init__(self, ('127.0.0.1', 0), EventHandler)
+        self.status = 200
+        self.rejected_uids = set()
+        self.batches = []
+        self.connections = 0
+        self.thread = threading.Thread(target=self.serve_forever, kwargs={'poll_interval': 0.01})
+        self.thread.daemon = True
+        self.thread.start()
+
+    @property
+    def url(self):
+        return 'http://127.0.0.1:%d/events' % self.server_address[1]
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+def event(uid):
+    return TagEvent(1559563200.0 + uid, 'read', 12, uid, None, 'door')
+
+
+class TestHttpForwarder(unittest.TestCase):
+
+    def setUp(self):
+        self.server = StandInServer()
+        self.spool_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        self.server.stop()
+        shutil.rmtree(self.spool_dir)
+
+    def test_batches_are_sent_over_a_keep_alive_connection(self):
+        with HttpForwarder(self.server.url, batch_size=10) as forwarder:
+            for uid in range(25):
+                forwarder.record(event(uid))
+            forwarder.flush()
+            forwarder.record(event(25))
+
+        self.assertEqual(list(range(26)), [uid for batch in self.server.batches for uid in batch])
+        self.assertTrue(all(len(batch) <= 10 for batch in self.server.batches))
+        self.assertEqual(1, self.server.connections)
+        self.assertEqual(26, forwarder.written)
+
+    def test_spooled_batches_are_replayed_in_order(self):
+        self.server.status = 503
+        forwarder = HttpForwarder(self.server.url, spool_dir=self.spool_dir, retry_interval=0)
+        for uid in range(3):
+            forwarder.record(event(uid))
+            forwarder.flush()
+        self.assertEqual(3, len(forwarder.spool))
+
+        self.server.status = 200
+        forwarder.record(event(3))
+        forwarder.close()
+
+        self.assertEqual([[0], [1], [2], [3]], self.server.batches)
+        self.assertEqual(0, len(forwarder.spool))
+
+    def test_spool_is_replayed_by_the_next_run(self):
+        self.server.stop()
+        url = self.server.url
+        with HttpForwarder(url, spool_dir=self.spool_dir) as forwarder:
+            forwarder.record(event(1))
+        self.assertEqual(1, len(forwarder.spool))
+
+        self.server = StandInServer()
+        with HttpForwarder(self.server.url, spool_dir=self.spool_dir, flush_interval=0.01) as forwarder:
+            forwarder.record(event(2))
+
+        self.assertEqual([[1], [2]], self.server.batches)
+
+    def test_rejected_batches_do_not_block_the_spool(self):
+        self.server.status = 503
+        forwarder = HttpForwarder(self.server.url, spool_dir=self.spool_dir, retry_interval=0)
+        for uid in range(3):
+            forwarder.record(event(uid))
+            forwarder.flush()
+        self.assertEqual(3, len(forwarder.spool))
+
+        self.server.status = 200
+        self.server.rejected_uids.add(1)
+        forwarder.record(event(3))
+        forwarder.close()
+
+        self.assertEqual([[0], [2], [3]], self.server.batches)
+        self.assertEqual((0, 1, 3), (len(forwarder.spool), forwarder.rejected, forwarder.written))
+        with open(os.path.join(self.spool_dir, 'rejected.jsonl')) as f:
+            records = [json.loads(line) for line in f]
+        self.assertEqual(['HTTP 400 Bad Request'], [record['error'] for record in records])
+        self.assertEqual([1], [event['uid'] for event in records[0]['events']])
+
+    def test_transient_errors_are_retried(self):
+        self.server.status = 429
+        forwarder = HttpForwarder(self.server.url, spool_dir=self.spool_dir, retry_interval=0)
+        forwarder.record(event(1))
+        forwarder.flush()
+        self.assertEqual((1, 0), (len(forwarder.spool), forwarder.rejected))
+
+        self.server.status = 200
+        forwarder.record(event(2))
+        forwarder.close()
+        self.assertEqual([[1], [2]], self.server.batches)
+
+    def test_events_are_lost_without_spool(self):
+        self.server.status = 500
+        with HttpForwarder(self.server.url) as forwarder:
+            forwarder.record(event(1))
+        self.assertEqual(1, forwarder.lost)
+        self.assertEqual(1, forwarder.failures)
+
+
+class TestDiskSpool(unittest.TestCase):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def test_oldest_batches_are_dropped_when_full(self):
+        spool = DiskSpool(self.path, max_bytes=10)
+        for i in range(4):
+            spool.push(b'batch%d' % i, 2)
+
+        self.assertEqual(1, len(spool))
+        self.assertEqual(6, spool.dropped)
+        self.assertEqual((b'batch3', 2), spool.peek())
+
+    def test_fifo_across_instances(self):
+        spool = DiskSpool(self.path)
+        spool.push(b'first', 1)
+        spool.push(b'second', 1)
+
+        spool = DiskSpool(self.path)
+        spool.push(b'third', 1)
+        bodies = []
+        while len(spool):
+            bodies.append(spool.peek()[0])
+            spool.pop()
+        self.assertEqual([b'first', b'second', b'third'], bodies)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,93 @@
+# Copyright (c) 2019 charlysan
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import time
+import unittest
+from rfidhid.core import RfidHid
+from rfidhid.emulator import EmulatedHID, EmulatedTag
+from rfidhid.fusion import fuse, FusedEvent, TagFusion, FusedReaders
+from rfidhid.sink import TagEvent
+
+
+def sighting(timestamp, uid, reader):
+    return TagEvent(timestamp, 'read', 12, uid, None, reader)
+
+
+class TestFuse(unittest.TestCase):
+
+    def test_overlapping_readers(self):
+        streams = {
+            'pad-a': [sighting(10.000, 1, 'pad-a'), sighting(10.030, 1, 'pad-a'), sighting(11.000, 2, 'pad-a')],
+            'pad-b': [sighting(10.010, 1, 'pad-b'), sighting(10.990, 2, 'pad-b'), sighting(12.000, 1, 'pad-b')],
+            'pad-c': [sighting(10.020, 1, 'pad-c')],
+        }
+        fused = list(fuse(streams, window=0.05))
+
+        self.assertEqual([
+            FusedEvent(10.000, 12, 1, 'pad-a', ('pad-b', 'pad-c'), 10.030),
+            FusedEvent(10.990, 12, 2, 'pad-b', ('pad-a',), 11.000),
+            FusedEvent(12.000, 12, 1, 'pad-b', (), 12.000),
+        ], fused)
+
+    def test_sightings_outside_the_window_are_not_collapsed(self):
+        streams = {'a': [sighting(0, 1, 'a'), sighting(0.2, 1, 'a')], 'b': [sighting(0.1, 1, 'b')]}
+        fused = list(fuse(streams, window=0.05))
+        self.assertEqual(['a', 'b', 'a'], [event.reader for event in fused])
+
+
+class TestTagFusion(unittest.TestCase):
+
+    def test_events_wait_for_every_reader_watermark(self):
+        fusion = TagFusion(['a', 'b'], window=0.05)
+        fusion.push('a', 1.00, 12, 1)
+        self.assertEqual([], fusion.poll())
+
+        fusion.push('b', 1.01, 12, 1)
+        fusion.advance('a', 1.02)
+        self.assertEqual([], fusion.poll())
+
+        fusion.advance('a', 1.10)
+        fusion.advance('b', 1.10)
+        self.assertEqual([FusedEvent(1.00, 12, 1, 'a', ('b',), 1.01)], fusion.poll())
+
+    def test_drain(self):
+        fusion = TagFusion(['a', 'b'])
+        fusion.push('b', 1.00, 12, 7)
+        self.assertEqual([FusedEvent(1.00, 12, 7, 'b', (), 1.00)], fusion.drain())
+
+
+class TestFusedReaders(unittest.TestCase):
+
+    def test_tag_on_overlapping_readers_is_reported_once(self):
+        rfids = [RfidHid(hid=EmulatedHID(EmulatedTag(12, 1)), name=name) for name in ('left', 'right')]
+        events = []
+        readers = FusedReaders(rfids, window=60, interval=0.01, on_event=events.append)
+        readers.start()
+        time.sleep(0.1)
+        readers.stop()
+        readers.join()
+
+        self.assertEqual(1, len(events))
+        self.assertEqual((12, 1), (events[0].cid, events[0].uid))
+        self.assertEqual({'left', 'right'}, set((events[0].reader,) + events[0].others))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,94 @@
+# Copyright (c) 2019 charlysan
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import threading
+import unittest
+from rfidhid.core import RfidHid
+from rfidhid.emulator import EmulatedHID, EmulatedTag
+from rfidhid.deadline import CancellationToken, DeadlineExceededError, OperationCancelledError
+from rfidhid.jobs import JobRunner, JobConfig, InvalidConfigError, VerifyError
+
+
+class TestJobRunner(unittest.TestCase):
+
+    def setUp(self):
+        self.hid = EmulatedHID(EmulatedTag(77, 1234567890))
+        self.runner = JobRunner(RfidHid(hid=self.hid))
+
+    def test_read(self):
+        result = self.runner.read(JobConfig(read_interval=0))
+        self.assertEqual((77, 1234567890), (result.cid, result.uid))
+
+    def test_read_deadline(self):
+        self.hid.remove()
+        self.assertRaises(DeadlineExceededError, self.runner.read, JobConfig(read_interval=0.01, deadline=0.05))
+
+    def test_write_jobs_back_to_back(self):
+        config = JobConfig(cid=12, read_interval=0, verify_delay=0)
+        for uid in range(100, 103):
+            self.hid.place(EmulatedTag(77, uid))
+            result = self.runner.write(config.copy(uid=uid))
+            self.assertEqual((12, uid, (77, uid), True, True), (result.cid, result.uid, result.previous,
+                                                                result.written, result.verified))
+        self.assertEqual(3, self.runner.writes)
+
+    def test_written_tag_is_skipped(self):
+        config = JobConfig(cid=12, uid=1000, read_interval=0, verify_delay=0)
+        self.assertTrue(self.runner.write(config).written)
+        self.assertFalse(self.runner.write(config.copy(uid=1001)).written)
+        self.assertEqual(1, self.runner.skipped)
+
+    def test_verify_error(self):
+        self.hid.place(EmulatedTag(77, 1, tag_type=RfidHid.TAG_T5577))
+        with self.assertRaises(VerifyError) as context:
+            self.runner.write(JobConfig(cid=12, uid=1000, read_interval=0, verify_delay=0))
+        self.assertEqual((True, False), (context.exception.result.written, context.exception.result.verified))
+
+    def test_auto_type(self):
+        self.hid.place(EmulatedTag(77, 1, tag_type=RfidHid.TAG_T5577))
+        result = self.runner.write(JobConfig(cid=12, uid=1000, auto_type=True, read_interval=0, verify_delay=0))
+        self.assertEqual((RfidHid.TAG_T5577, True), (result.tag_type, result.verified))
+
+    def test_invalid_config(self):
+        self.assertRaises(InvalidConfigError, self.runner.write, JobConfig(cid=12))
+        self.assertRaises(InvalidConfigError, self.runner.write, JobConfig(cid=256, uid=1))
+
+    def test_clone(self):
+        sources = []
+
+        def swap(source):
+            sources.append(source)
+            self.hid.remove()
+            threading.Timer(0.05, self.hid.place, args=(EmulatedTag(12, 5),)).start()
+
+        result = self.runner.clone(JobConfig(read_interval=0.01, verify_delay=0, deadline=5), on_source=swap)
+        self.assertEqual((77, 1234567890), (sources[0].cid, sources[0].uid))
+        self.assertEqual((77, 1234567890, (12, 5), True), (result.cid, result.uid, result.previous, result.verified))
+
+    def test_cancel(self):
+        cancel = CancellationToken()
+        runner = JobRunner(RfidHid(hid=self.hid), cancel=cancel)
+        self.hid.remove()
+        threading.Timer(0.05, cancel.cancel).start()
+        self.assertRaises(OperationCancelledError, runner.read, JobConfig(read_interval=0.01))
+
+
+if __name__ == '__main__':
+    unittest.main()
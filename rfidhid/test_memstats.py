@@ -0,0 +1,99 @@
+# Copyright (c) 2019 charlysan
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import unittest
+from mock import mock
+from cli.rfid_cli import RfidCli
+from rfidhid.core import RfidHid
+from rfidhid.emulator import EmulatedHID, EmulatedTag
+from rfidhid.memstats import MemorySample, MemoryTracker, slope, tracemalloc
+
+
+class TestMemoryTracker(unittest.TestCase):
+
+    def test_slope(self):
+        self.assertEqual(2.0, slope([(0, 1), (1, 3), (2, 5)]))
+        self.assertIsNone(slope([(0, 1)]))
+        self.assertIsNone(slope([(1, 1), (1, 2)]))
+
+    def test_statistics_from_samples(self):
+        tracker = MemoryTracker()
+        tracker.iterations = 1000
+        for sample in [MemorySample(0, 0, 1000, 1000, 10000), MemorySample(3600, 500, 1500, 9000, 10000),
+                       MemorySample(7200, 1000, 2000, 3500, 20000)]:
+            tracker.samples.append(sample)
+        tracker.first_sample = tracker.samples[0]
+
+        self.assertEqual(1.0, tracker.growth_per_iteration())
+        self.assertEqual(8000, tracker.working_set_per_iteration())
+        self.assertEqual({'traced_per_hour': 500.0, 'rss_per_hour': 5000.0}, tracker.trend())
+
+    def test_samples_every_interval_after_warmup(self):
+        now = [0]
+        tracker = MemoryTracker(interval=10, warmup=5, clock=lambda: now[0])
+        try:
+            for _ in range(20):
+                tracker.iteration()
+                now[0] += 1
+        finally:
+            tracker.stop()
+
+        self.assertEqual([5, 15], [sample.iterations for sample in tracker.samples])
+
+
+class NullStream(object):
+    r"""Output stream discarding everything written to it"""
+
+    def write(self, data):
+        pass
+
+    def flush(self):
+        pass
+
+
+@unittest.skipIf(tracemalloc is None, 'tracemalloc is not available')
+class TestReadLoopMemoryBudget(unittest.TestCase):
+    r"""The read loop of `rfid_cli -r --loop` must not retain memory, and needs little of it at once"""
+    GROWTH_BUDGET = 16  # bytes per iteration
+    BLOCKS_BUDGET = 0.1  # live blocks per iteration
+    WORKING_SET_BUDGET = 32 * 1024  # bytes
+
+    def test_read_loop(self):
+        now = [0]
+        rfid = RfidHid(hid=EmulatedHID(tag=EmulatedTag(77, 1234567890)))
+        cli = RfidCli(['-r', '--loop', '--read-delay', '0'], rfid=rfid)
+        # a sample every 1000 iterations
+        tracker = MemoryTracker(interval=1000, warmup=100, clock=lambda: now[0])
+        try:
+            # the buffer of a real stream would count in the working set
+            with mock.patch('sys.stdout', NullStream()):
+                for _ in range(5000):
+                    cli.next()
+                    tracker.iteration()
+                    now[0] += 1
+                tracker.sample()
+            blocks = tracker.blocks_per_iteration()
+        finally:
+            tracker.stop()
+
+        self.assertIn(cli.state, ('read', 'print'))
+        self.assertLess(tracker.growth_per_iteration(), self.GROWTH_BUDGET)
+        self.assertLess(blocks, self.BLOCKS_BUDGET)
+        self.assertLess(tracker.working_set_per_iteration(), self.WORKING_SET_BUDGET)
@@ -0,0 +1,117 @@
+# Copyright (c) 2019 charlysan
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import threading
+import unittest
+from rfidhid.core import PayloadResponse, RfidHid
+from rfidhid.emulator import EmulatedHID, EmulatedTag
+from rfidhid.presence import PresenceTracker, track_presence, wait_for_tag, wait_for_departure
+
+
+def response(cid=None, uid=None):
+    if cid is None:
+        return PayloadResponse([3, 0, 0, 0, 0, 0, 0, 0, 2, 0, 1, 0, 0, 3])
+    return PayloadResponse([3, 0, 0, 0, 0, 0, 0, 0, 2, 0, 6, 0, cid,
+                            uid >> 24 & 0xff, uid >> 16 & 0xff, uid >> 8 & 0xff, uid & 0xff, 0, 3])
+
+
+class TestPresenceTracker(unittest.TestCase):
+
+    def feed(self, tracker, polls):
+        events = []
+        for timestamp, payload_response in enumerate(polls):
+            events.extend((event.kind, event.uid, event.timestamp, event.dwell)
+                          for event in tracker.update(payload_response, timestamp))
+        return events
+
+    def test_single_miss_is_not_a_departure(self):
+        tag, miss = response(1, 10), response()
+        events = self.feed(PresenceTracker(misses=2), [miss, tag, tag, miss, tag, miss, miss, miss])
+
+        self.assertEqual([('arrived', 10, 1, 0), ('departed', 10, 4, 3)], events)
+
+    def test_tag_swap(self):
+        events = self.feed(PresenceTracker(misses=3), [response(1, 10), response(1, 10), response(1, 20)])
+        self.assertEqual([('arrived', 10, 0, 0), ('departed', 10, 1, 1), ('arrived', 20, 2, 0)], events)
+
+    def test_still_present(self):
+        tag = response(1, 10)
+        events = self.feed(PresenceTracker(still_present_interval=2), [tag] * 6)
+
+        self.assertEqual([('arrived', 10, 0, 0), ('still_present', 10, 2, 2), ('still_present', 10, 4, 4)], events)
+
+    def test_reader_name(self):
+        tracker = PresenceTracker(reader='door')
+        event = tracker.update(response(1, 10), 0)[0]
+        self.assertEqual(('door', 1), (event.reader, event.cid))
+        self.assertTrue(tracker.present())
+
+    def test_absent_without_previous_tag(self):
+        tracker = PresenceTracker(misses=2)
+        self.assertEqual([], self.feed(tracker, [response(), response()]))
+        self.assertTrue(tracker.absent())
+        self.assertFalse(tracker.present())
+
+
+class PollHID(EmulatedHID):
+    r"""Emulated reader returning the given tags (None: no tag) on consecutive reads"""
+
+    def __init__(self, tags):
+        super(PollHID, self).__init__()
+        self.polls = list(tags)
+
+    def _read_response(self):
+        self.tag = self.polls.pop(0)
+        return super(PollHID, self)._read_response()
+
+
+class TestWaitHelpers(unittest.TestCase):
+
+    def test_wait_for_departure_uses_the_tracker_rule(self):
+        tag, written = EmulatedTag(1, 10), EmulatedTag(12, 345)
+        hid = PollHID([tag, None, written, None, tag, None, None, tag])
+
+        self.assertTrue(wait_for_departure(RfidHid(hid=hid), interval=0, misses=2))
+        self.assertEqual([tag], hid.polls)
+
+    def test_wait_for_tag(self):
+        tag = EmulatedTag(1, 10)
+        hid = PollHID([None, None, tag, None])
+
+        self.assertEqual(10, wait_for_tag(RfidHid(hid=hid), interval=0).get_tag_uid())
+        self.assertEqual([None], hid.polls)
+
+
+class TestTrackPresence(unittest.TestCase):
+
+    def test_events_from_polls(self):
+        hid = EmulatedHID(tag=EmulatedTag(1, 10))
+        stop = threading.Event()
+        events = []
+
+        for event in track_presence(RfidHid(hid=hid, name='door'), interval=0, stop=stop):
+            events.append(event)
+            if event.kind == 'arrived':
+                hid.remove()
+            else:
+                stop.set()
+
+        self.assertEqual([('arrived', 'door', 10), ('departed', 'door', 10)],
+                         [(event.kind, event.reader, event.uid) for event in events])
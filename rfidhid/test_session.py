@@ -0,0 +1,111 @@
+# Copyright (c) 2019 charlysan
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import threading
+import unittest
+from mock import mock
+from rfidhid.core import RfidHid
+from rfidhid.emulator import EmulatedHID, EmulatedTag
+from rfidhid.session import RfidSession, SessionClosedError
+from rfidhid.deadline import RfidTimeoutError
+
+
+class TestRfidSession(unittest.TestCase):
+
+    def setUp(self):
+        self.order = []
+        self.rfid = mock.Mock()
+        self.rfid.read_tag.side_effect = lambda **kwargs: self.order.append('read')
+        self.rfid.write_tag_from_cid_and_uid.side_effect = lambda *args, **kwargs: self.order.append('write')
+        self.rfid.beep.side_effect = lambda *args, **kwargs: self.order.append('beep')
+
+    def block(self, session):
+        r"""Keep the session thread busy until the returned event is set"""
+        release = threading.Event()
+        session.submit(0, lambda rfid: release.wait())
+        return release
+
+    def test_operations_run_by_priority(self):
+        with RfidSession(self.rfid) as session:
+            release = self.block(session)
+            session.beep()
+            session.read_tag()
+            session.write_tag_from_cid_and_uid(12, 1)
+            session.read_tag()
+            release.set()
+
+        self.assertEqual(['write', 'read', 'read', 'beep'], self.order)
+
+    def test_custom_priorities(self):
+        with RfidSession(self.rfid, priorities={'beep': 0}) as session:
+            release = self.block(session)
+            session.read_tag()
+            session.beep()
+            release.set()
+
+        self.assertEqual(['beep', 'read'], self.order)
+
+    def test_exception_is_raised_by_result(self):
+        self.rfid.read_tag.side_effect = ValueError('Communication Error.')
+        with RfidSession(self.rfid) as session:
+            future = session.read_tag()
+            self.assertRaises(ValueError, future.result, 1)
+            self.assertIsInstance(future.exception(), ValueError)
+
+    def test_result_timeout(self):
+        with RfidSession(self.rfid) as session:
+            release = self.block(session)
+            self.assertRaises(RfidTimeoutError, session.read_tag().result, 0.01)
+            release.set()
+
+    def test_close_cancels_pending_operations(self):
+        session = RfidSession(self.rfid)
+        release = self.block(session)
+        future = session.read_tag()
+        threading.Timer(0.05, release.set).start()
+        session.close(cancel_pending=True)
+
+        self.assertTrue(future.cancelled())
+        self.assertRaises(SessionClosedError, future.result)
+        self.assertRaises(SessionClosedError, session.read_tag)
+        self.assertEqual([], self.order)
+
+    def test_concurrent_producers(self):
+        rfid = RfidHid(hid=EmulatedHID(EmulatedTag(77, 1234567890), latency=0.001))
+        results = []
+
+        with RfidSession(rfid) as session:
+            def produce():
+                futures = [session.read_tag() for _ in range(5)]
+                results.extend(future.result().get_tag_uid() for future in futures)
+                results.append(session.write_tag_and_verify(12, 1000, verify_delay=0).result())
+
+            threads = [threading.Thread(target=produce) for _ in range(8)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+        self.assertEqual(48, len(results))
+        self.assertTrue(all(result in (1234567890, 1000, True) for result in results))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,134 @@
+# Copyright (c) 2019 charlysan
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import os
+import shutil
+import sqlite3
+import tempfile
+import time
+import unittest
+from rfidhid.core import RfidHid
+from rfidhid.emulator import EmulatedHID, EmulatedTag
+from rfidhid.sink import SqliteSink, EventLog, TagEvent, EVENT_READ, EVENT_WRITE
+
+DAY = 24 * 3600
+
+
+class TestSqliteSink(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp, 'events.db')
+        # noon (local time) of an arbitrary day
+        self.noon = time.mktime((2019, 6, 3, 12, 0, 0, 0, 0, -1))
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def test_events_are_stored_in_batches(self):
+        with SqliteSink(self.path, batch_size=7) as sink:
+            for i in range(100):
+                sink.record(TagEvent(self.noon + i, EVENT_READ, 12, i % 10, None, 'door'))
+            sink.flush()
+            self.assertEqual(100, sink.written)
+
+            with EventLog(self.path) as log:
+                events = log.events(uid=3)
+                self.assertEqual(10, len(events))
+                self.assertEqual(TagEvent(self.noon + 3, EVENT_READ, 12, 3, None, 'door'), events[0])
+
+    def test_events_are_dropped_when_queue_is_full(self):
+        sink = SqliteSink(self.path, max_pending=1)
+        sink._queue.put(None)  # stop the writer, keeping the queue full
+        sink.record(TagEvent(self.noon, EVENT_READ, 12, 1, None, None))
+        sink._thread.join()
+        self.assertEqual(1, sink.dropped)
+
+    def test_write_error_does_not_stop_the_sink(self):
+        class FlakySink(SqliteSink):
+            def _write(self, batch):
+                if not self.errors:
+                    raise sqlite3.OperationalError('database is locked')
+                super(FlakySink, self)._write(batch)
+
+        with FlakySink(self.path) as sink:
+            sink.record(TagEvent(self.noon, EVENT_READ, 12, 1, None, None))
+            self.assertTrue(sink.flush(timeout=5))
+            for i in range(3):
+                sink.record(TagEvent(self.noon + i, EVENT_READ, 12, 2, None, None))
+            self.assertTrue(sink.flush(timeout=5))
+
+            self.assertEqual(1, sink.errors)
+            self.assertIsInstance(sink.last_error, sqlite3.OperationalError)
+            self.assertEqual(3, sink.written)
+            with EventLog(self.path) as log:
+                self.assertEqual([2, 2, 2], [event.uid for event in log.events()])
+
+    def test_flush_returns_when_the_writer_has_stopped(self):
+        sink = SqliteSink(self.path, max_pending=2)
+        sink._queue.put(None)
+        sink._thread.join()
+        sink.record(TagEvent(self.noon, EVENT_READ, 12, 1, None, None))
+        self.assertFalse(sink.flush())
+
+    def test_open_error_is_raised(self):
+        class BrokenSink(SqliteSink):
+            def _open(self):
+                raise sqlite3.OperationalError('unable to open database file')
+
+        sink = BrokenSink(self.path)
+        sink._thread.join()
+        self.assertIsInstance(sink.error, sqlite3.OperationalError)
+        self.assertRaises(sqlite3.OperationalError, sink.record, TagEvent(self.noon, EVENT_READ, 12, 1, None, None))
+        self.assertRaises(sqlite3.OperationalError, sink.flush)
+        self.assertRaises(sqlite3.OperationalError, sink.close)
+
+    def test_first_last_seen_per_day(self):
+        with SqliteSink(self.path) as sink:
+            for timestamp, uid in ((self.noon, 1), (self.noon + 60, 2), (self.noon + 3600, 1),
+                                   (self.noon + DAY, 1)):
+                sink.record(TagEvent(timestamp, EVENT_READ, 12, uid, None, None))
+            sink.record(TagEvent(self.noon + 10, EVENT_WRITE, 12, 1, 2, None))
+
+        with EventLog(self.path) as log:
+            rows = log.first_last_seen(uid=1)
+            self.assertEqual(2, len(rows))
+            self.assertEqual(('2019-06-03', 12, 1, self.noon, self.noon + 3600, 2), tuple(rows[0]))
+            self.assertEqual(('2019-06-04', 12, 1, self.noon + DAY, self.noon + DAY, 1), tuple(rows[1]))
+
+            rows = log.first_last_seen(start=self.noon + 30, end=self.noon + DAY)
+            self.assertEqual([(1, 1), (2, 1)], [(row.uid, row.reads) for row in rows])
+
+            summary = log.summary()
+            self.assertEqual([(1, 3, 1), (2, 1, 0)], [(row.uid, row.reads, row.writes) for row in summary])
+
+    def test_rfid_hid_records_reads_and_writes(self):
+        with SqliteSink(self.path) as sink:
+            rfid = RfidHid(hid=EmulatedHID(EmulatedTag(77, 1234567890)), sink=sink, name='door')
+            self.assertTrue(rfid.write_tag_and_verify(12, 1000, verify_delay=0))
+
+        with EventLog(self.path) as log:
+            events = log.events()
+            self.assertEqual([(EVENT_WRITE, 12, 1000, RfidHid.TAG_EM4305, 'door'), (EVENT_READ, 12, 1000, None, 'door')],
+                             [(e.kind, e.cid, e.uid, e.tag_type, e.reader) for e in events])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,94 @@
+# Copyright (c) 2019 charlysan
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import random
+import unittest
+from mock import mock
+from cli.rfid_cli import RfidCli
+from rfidhid.core import RfidHid
+from rfidhid.emulator import EmulatedHID, EmulatedTag
+from rfidhid.stats import LatencyHistogram, Profiler, percentile
+
+
+class TestPercentile(unittest.TestCase):
+
+    def test_nearest_rank(self):
+        values = [5, 1, 4, 2, 3]
+        self.assertEqual(1, percentile(values, 0))
+        self.assertEqual(3, percentile(values, 50))
+        self.assertEqual(5, percentile(values, 99))
+        self.assertEqual(None, percentile([], 50))
+
+
+class TestLatencyHistogram(unittest.TestCase):
+
+    def test_percentiles_are_within_bucket_resolution(self):
+        rng = random.Random(1)
+        values = [rng.expovariate(1 / 0.004) for _ in range(5000)]
+        histogram = LatencyHistogram()
+        for value in values:
+            histogram.add(value)
+
+        for p in (50, 95, 99):
+            exact = percentile(values, p)
+            self.assertTrue(abs(histogram.percentile(p) - exact) <= exact * 0.05)
+        self.assertEqual(max(values), histogram.percentile(100))
+        self.assertAlmostEqual(sum(values) / len(values), histogram.mean())
+
+    def test_merge(self):
+        first = LatencyHistogram()
+        second = LatencyHistogram()
+        first.add(0.001)
+        second.add(0.5)
+        second.add(0)
+        first.merge(second)
+
+        summary = first.summary()
+        self.assertEqual(3, summary['count'])
+        self.assertEqual(0, summary['min'])
+        self.assertEqual(0.5, summary['max'])
+        self.assertEqual(None, LatencyHistogram().percentile(50))
+
+
+class TestProfiler(unittest.TestCase):
+
+    def test_wrapped_calls_are_timed_even_if_they_raise(self):
+        clock = mock.Mock(side_effect=[0, 1.5, 2, 2.25])
+        profiler = Profiler(clock=clock)
+
+        def fail():
+            raise ValueError()
+
+        self.assertEqual(4, profiler.wrap('read', lambda x: x * 2)(2))
+        self.assertRaises(ValueError, profiler.wrap('read', fail))
+
+        self.assertEqual(2, profiler.count('read'))
+        self.assertEqual(1.75, profiler.total('read'))
+        self.assertEqual(0.0, profiler.total('write'))
+
+    def test_cli_profiles_the_writer_in_pipeline_mode(self):
+        rfid, writer = RfidHid(hid=EmulatedHID()), RfidHid(hid=EmulatedHID(tag=EmulatedTag(0, 1)))
+        cli = RfidCli(['-c', '--pipeline', '--profile'], rfid=rfid, writer=writer)
+
+        writer.read_tag()
+        rfid.read_tag()
+
+        self.assertEqual(2, cli.profiler.count('usb:writer'))
+        self.assertEqual(2, cli.profiler.count('usb'))
@@ -0,0 +1,69 @@
+# Copyright (c) 2019 charlysan
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import unittest
+from rfidhid.core import RfidHid
+from rfidhid.emulator import EmulatedHID, EmulatedTag
+from rfidhid.tagtype import TagTypeDetector, write_tag_and_verify_auto, SOURCE_TAG, SOURCE_LOT, SOURCE_DEFAULT
+
+
+class TestTagTypeDetector(unittest.TestCase):
+
+    def test_guess_by_tag_then_lot_then_default(self):
+        detector = TagTypeDetector(lot_shift=8)
+        detector.record(RfidHid.TAG_T5577, (12, 0x1234))
+
+        self.assertEqual((RfidHid.TAG_T5577, SOURCE_TAG), detector.guess((12, 0x1234)))
+        self.assertEqual((RfidHid.TAG_T5577, SOURCE_LOT), detector.guess((12, 0x12ff)))
+        # the last type that worked becomes the default
+        self.assertEqual((RfidHid.TAG_T5577, SOURCE_DEFAULT), detector.guess((12, 0x1334)))
+        self.assertEqual((RfidHid.TAG_T5577, SOURCE_DEFAULT), detector.guess(None))
+
+
+class TestWriteTagAndVerifyAuto(unittest.TestCase):
+
+    def setUp(self):
+        self.hid = EmulatedHID()
+        self.rfid = RfidHid(hid=self.hid)
+        self.detector = TagTypeDetector()
+
+    def write(self, tag):
+        self.hid.place(tag)
+        return write_tag_and_verify_auto(self.rfid, 12, 1000, self.detector, tag=(tag.cid, tag.uid),
+                                         verify_delay=0)
+
+    def test_retry_with_the_other_type(self):
+        self.assertEqual(RfidHid.TAG_T5577, self.write(EmulatedTag(77, 0x10000, RfidHid.TAG_T5577)))
+        # same lot: right at first try
+        self.assertEqual(RfidHid.TAG_T5577, self.write(EmulatedTag(77, 0x10001, RfidHid.TAG_T5577)))
+        self.assertEqual(RfidHid.TAG_EM4305, self.write(EmulatedTag(78, 0x20000, RfidHid.TAG_EM4305)))
+
+        stats = self.detector.stats()
+        self.assertEqual((1, 2, 0), (stats['first_try'], stats['retried'], stats['failed']))
+        self.assertEqual((0, 1, 2), (stats[SOURCE_TAG], stats[SOURCE_LOT], stats[SOURCE_DEFAULT]))
+        self.assertAlmostEqual(1 / 3.0, stats['hit_rate'])
+
+    def test_failed_with_both_types(self):
+        self.assertEqual(None, self.write(EmulatedTag(77, 1, tag_type=0x7f)))
+        self.assertEqual(1, self.detector.stats()['failed'])
+
+
+if __name__ == '__main__':
+    unittest.main()
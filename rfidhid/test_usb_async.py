@@ -0,0 +1,76 @@
+# Copyright (c) 2019 charlysan
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import unittest
+import usb.core
+from rfidhid.compat import monotonic
+from rfidhid.core import RfidHid
+from rfidhid.emulator import EmulatedHID, EmulatedTag, EmulatedUsbContext, FaultInjector
+from rfidhid.usb_async import AsyncHID, UsbEventLoop, read_tags
+from rfidhid.usb_hid import TransferTimeoutError
+
+
+class TestAsyncHID(unittest.TestCase):
+
+    def setUp(self):
+        self.context = EmulatedUsbContext()
+        self.loop = UsbEventLoop(self.context, interval=0.01)
+
+    def tearDown(self):
+        self.loop.close()
+
+    def open(self, hid, timeout=None):
+        return RfidHid(hid=AsyncHID(self.context.open(hid), self.loop, timeout=timeout))
+
+    def test_blocking_interface(self):
+        rfid = self.open(EmulatedHID(tag=EmulatedTag(77, 1234567890)))
+
+        self.assertEqual([0x06, 0x00, 0xff], rfid.init()[:3].tolist())
+        payload_response = rfid.read_tag()
+        self.assertEqual(77, payload_response.get_tag_cid())
+        self.assertEqual(1234567890, payload_response.get_tag_uid())
+
+    def test_write_and_verify(self):
+        hid = EmulatedHID(tag=EmulatedTag(0, 0))
+        self.assertTrue(self.open(hid).write_tag_and_verify(12, 3456, verify_delay=0))
+        self.assertEqual((12, 3456), (hid.tag.cid, hid.tag.uid))
+
+    def test_read_tags_in_flight_together(self):
+        hids = [EmulatedHID(tag=EmulatedTag(index, 1000 + index), latency=0.05) for index in range(8)]
+        rfids = [self.open(hid) for hid in hids]
+
+        start = monotonic()
+        results = read_tags(rfids)
+        elapsed = monotonic() - start
+
+        self.assertEqual([1000 + index for index in range(8)], [result.get_tag_uid() for result in results])
+        # two transfers per read: 0.1s if concurrent, 0.8s if sequential
+        self.assertLess(elapsed, 0.4)
+
+    def test_transfer_timeout(self):
+        rfid = self.open(EmulatedHID(latency=0.2), timeout=20)
+        self.assertRaises(TransferTimeoutError, rfid.read_tag)
+
+    def test_read_tags_reports_errors_per_reader(self):
+        failing = EmulatedHID(tag=EmulatedTag(1, 2), faults=FaultInjector(usb_error_rate=1))
+        results = read_tags([self.open(EmulatedHID(tag=EmulatedTag(1, 1))), self.open(failing)])
+
+        self.assertEqual(1, results[0].get_tag_uid())
+        self.assertIsInstance(results[1], usb.core.USBError)
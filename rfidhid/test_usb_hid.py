@@ -0,0 +1,61 @@
+# Copyright (c) 2019 charlysan
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import unittest
+from mock import mock
+from rfidhid.usb_hid import HID
+
+
+class TestHID(unittest.TestCase):
+
+    def test_parse_port_path(self):
+        self.assertEqual((1, (1, 2)), HID.parse_port_path('1-1.2'))
+        self.assertEqual((3, (4,)), HID.parse_port_path('3-4'))
+        self.assertRaises(ValueError, HID.parse_port_path, '1.2')
+
+    @mock.patch('usb.core.find')
+    def test_open_by_port_path(self, find):
+        HID(0xffff, 0x0035, port_path='1-1.2')
+        find.assert_called_once_with(custom_match=None, idVendor=0xffff, idProduct=0x0035, bus=1,
+                                     port_numbers=(1, 2))
+
+    @mock.patch('usb.core.find')
+    def test_open_by_serial(self, find):
+        HID(0xffff, 0x0035, serial='A1')
+        match = find.call_args[1]['custom_match']
+        self.assertTrue(match(mock.Mock(serial_number='A1')))
+        self.assertFalse(match(mock.Mock(serial_number='B2')))
+
+    @mock.patch('usb.core.find', return_value=None)
+    def test_device_not_found(self, find):
+        self.assertRaises(ValueError, HID, 0xffff, 0x0035, port_path='1-1.2')
+
+    def test_report_descriptor_is_cached(self):
+        dev = mock.Mock()
+        dev.ctrl_transfer.return_value = [0x06, 0xa0, 0xff]
+        hid = HID(0xffff, 0x0035, dev=dev)
+
+        self.assertEqual([0x06, 0xa0, 0xff], hid.get_report_descriptor(28))
+        self.assertEqual([0x06, 0xa0, 0xff], hid.get_report_descriptor(28))
+        self.assertEqual(1, dev.ctrl_transfer.call_count)
+
+
+if __name__ == '__main__':
+    unittest.main()
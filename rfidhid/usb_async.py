@@ -0,0 +1,297 @@
+# Copyright (c) 2019 charlysan
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+r"""Asynchronous USB transport built on libusb's asynchronous transfer API (python-libusb1)
+
+`usb_hid.HID` issues blocking control transfers through pyusb: polling N readers takes either N
+round trips in a row or N threads. `AsyncHID` submits the transfers and returns right away; a
+single `UsbEventLoop` thread handles the completion of the transfers of every device, so the
+transfers to all the readers are in flight at the same time.
+
+`AsyncHID` keeps the blocking interface of `usb_hid.HID` (same feature report semantics, timeouts
+in milliseconds, TransferTimeoutError) so it can be handed to `RfidHid(hid=...)`, and adds the
+`submit_*` methods returning a `Future`.
+
+E.g.
+    loop = UsbEventLoop()
+    rfids = [RfidHid(hid=hid) for hid in AsyncHID.find_all(0xffff, 0x0035, loop)]
+    payload_responses = read_tags(rfids)
+
+python-libusb1 (`pip install libusb1`) is optional: it is only needed to open real devices.
+"""
+
+import errno
+import threading
+from array import array
+
+import usb.core
+import usb.util
+
+from .core import PayloadResponse
+from .session import Future
+from .sink import EVENT_READ, tag_event
+from .usb_hid import HID, TransferTimeoutError
+
+try:
+    import usb1
+except ImportError:
+    usb1 = None
+
+# libusb_transfer_status
+TRANSFER_COMPLETED = 0
+TRANSFER_ERROR = 1
+TRANSFER_TIMED_OUT = 2
+TRANSFER_CANCELLED = 3
+TRANSFER_STALL = 4
+TRANSFER_NO_DEVICE = 5
+TRANSFER_OVERFLOW = 6
+
+# pyusb default control transfer timeout (milliseconds)
+DEFAULT_TIMEOUT = 1000
+
+
+def _require_usb1():
+    if usb1 is None:
+        raise ImportError('The asynchronous USB backend requires python-libusb1 (pip install libusb1)')
+
+
+class UsbEventLoop(object):
+    r"""Thread handling the completion of every transfer submitted on a libusb context"""
+
+    def __init__(self, context=None, interval=0.1):
+        r"""Arguments:
+        context -- usb1.USBContext (or compatible, e.g. emulator.EmulatedUsbContext). A new one is
+                   created if not supplied
+        interval -- Seconds between checks of the stop flag while no transfer completes
+        """
+        if context is None:
+            _require_usb1()
+            context = usb1.USBContext()
+        self.context = context
+        self.interval = interval
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='usb-event-loop')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def close(self):
+        r"""Stop the event handling thread. Transfers still in flight are not completed"""
+        self._stopped.set()
+        if self._thread is not threading.current_thread():
+            self._thread.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def _run(self):
+        while not self._stopped.is_set():
+            self.context.handleEventsTimeout(self.interval)
+
+
+class AsyncHID(object):
+    r"""HID feature report transport submitting asynchronous control transfers"""
+
+    def __init__(self, handle, loop, timeout=None):
+        r"""Arguments:
+        handle -- Opened usb1.USBDeviceHandle (or compatible, e.g. emulator.EmulatedDeviceHandle)
+        loop -- UsbEventLoop of the context the device has been opened with
+        timeout -- Default control transfer timeout in milliseconds (None: pyusb default, 1000)
+        """
+        self.handle = handle
+        self.loop = loop
+        self.timeout = timeout
+        self._report_descriptors = {}
+        # transfers must stay referenced until they complete
+        self._in_flight = set()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def find_all(cls, vendor_id, product_id, loop, timeout=None):
+        r"""Open every attached device matching vid and pid on the context of `loop`"""
+        _require_usb1()
+        return [cls(device.open(), loop, timeout=timeout)
+                for device in loop.context.getDeviceIterator(skip_on_error=True)
+                if device.getVendorID() == vendor_id and device.getProductID() == product_id]
+
+    def close(self):
+        self.handle.close()
+
+    def get_report_descriptor(self, length=0xff, timeout=None):
+        r"""Get the HID report descriptor. It is fetched from the device only once"""
+        if length in self._report_descriptors:
+            return self._report_descriptors[length]
+
+        desc = self.submit_control(HID.REQUEST_DEVICE_TO_HOST_STANDARD_DEVICE, HID.GET_DESCRIPTOR,
+                                   HID.CLASS_DESCRIPTOR_TYPE_REPORT << 8, 0, length, timeout).result()
+        if desc:
+            self._report_descriptors[length] = desc
+        return desc
+
+    def set_feature_report(self, report_number, data, timeout=None):
+        return self.submit_set_feature_report(report_number, data, timeout).result()
+
+    def get_feature_report(self, report_number, report_length, timeout=None):
+        return self.submit_get_feature_report(report_number, report_length, timeout).result()
+
+    def submit_set_feature_report(self, report_number, data, timeout=None):
+        r"""Submit a SET_REPORT. The Future result is the number of bytes written"""
+        return self.submit_control(HID.REQUEST_HOST_TO_DEVICE_CLASS_INTERFACE, HID.SET_REPORT,
+                                   HID.REPORT_TYPE_FEATURE << 8 | report_number, HID.DEVICE_HID_INTERFACE_0,
+                                   data, timeout)
+
+    def submit_get_feature_report(self, report_number, report_length, timeout=None):
+        r"""Submit a GET_REPORT. The Future result is the report (array('B'))"""
+        return self.submit_control(HID.REQUEST_DEVICE_TO_HOST_CLASS_INTERFACE, HID.GET_REPORT,
+                                   HID.REPORT_TYPE_FEATURE << 8 | report_number, HID.DEVICE_HID_INTERFACE_0,
+                                   report_length, timeout)
+
+    def submit_transaction(self, set_report_number, data, get_report_number, report_length, timeout=None):
+        r"""Submit a SET_REPORT and, once it has completed, the GET_REPORT reading its response
+
+        The GET_REPORT is submitted from the event loop thread, so no thread waits in between.
+        The Future result is the report read, or the number of bytes written if the SET_REPORT
+        was short (as the device has not taken the command).
+        """
+        future = Future()
+
+        def on_set_report(set_future):
+            exception = set_future.exception()
+            if exception is not None:
+                future.set_exception(exception)
+            elif set_future.result() != len(data):
+                future.set_result(set_future.result())
+            else:
+                self._chain(self.submit_get_feature_report(get_report_number, report_length, timeout), future)
+
+        self.submit_set_feature_report(set_report_number, data, timeout).add_done_callback(on_set_report)
+        return future
+
+    def submit_control(self, request_type, request, value, index, data_or_length, timeout=None):
+        r"""Submit a control transfer and return its Future
+
+        `data_or_length` is the data to send (host to device) or the number of bytes to read.
+        """
+        future = Future()
+        transfer = self.handle.getTransfer()
+        device_to_host = request_type & usb.util.CTRL_IN
+        buffer_or_len = data_or_length if device_to_host else bytes(bytearray(data_or_length))
+
+        transfer.setControl(request_type, request, value, index, buffer_or_len,
+                            callback=self._on_transfer, user_data=(future, device_to_host),
+                            timeout=self._timeout_ms(timeout))
+        with self._lock:
+            self._in_flight.add(transfer)
+        try:
+            transfer.submit()
+        except Exception:
+            with self._lock:
+                self._in_flight.discard(transfer)
+            raise
+        return future
+
+    def _on_transfer(self, transfer):
+        r"""Completion callback, called on the event loop thread"""
+        with self._lock:
+            self._in_flight.discard(transfer)
+        future, device_to_host = transfer.getUserData()
+        status = transfer.getStatus()
+
+        if status == TRANSFER_COMPLETED:
+            length = transfer.getActualLength()
+            future.set_result(array('B', bytearray(transfer.getBuffer()[:length])) if device_to_host else length)
+        elif status == TRANSFER_TIMED_OUT:
+            future.set_exception(TransferTimeoutError('Operation timed out', None, errno.ETIMEDOUT))
+        elif status == TRANSFER_STALL:
+            future.set_exception(usb.core.USBError('Pipe error', None, errno.EPIPE))
+        elif status == TRANSFER_NO_DEVICE:
+            future.set_exception(usb.core.USBError('No such device (it may have been disconnected)', None,
+                                                   errno.ENODEV))
+        elif status == TRANSFER_CANCELLED:
+            future.set_exception(usb.core.USBError('Transfer cancelled', None, errno.EINTR))
+        else:
+            future.set_exception(usb.core.USBError('Input/Output Error', None, errno.EIO))
+
+    def _timeout_ms(self, timeout):
+        if timeout is not None:
+            return timeout
+        return self.timeout if self.timeout is not None else DEFAULT_TIMEOUT
+
+    @staticmethod
+    def _chain(source, target):
+        def copy(future):
+            exception = future.exception()
+            if exception is not None:
+                target.set_exception(exception)
+            else:
+                target.set_result(future.result())
+
+        source.add_done_callback(copy)
+
+
+def read_tag_async(rfid, timeout=None):
+    r"""Submit a "read a tag" command to a RfidHid whose transport is an AsyncHID, without waiting
+
+    The event is recorded to the RfidHid sink, like RfidHid.read_tag() does.
+
+    Arguments:
+    timeout -- Timeout in seconds for each USB transfer (defaults to the one set for the device)
+
+    Returns a Future of the PayloadResponse
+    """
+    future = Future()
+    buff = rfid._initialize_write_buffer([rfid.CMD_READ_TAG, 0x00, 0x00])
+
+    def on_response(transaction):
+        exception = transaction.exception()
+        if exception is not None:
+            future.set_exception(exception)
+            return
+
+        response = transaction.result()
+        if not isinstance(response, array):
+            future.set_exception(ValueError('Communication Error.'))
+            return
+
+        payload_response = PayloadResponse(response.tolist())
+        if rfid.sink is not None and payload_response.has_id_data():
+            rfid.sink.record(tag_event(EVENT_READ, payload_response.get_tag_cid(), payload_response.get_tag_uid(),
+                                       reader=rfid.name))
+        future.set_result(payload_response)
+
+    rfid.hid.submit_transaction(1, buff, 2, rfid.BUFFER_SIZE,
+                                rfid._timeout_ms(timeout, None)).add_done_callback(on_response)
+    return future
+
+
+def read_tags(rfids, timeout=None):
+    r"""Read every reader at the same time
+
+    Returns a list with, for every reader, its PayloadResponse or the exception raised by the read.
+    """
+    futures = [read_tag_async(rfid, timeout) for rfid in rfids]
+    results = []
+    for future in futures:
+        exception = future.exception()
+        results.append(exception if exception is not None else future.result())
+
+    return results
@@ -18,60 +18,157 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
 
+import errno
+
 import usb.core
 import usb.control
 
+from .deadline import RfidTimeoutError
+
+
+class TransferTimeoutError(RfidTimeoutError, usb.core.USBTimeoutError):
+    r"""Raised when a control transfer does not complete within its timeout"""
+
+
+def device_gone(e):
+    r"""Check if an exception means the device has been unplugged (retrying is pointless)"""
+    return isinstance(e, usb.core.USBError) and e.errno == errno.ENODEV
+
+
 class HID(object):
     REPORT_TYPE_FEATURE = 0x03
     REQUEST_HOST_TO_DEVICE_CLASS_INTERFACE = 0x21
     REQUEST_DEVICE_TO_HOST_CLASS_INTERFACE = 0xa1
+    REQUEST_DEVICE_TO_HOST_STANDARD_DEVICE = 0x80
     SET_REPORT = 0x09
     GET_REPORT = 0x01
+    GET_DESCRIPTOR = 0x06
     DEVICE_HID_INTERFACE_0 = 0
     CLASS_DESCRIPTOR_TYPE_REPORT = 0x22
 
-    def __init__(self, vendor_id, product_id):
-        r"""Open the device using vid and pid"""
-        self.dev = usb.core.find(idVendor=vendor_id, idProduct=product_id)
+    def __init__(self, vendor_id, product_id, dev=None, timeout=None, port_path=None, serial=None):
+        r"""Open the device using vid and pid
+
+        If `dev` (an already found pyusb device) is supplied then no bus scan is performed.
+        `timeout` is the default control transfer timeout in milliseconds (None: pyusb default).
+        `port_path` ('BUS-PORT[.PORT...]', e.g. '1-1.2' as in /sys/bus/usb/devices) and `serial` (serial number)
+        select the device when several ones share the same vid and pid. Only the devices matching the vid, pid
+        and port path are opened to get their serial number.
+        """
+        if dev is None:
+            dev = usb.core.find(custom_match=self._serial_matcher(serial),
+                                **self._find_filter(vendor_id, product_id, port_path))
+        self.dev = dev
+        self.timeout = timeout
+        self._report_descriptors = {}
 
         if self.dev is None:
-            raise ValueError("Device with id %d:%d not found." % (vendor_id, product_id))
+            raise ValueError("Device with id %d:%d%s%s not found." % (
+                vendor_id, product_id, ' at %s' % port_path if port_path else '',
+                ' and serial number %s' % serial if serial else ''))
+
+    @classmethod
+    def find_all(cls, vendor_id, product_id, timeout=None):
+        r"""Open every attached device matching vid and pid"""
+        devs = usb.core.find(find_all=True, idVendor=vendor_id, idProduct=product_id)
+
+        return [cls(vendor_id, product_id, dev=dev, timeout=timeout) for dev in devs]
+
+    @staticmethod
+    def parse_port_path(port_path):
+        r"""'BUS-PORT[.PORT...]' to (bus, port_numbers), e.g. '1-1.2' -> (1, (1, 2))"""
+        try:
+            bus, ports = port_path.split('-', 1)
+            return int(bus), tuple(int(port) for port in ports.split('.'))
+        except ValueError:
+            raise ValueError("Invalid USB port path '%s'. Expected BUS-PORT[.PORT...] (e.g. 1-1.2)" % port_path)
 
+    @classmethod
+    def _find_filter(cls, vendor_id, product_id, port_path):
+        r"""Keyword arguments of usb.core.find matching vid, pid and port path"""
+        attributes = {'idVendor': vendor_id, 'idProduct': product_id}
+        if port_path:
+            attributes['bus'], attributes['port_numbers'] = cls.parse_port_path(port_path)
+        return attributes
+
+    @staticmethod
+    def _serial_matcher(serial):
+        if not serial:
+            return None
+
+        def match(dev):
+            try:
+                return dev.serial_number == serial
+            except (usb.core.USBError, ValueError):
+                # no permission to open the device, or no serial number
+                return False
+
+        return match
+
+    def get_report_descriptor(self, length=0xff, timeout=None):
+        r"""Get the HID report descriptor. It is fetched from the device only once"""
+        if length in self._report_descriptors:
+            return self._report_descriptors[length]
 
-    def get_report_descriptor(self, length=0xff):
         try: 
-            return usb.control.get_descriptor(self.dev, length, self.CLASS_DESCRIPTOR_TYPE_REPORT, 0)
+            desc = self._ctrl_transfer(
+                bmRequestType=self.REQUEST_DEVICE_TO_HOST_STANDARD_DEVICE,
+                bRequest=self.GET_DESCRIPTOR,
+                wValue=self.CLASS_DESCRIPTOR_TYPE_REPORT << 8,
+                wIndex=0,
+                data_or_wLength=length,
+                timeout=timeout
+            )
+        except TransferTimeoutError:
+            raise
         except (usb.core.USBError, usb.core.USBTimeoutError):
             print("Cannot get USB report descriptor. Maybe incompatible device?\n")
             raise
 
+        if desc:
+            self._report_descriptors[length] = desc
+        return desc
 
-    def set_feature_report(self, report_number, data):
+
+    def set_feature_report(self, report_number, data, timeout=None):
         
         try:
-            return self.dev.ctrl_transfer(
+            return self._ctrl_transfer(
                 bmRequestType=self.REQUEST_HOST_TO_DEVICE_CLASS_INTERFACE, 
                 bRequest=self.SET_REPORT, 
                 wValue=self.REPORT_TYPE_FEATURE << 8 | report_number, 
                 wIndex=self.DEVICE_HID_INTERFACE_0, 
-                data_or_wLength=data
+                data_or_wLength=data,
+                timeout=timeout
             )
+        except TransferTimeoutError:
+            raise
         except (usb.core.USBError, usb.core.USBTimeoutError):
             print("Cannot write USB feature report. Maybe incompatible device?\n")
             raise 
         
 
-    def get_feature_report(self, report_number, report_length):
+    def get_feature_report(self, report_number, report_length, timeout=None):
 
         try:
-            return self.dev.ctrl_transfer(
+            return self._ctrl_transfer(
                 bmRequestType=self.REQUEST_DEVICE_TO_HOST_CLASS_INTERFACE, 
                 bRequest=self.GET_REPORT, 
                 wValue=self.REPORT_TYPE_FEATURE << 8 | report_number, 
                 wIndex=self.DEVICE_HID_INTERFACE_0, 
-                data_or_wLength=report_length
+                data_or_wLength=report_length,
+                timeout=timeout
             )
+        except TransferTimeoutError:
+            raise
         except (usb.core.USBError, usb.core.USBTimeoutError):
             print("Cannot get USB feature report. Maybe incompatible device?\n")
             raise 
 
+
+    def _ctrl_transfer(self, timeout=None, **kwargs):
+        r"""Issue a control transfer. `timeout` (milliseconds) defaults to the one set for the device"""
+        try:
+            return self.dev.ctrl_transfer(timeout=timeout if timeout is not None else self.timeout, **kwargs)
+        except usb.core.USBTimeoutError as e:
+            raise TransferTimeoutError(e.strerror, e.backend_error_code, e.errno)
@@ -6,11 +6,13 @@ setup(name='pyrfidhid',
       url='https://github.com/charlysan/pyrfidhid/',
       entry_points={
         'console_scripts': [
-            'rfid_cli = cli.rfid_cli:main'
+            'rfid_cli = cli.rfid_cli:main',
+            'rfid_db = cli.rfid_db:main'
         ]
       },
       author='charlysan',
       author_email='chrlysn0@gmail.com',
       license='MIT',
       packages=find_packages(),
-      install_requires=['pyusb ~= 1.0', 'argparse ~= 1.4.0', 'transitions ~= 0.6.9', 'mock ~= 2.0'])
+      install_requires=['pyusb ~= 1.0', 'argparse ~= 1.4.0', 'transitions ~= 0.6.9', 'mock ~= 2.0'],
+      extras_require={'async': ['libusb1']})